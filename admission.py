@@ -0,0 +1,133 @@
+# admission.py 定时阅读任务的准入控制：全局并发上限、按启动时间排序的等待队列与启动抖动
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from config import SCHEDULER_CONFIG
+from metrics import ADMISSION_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionController:
+    """调度器触发的任务先进入等待队列，由分发线程在并发上限内依次启动
+
+    每个任务入队时获得0~max_jitter秒的随机启动时间，队列按启动时间排序（小顶堆），
+    每个任务到点即可启动，不必等排在前面的任务，整点集中触发的任务因此均匀分布在抖动窗口内。
+    并发名额用满时，已到启动时间的任务按启动时间先后依次等待名额。
+    runner返回Future时，任务占用的名额在Future完成后才释放。
+    """
+
+    def __init__(self, max_concurrent=None, max_jitter=None, queue_size=None, start_workers=None):
+        self.max_concurrent = max_concurrent or SCHEDULER_CONFIG['MAX_CONCURRENT_RUNS']
+        self.max_jitter = max_jitter if max_jitter is not None else SCHEDULER_CONFIG['START_JITTER_SECONDS']
+        self.queue_size = queue_size or SCHEDULER_CONFIG['QUEUE_SIZE']
+        self._executor = ThreadPoolExecutor(
+            max_workers=start_workers or SCHEDULER_CONFIG['START_WORKERS'],
+            thread_name_prefix='admission'
+        )
+        self._runner = None
+        self._queue = []  # 小顶堆：(启动时间, 序号, key, 入队时间)
+        self._seq = itertools.count()
+        self._keys = set()  # 排队或运行中的任务，相同key不重复入队
+        self._running = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {
+            'admitted': 0,
+            'started': 0,
+            'completed': 0,
+            'rejected': 0,
+            'duplicates': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    def set_runner(self, runner):
+        """设置真正执行任务的函数，runner(key)可以返回Future"""
+        self._runner = runner
+
+    def start(self):
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._dispatch, name='admission-dispatcher', daemon=True)
+            self._thread.start()
+
+    def admit(self, key):
+        """将任务加入等待队列，立即返回是否入队成功"""
+        self.start()
+        with self._cond:
+            if key in self._keys:
+                self.stats['duplicates'] += 1
+                logger.info(f"Run for {key} is already queued or running, skipping")
+                return False
+            if len(self._queue) >= self.queue_size:
+                self.stats['rejected'] += 1
+                logger.error(f"Admission queue full ({self.queue_size}), rejected run for {key}")
+                return False
+            now = time.monotonic()
+            heapq.heappush(self._queue, (now + random.uniform(0, self.max_jitter), next(self._seq), key, now))
+            self._keys.add(key)
+            self.stats['admitted'] += 1
+            self._cond.notify()
+            return True
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._queue and self._running < self.max_concurrent:
+                        delay = self._queue[0][0] - time.monotonic()
+                        if delay <= 0:
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+                _, _, key, enqueued_at = heapq.heappop(self._queue)
+                self._running += 1
+                waited = time.monotonic() - enqueued_at
+                self.stats['started'] += 1
+                self.stats['wait_seconds_total'] += waited
+                self.stats['wait_seconds_max'] = max(self.stats['wait_seconds_max'], waited)
+            ADMISSION_WAIT_SECONDS.observe(waited)
+
+            logger.info(f"Starting run for {key} after {waited:.1f}s in admission queue")
+            self._executor.submit(self._start, key)
+
+    def _start(self, key):
+        try:
+            result = self._runner(key)
+        except Exception as e:
+            logger.error(f"Run for {key} failed to start: {str(e)}", exc_info=True)
+            result = None
+
+        if isinstance(result, Future):
+            result.add_done_callback(lambda _: self._release(key))
+        else:
+            self._release(key)
+
+    def _release(self, key):
+        with self._cond:
+            self._running -= 1
+            self._keys.discard(key)
+            self.stats['completed'] += 1
+            self._cond.notify()
+
+    def snapshot(self):
+        """返回队列长度、运行数与累计计数"""
+        with self._cond:
+            return dict(self.stats, queued=len(self._queue), running=self._running,
+                        max_concurrent=self.max_concurrent)
+
+
+controller = AdmissionController()
+
+
+def admit(authorization_code):
+    """调度器的任务入口：只负责入队，执行由准入控制器完成"""
+    controller.admit(authorization_code)
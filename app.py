@@ -1,117 +1,123 @@
+import base64
+import hashlib
 import json
 import logging
 # Configure logging
 import os
 import re
+import threading
 import time
 import uuid
 from datetime import datetime, timedelta
+from urllib.parse import quote_plus
 
-import pymysql
-import requests
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.schedulers.background import BackgroundScheduler
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from playwright.sync_api import sync_playwright
 
-from config import DB_CONFIG, APP_CONFIG
-from db_init import log_system_event, check_authorization_code
-from main import execute_reading
+from config import APP_CONFIG, DB_CONFIG, HTTP_CLIENT_CONFIG, RETENTION_CONFIG, SCHEDULER_CONFIG, WXREAD_CONFIG
+from admission import admit, controller as admission_controller
+from browser_pool import browser_pool
+from db_pool import get_db_connection, pool as db_pool
+from db_init import log_system_event, check_authorization_code, code_pool
+from log_setup import TRACE, configure_logging, snapshot as logging_snapshot
+from metrics import (QRCODE_STAGE_SECONDS, SCHEDULER_LAG_SECONDS, SCHEDULER_MISSED_RUNS,
+                     register_snapshot, render as render_metrics)
+from push import dispatcher as push_dispatcher, normalize_channels
+from queries import (INTERRUPTED_RUNS_SQL, JOBS_VERSION_SQL, JOBSTORE_TABLE, RECONCILE_RECORDS_SQL,
+                     RECORD_VERSION_SQL, tasks_page_query)
+from qr_sessions import QRSessionStore, TERMINAL_STATUSES
+from rate_limit import limiter as rate_limiter
+from record_cache import record_cache
+from retention import daily_history, run_retention
+from run_queue import enqueue_run
+from runs import task_wrapper
+from validation import setup_jobs, validate_credentials
+from reader_engine import engine as reading_engine
+from system_log import writer as system_log_writer
 
 # 确保日志目录存在
 log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
 os.makedirs(log_dir, exist_ok=True)
 log_file = os.path.join(log_dir, 'wxread.log')
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file, mode='a', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+configure_logging(log_file)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": APP_CONFIG['CORS_ORIGINS']}})
 
 # Initialize scheduler
+def build_jobstores():
+    """用户的阅读任务持久化到MySQL，进程内的辅助任务只放在内存中"""
+    jobstores = {'memory': MemoryJobStore()}
+    if SCHEDULER_CONFIG['JOBSTORE'] == 'mysql':
+        url = (f"mysql+pymysql://{quote_plus(DB_CONFIG['user'])}:{quote_plus(DB_CONFIG['password'])}"
+               f"@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}?charset=utf8mb4")
+        jobstores['default'] = SQLAlchemyJobStore(
+            url=url,
+            tablename=JOBSTORE_TABLE,
+            engine_options={'pool_pre_ping': True, 'pool_recycle': 3600}
+        )
+    else:
+        jobstores['default'] = MemoryJobStore()
+    return jobstores
+
 scheduler = BackgroundScheduler(
+    jobstores=build_jobstores(),
     job_defaults={
         'coalesce': True,
         'max_instances': 1,
         'misfire_grace_time': 60*60  # 1小时的容错时间
     }
 )
+
+def record_scheduler_lag(event):
+    """记录任务计划执行时间与实际提交执行之间的延迟"""
+    if event.code == EVENT_JOB_MISSED:
+        SCHEDULER_MISSED_RUNS.inc()
+        return
+    for run_time in event.scheduled_run_times:
+        SCHEDULER_LAG_SECONDS.observe((datetime.now(run_time.tzinfo) - run_time).total_seconds())
+
+scheduler.add_listener(record_scheduler_lag, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED)
 logger.info("Initializing BackgroundScheduler")
 scheduler.start()
 logger.info("BackgroundScheduler started successfully")
 
+# 调度器触发的任务经准入控制排队后由task_wrapper执行
+admission_controller.set_runner(task_wrapper)
 
-def get_db_connection():
-    logger.info(f"Connecting to database: {DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']} as {DB_CONFIG['user']}")
-    return pymysql.connect(
-        host=DB_CONFIG['host'],
-        user=DB_CONFIG['user'],
-        password=DB_CONFIG['password'],
-        database=DB_CONFIG['database'],
-        charset='utf8mb4',
-        cursorclass=pymysql.cursors.DictCursor,
-    )
+# /metrics抓取时读取各组件的当前状态
+register_snapshot('wxread_db_pool', db_pool.snapshot,
+                  gauges=('in_use', 'idle', 'max_size'),
+                  counters=('created', 'borrowed', 'waited', 'timeouts', 'health_check_failures'))
+register_snapshot('wxread_admission', admission_controller.snapshot,
+                  gauges=('running', 'queued', 'max_concurrent'),
+                  counters=('admitted', 'started', 'completed', 'rejected', 'duplicates'))
+register_snapshot('wxread_reading_engine', reading_engine.snapshot, gauges=('active_runs',))
+register_snapshot('wxread_rate_limit', rate_limiter.snapshot,
+                  gauges=('nodes', 'read_rate', 'renewal_rate', 'user_info_rate'))
+register_snapshot('wxread_skey_renewal', reading_engine.renewals.snapshot,
+                  gauges=('cached_accounts', 'inflight'),
+                  counters=('renewals', 'failures', 'coalesced', 'reused', 'proactive'))
+register_snapshot('wxread_record_cache', record_cache.snapshot,
+                  gauges=('size',), counters=('hits', 'misses', 'evictions'))
+register_snapshot('wxread_system_log', lambda: system_log_writer.stats,
+                  counters=('enqueued', 'written', 'dropped', 'failed'))
+register_snapshot('wxread_push', push_dispatcher.snapshot,
+                  gauges=('pending',), counters=('enqueued', 'dropped', 'digests', 'sent', 'retried', 'failed'))
+register_snapshot('wxread_auth_codes', lambda: code_pool.stats,
+                  gauges=('available',), counters=('consumed', 'generated'))
+register_snapshot('wxread_logging', logging_snapshot, gauges=('queued',), counters=('dropped',))
+
+def job_target():
+    """定时任务的入口：local模式在本进程排队执行，distributed模式写入run_queue由worker节点领取"""
+    return enqueue_run if SCHEDULER_CONFIG['MODE'] == 'distributed' else admit
 
-def validate_credentials(credentials):
-    """Validate WeChat Reading credentials by making a test request"""
-    try:
-        logger.info("Starting credentials validation")
-        headers = credentials.get('headers', {})
-        cookies = credentials.get('cookies', {})
-    
-        logger.debug(f"Raw headers: {headers}")
-        logger.debug(f"Raw cookies: {cookies}")
-        
-        # 如果headers和cookies是字符串，尝试解析为JSON
-        if isinstance(headers, str):
-            logger.info("Parsing headers from JSON string")
-            headers = json.loads(headers)
-        if isinstance(cookies, str):
-            logger.info("Parsing cookies from JSON string")
-            cookies = json.loads(cookies)
-            
-        # 处理cookies为列表的情况（Playwright格式）
-        if isinstance(cookies, list):
-            logger.info("Converting cookies from list format to dictionary")
-            cookies_dict = {}
-            for cookie in cookies:
-                if isinstance(cookie, dict) and 'name' in cookie and 'value' in cookie:
-                    cookies_dict[cookie['name']] = cookie['value']
-            cookies = cookies_dict
-            
-        # 确保headers和cookies是字典类型
-        if not isinstance(headers, dict) or not isinstance(cookies, dict):
-            logger.error(f"Invalid credentials format: headers={type(headers)}, cookies={type(cookies)}")
-            return False
-            
-        # 将cookies字典转换为cookie字符串
-        logger.info("Converting cookies dictionary to cookie string")
-        cookie_str = '; '.join([f"{key}={value}" for key, value in cookies.items()])
-        logger.debug(f"Cookie string: {cookie_str}")
-        
-        # 验证凭证是否有效
-        logger.info("Sending test request to validate credentials")
-        response = requests.get(
-            'https://weread.qq.com/web/user/info',
-            headers=headers,
-            cookies=cookie_str,  # 使用cookie字符串
-            timeout=10
-        )
-        logger.info(f"Test request response status: {response.status_code}")
-        logger.debug(f"Test request response: {response.text}")
-        
-        return response.status_code == 200
-    except Exception as e:
-        logger.error(f"Error validating credentials: {str(e)}", exc_info=True)
-        return False
 
 def parse_curl(curl_str):
     """Parse curl command to extract headers and cookies"""
@@ -138,26 +144,6 @@ def parse_curl(curl_str):
     
     return {'headers': headers, 'cookies': cookies}
 
-def setup_browser():
-    """Setup Playwright browser for automation"""
-    try:
-        logger.info("Starting Playwright browser setup")
-        playwright = sync_playwright().start()
-        logger.info("Playwright started successfully")
-        
-        # 启动浏览器
-        logger.info("Launching browser")
-        browser = playwright.chromium.launch(
-            headless=True,
-            args=['--no-sandbox']
-        )
-        logger.info("Browser launched successfully")
-        
-        return playwright, browser
-    except Exception as e:
-        logger.error(f"Error setting up browser: {str(e)}", exc_info=True)
-        raise
-
 @app.route('/api/config/bash', methods=['POST'])
 def config_bash():
     """Handle configuration via bash request"""
@@ -177,67 +163,89 @@ def config_bash():
         return jsonify({'error': 'Invalid authorization code'}), 403
     
     credentials = parse_curl(curl_str)
-    if not validate_credentials(credentials):
+
+    # 凭证验证与保存在后台执行，立即返回任务ID
+    job_id = setup_jobs.submit(
+        save_bash_config, authorization_code, credentials, single_read_time, run_time_config
+    )
+    return jsonify({
+        'message': 'Configuration accepted, validating credentials',
+        'job_id': job_id,
+        'status_url': f'/api/setup/jobs/{job_id}'
+    }), 202
+
+def save_bash_config(authorization_code, credentials, single_read_time, run_time_config):
+    """验证bash请求中的凭证并保存配置（后台任务）"""
+    validation = validate_credentials(credentials)
+    if not validation['valid']:
         log_system_event('WARNING', 'Invalid credentials in bash config request')
-        return jsonify({'error': 'Invalid credentials'}), 400
+        raise ValueError('Invalid credentials')
     
     try:
-        connection = get_db_connection()
-        with connection.cursor() as cursor:
+        with get_db_connection() as connection, connection.cursor() as cursor:
             sql = """
                 INSERT INTO record 
                 (authorization_code, single_read_time_seconds, run_time_config, 
-                 config_method, credentials)
-                VALUES (%s, %s, %s, 'bash', %s)
+                 config_method, credentials, user_info)
+                VALUES (%s, %s, %s, 'bash', %s, %s)
                 ON DUPLICATE KEY UPDATE
                 single_read_time_seconds = VALUES(single_read_time_seconds),
                 run_time_config = VALUES(run_time_config),
                 credentials = VALUES(credentials),
+                user_info = VALUES(user_info),
                 last_validated_at = CURRENT_TIMESTAMP
             """
             cursor.execute(sql, (
                 authorization_code,
                 single_read_time,
                 run_time_config,
-                json.dumps(credentials)
+                json.dumps(credentials),
+                json.dumps(validation['user_info']) if validation['user_info'] else None
             ))
-        connection.commit()
+            connection.commit()
+        record_cache.invalidate(authorization_code)
         
         log_system_event('INFO', f'Configuration saved successfully for code: {authorization_code}')
         
         # Schedule the task
         schedule_task(authorization_code, run_time_config)
         
-        return jsonify({'message': 'Configuration saved successfully'}), 200
+        return {'message': 'Configuration saved successfully'}
         
     except Exception as e:
         logger.error(f"Error saving bash configuration: {str(e)}")
         log_system_event('ERROR', 'Error saving bash configuration', {'error': str(e)})
-        return jsonify({'error': str(e)}), 500
+        raise
 
-import threading
+# 二维码登录流程需要拦截的阅读接口
+QRCODE_READ_API_URL = f"{WXREAD_CONFIG['BASE_URL']}/web/book/read"
+# 登录时打开的阅读页，以及登录后用于触发阅读接口请求的章节页
+QRCODE_READER_PAGE_URL = f"{WXREAD_CONFIG['BASE_URL']}/web/reader/ce032b305a9bc1ce0b0dd2a"
+QRCODE_CHAPTER_PAGE_URL = f"{WXREAD_CONFIG['BASE_URL']}/web/reader/ce032b305a9bc1ce0b0dd2akc9e32940268c9e1074f5bc6"
+# 开启资源拦截时中止的静态资源（图片、字体、音视频），按扩展名匹配，不经过Python回调
+QRCODE_BLOCKED_RESOURCES = "**/*.{png,jpg,jpeg,gif,webp,bmp,ico,woff,woff2,ttf,otf,eot,mp3,mp4,webm,ogg,wav}"
 
-# 添加一个全局字典来存储会话状态
-session_states = {}
+# 二维码登录会话状态，状态变化时唤醒等待中的状态请求
+# 未结束的会话在登录超时之后再保留一个保留期，之后视为浏览器任务已丢失
+session_states = QRSessionStore(ttl_seconds=APP_CONFIG['QRCODE_SESSION_TIMEOUT'],
+                                stale_seconds=APP_CONFIG['QRCODE_SESSION_TIMEOUT'] * 2)
 
 
-def qrcode_login_worker(session_id):
-    """后台线程处理二维码登录流程"""
+def qrcode_login_worker(browser, session_id):
+    """在浏览器池线程中处理二维码登录流程，每个会话使用独立的浏览器上下文"""
     logger.info(f"Starting QR code login worker for session: {session_id}")
     
     try:
-        # 初始化会话状态
-        session_states[session_id] = {
-            'status': 'initializing',
-            'qrcode': None,
-            'error': None,
-            'headers': None,
-            'cookies': None,
-            'success': False
-        }
-        
-        # 使用 Playwright 获取登录信息
-        playwright, browser = setup_browser()
+        # 排队期间会话可能已被取消，或等待过久已被清理
+        state = session_states.get(session_id)
+        if state is None or state['status'] == 'cancelled':
+            logger.info(f"Session {session_id} was cancelled before a browser was available")
+            return
+
+        # 从创建会话到分配到浏览器的等待时间
+        QRCODE_STAGE_SECONDS.labels('browser_wait').observe(time.time() - state['status_since'])
+        page_load_started = time.monotonic()
+
         context = None
         page = None
         
@@ -251,41 +259,34 @@ def qrcode_login_worker(session_id):
             # 创建一个变量来存储拦截到的请求信息
             intercepted_request = {'headers': None, 'cookies': None, 'success': False}
             
-            # 设置请求拦截
+            # 设置请求拦截，只有阅读接口会进入Python回调
             def handle_request(route, request):
-                # 记录所有请求的URL
-                logger.info(f"Request URL: {request.url}")
+                logger.info(f"Intercepted request to: {request.url}")
+                # 获取请求头
+                headers = request.headers
+                logger.log(TRACE, "Request headers: %s", headers)
+                # 获取cookies
+                cookies = context.cookies()
+                logger.log(TRACE, "Request cookies: %s", cookies)
                 
-                # 只拦截特定API请求
-                if "https://weread.qq.com/web/book/read" == request.url:
-                    logger.info(f"Intercepted request to: {request.url}")
-                    # 获取请求头
-                    headers = request.headers
-                    logger.info(f"Request headers: {headers}")
-                    # 获取cookies
-                    cookies = context.cookies()
-                    logger.info(f"Request cookies: {cookies}")
-                    
-                    # 存储拦截到的信息
-                    intercepted_request['headers'] = headers
-                    intercepted_request['cookies'] = cookies
-                    
-                    # 继续请求
-                    route.continue_()
-                else:
-                    route.continue_()
+                # 存储拦截到的信息
+                intercepted_request['headers'] = headers
+                intercepted_request['cookies'] = cookies
+                
+                # 继续请求
+                route.continue_()
             
             # 设置响应拦截
             def handle_response(response):
-                if "https://weread.qq.com/web/book/read" == response.url:
+                if response.url == QRCODE_READ_API_URL:
                     logger.info(f"Intercepted response from: {response.url}")
                     try:
                         # 保存响应数据
                         response_data = response.text()
-                        logger.info(f"Response text: {response_data}")
+                        logger.log(TRACE, "Response text: %s", response_data)
                         # 解析响应JSON
                         response_json = json.loads(response_data)
-                        logger.info(f"Response JSON: {response_json}")
+                        logger.log(TRACE, "Response JSON: %s", response_json)
                         # 检查响应是否成功
                         if response_json.get('succ') == 1:
                             logger.info("API request successful (succ=1)")
@@ -297,13 +298,16 @@ def qrcode_login_worker(session_id):
             
             # 启用请求和响应拦截
             logger.info("Enabling request and response interception")
-            context.route("**/*", handle_request)
+            context.route(QRCODE_READ_API_URL, handle_request)
             context.on("response", handle_response)
+            if APP_CONFIG['QRCODE_BLOCK_RESOURCES']:
+                # 登录流程不需要的图片、字体和媒体直接在浏览器侧中止
+                context.route(QRCODE_BLOCKED_RESOURCES, lambda route: route.abort())
             
             # 直接访问阅读页面
             logger.info("Navigating directly to reader page")
             page = context.new_page()
-            page.goto("https://weread.qq.com/web/reader/ce032b305a9bc1ce0b0dd2a")
+            page.goto(QRCODE_READER_PAGE_URL)
             
             # 等待页面加载完成
             logger.info("Waiting for page to load")
@@ -312,6 +316,7 @@ def qrcode_login_worker(session_id):
             # 检查是否存在登录按钮
             logger.info("Checking for login button")
             login_button = page.query_selector_all('.readerTopBar_link')[2]
+            QRCODE_STAGE_SECONDS.labels('page_load').observe(time.monotonic() - page_load_started)
             
             if login_button:
                 logger.info("Login button found, clicking it")
@@ -328,13 +333,11 @@ def qrcode_login_worker(session_id):
                     qr_code_base64 = qr_code_selector.get_attribute('src')
                 except Exception as e:
                     logger.error(f"QR code did not appear: {str(e)}")
-                    session_states[session_id]['status'] = 'error'
-                    session_states[session_id]['error'] = '二维码未出现'
+                    session_states.update(session_id, status='error', error='二维码未出现')
                     return
 
                 # 更新会话状态
-                session_states[session_id]['status'] = 'waiting_for_scan'
-                session_states[session_id]['qrcode'] = qr_code_base64
+                session_states.update(session_id, status='waiting_for_scan', qrcode=qr_code_base64)
                 
                 # 更新数据库中的二维码
                 connection = get_db_connection()
@@ -356,17 +359,19 @@ def qrcode_login_worker(session_id):
                 max_attempts = 60  # 最多等待60秒
                 success_count = 0
                 for attempt in range(max_attempts):
-                    # 检查会话是否已取消
-                    if session_states[session_id]['status'] == 'cancelled':
+                    # 检查会话是否已取消或已被清理
+                    state = session_states.get(session_id)
+                    if state is None or state['status'] == 'cancelled':
                         logger.info(f"Session {session_id} was cancelled")
                         return
                     avatar = page.wait_for_selector('.readerTopBar_avatar',state='visible',timeout=30000)
                     if avatar:
                         logger.info("User logged in successfully")
-                        session_states[session_id]['status'] = 'logged_in'
-                        page.goto("https://weread.qq.com/web/reader/ce032b305a9bc1ce0b0dd2akc9e32940268c9e1074f5bc6")
+                        session_states.update(session_id, status='logged_in')
+                        page.goto(QRCODE_CHAPTER_PAGE_URL)
                         success_count += 1
-                        logger.info(f"当前页面内容：{page.content()}")
+                        if logger.isEnabledFor(TRACE):
+                            logger.log(TRACE, "当前页面内容：%s", page.content())
                         time.sleep(15)
                         break
                     else:
@@ -376,14 +381,12 @@ def qrcode_login_worker(session_id):
                     # 检查是否成功拦截到请求并且响应成功
                     if not intercepted_request['headers'] or not intercepted_request['cookies']:
                         logger.error("Failed to intercept request headers or cookies")
-                        session_states[session_id]['status'] = 'error'
-                        session_states[session_id]['error'] = '未能获取到请求信息，请重试'
+                        session_states.update(session_id, status='error', error='未能获取到请求信息，请重试')
                         return
 
                     # if not intercepted_request['success']:
                     #     logger.error("API request did not return success status")
-                    #     session_states[session_id]['status'] = 'error'
-                    #     session_states[session_id]['error'] = 'API请求未返回成功状态，请重试'
+                    #     session_states.update(session_id, status='error', error='API请求未返回成功状态，请重试')
                     #     return
 
                     # 获取拦截到的请求头和cookie
@@ -396,10 +399,13 @@ def qrcode_login_worker(session_id):
                     cookies_str = headers.get('cookie','')
 
                     # 更新会话状态
-                    session_states[session_id]['status'] = 'completed'
-                    session_states[session_id]['headers'] = headers_str
-                    session_states[session_id]['cookies'] = cookies_str
-                    session_states[session_id]['success'] = True
+                    session_states.update(
+                        session_id,
+                        status='completed',
+                        headers=headers_str,
+                        cookies=cookies_str,
+                        success=True
+                    )
 
                     # 更新数据库中的会话状态
                     connection = get_db_connection()
@@ -419,22 +425,26 @@ def qrcode_login_worker(session_id):
                 else:
                     # 如果没有检测到登录状态
                     logger.warning("Login status not detected after maximum attempts")
-                    session_states[session_id]['status'] = 'timeout'
-                    session_states[session_id]['error'] = '登录超时，请重试'
+                    session_states.update(session_id, status='timeout', error='登录超时，请重试')
             
         finally:
-            logger.info("Closing browser context, browser, and playwright")
+            logger.info("Closing page and browser context")
             if page:
                 page.close()
             if context:
                 context.close()
-            browser.close()
-            playwright.stop()
             
     except Exception as e:
         logger.error(f"QR code login worker failed: {str(e)}", exc_info=True)
-        session_states[session_id]['status'] = 'error'
-        session_states[session_id]['error'] = str(e)
+        session_states.update(session_id, status='error', error=str(e))
+
+def report_qrcode_job_failure(session_id, future):
+    """浏览器启动或重启失败时登录任务不会执行，异常只在future中，会话直接置为error"""
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        session_states.update(session_id, status='error', error=f"浏览器启动失败: {error}")
 
 @app.route('/api/config/qrcode', methods=['POST'])
 def generate_qrcode():
@@ -468,106 +478,126 @@ def generate_qrcode():
         """, (session_id, expires_at))
         
         connection.commit()
+        cursor.close()
+        connection.close()
         logger.info(f"Session saved to database with ID: {session_id}")
         
-        # 启动后台线程处理二维码登录
-        thread = threading.Thread(target=qrcode_login_worker, args=(session_id,))
-        thread.daemon = True
-        thread.start()
-        
-        # 等待二维码生成
-        max_wait = 30  # 最多等待30秒
-        for _ in range(max_wait):
-            if session_id in session_states and session_states[session_id]['qrcode']:
-                break
-            time.sleep(1)
-        
-        # 检查是否成功生成二维码
-        if session_id not in session_states or not session_states[session_id]['qrcode']:
-            logger.error("Failed to generate QR code")
-            return jsonify({'success': False, 'error': '生成二维码失败，请重试'}), 500
-        
-        # 返回二维码和会话ID
+        # 初始化会话状态，交给浏览器池处理二维码登录后立即返回
+        session_states.create(session_id)
+        future = browser_pool.submit(qrcode_login_worker, session_id)
+        # 启动时浏览器未能拉起的槽位会在领取任务时重新启动，失败同样通过回调上报
+        future.add_done_callback(lambda f: report_qrcode_job_failure(session_id, f))
+
+        # 二维码通过状态接口或事件流下发
         return jsonify({
             'success': True,
             'session_id': session_id,
-            'qrcode': session_states[session_id]['qrcode'],
-            'expires_at': expires_at.isoformat()
-        })
+            'status': 'initializing',
+            'qrcode': None,
+            'expires_at': expires_at.isoformat(),
+            'status_url': f'/api/config/qrcode/status/{session_id}',
+            'events_url': f'/api/config/qrcode/events/{session_id}'
+        }), 202
         
     except Exception as e:
         logger.error(f"生成二维码失败: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# 各状态对应的提示信息
+QRCODE_STATUS_MESSAGES = {
+    'initializing': '正在初始化...',
+    'waiting_for_scan': '等待扫描二维码...',
+    'logged_in': '已登录，正在获取凭证...',
+    'completed': '登录完成',
+    'timeout': '登录超时，请重试',
+    'cancelled': '会话已取消',
+}
+
+# 长轮询单次最长等待秒数
+QRCODE_LONG_POLL_MAX_WAIT = 30
+
+
+def qrcode_status_payload(session_state):
+    """将会话状态转换为状态接口的返回内容"""
+    status = session_state['status']
+    payload = {'status': status, 'version': session_state['version']}
+
+    if status in ('initializing', 'waiting_for_scan', 'logged_in', 'completed'):
+        payload['success'] = True
+        payload['message'] = QRCODE_STATUS_MESSAGES[status]
+        if status == 'waiting_for_scan':
+            payload['qrcode'] = session_state['qrcode']
+        elif status == 'completed':
+            payload['headers'] = session_state['headers']
+            payload['cookies'] = session_state['cookies']
+    elif status == 'error':
+        payload['success'] = False
+        payload['error'] = session_state['error']
+    elif status in ('timeout', 'cancelled'):
+        payload['success'] = False
+        payload['error'] = QRCODE_STATUS_MESSAGES[status]
+    else:
+        payload['success'] = False
+        payload['status'] = 'unknown'
+        payload['error'] = '未知状态'
+    return payload
+
 @app.route('/api/config/qrcode/status/<session_id>', methods=['GET'])
 def check_qrcode_status(session_id):
-    """Check QR code login status"""
+    """Check QR code login status
+
+    传入wait参数时为长轮询：阻塞到会话版本号超过version参数（默认-1）或超时为止。
+    """
     try:
         # 检查会话是否存在
         if session_id not in session_states:
             logger.error(f"Session not found: {session_id}")
             return jsonify({'success': False, 'error': '会话不存在或已过期'}), 404
         
-        # 获取会话状态
-        session_state = session_states[session_id]
-        status = session_state['status']
-        
-        # 根据状态返回不同的响应
-        if status == 'initializing':
-            return jsonify({
-                'success': True,
-                'status': 'initializing',
-                'message': '正在初始化...'
-            })
-        elif status == 'waiting_for_scan':
-            return jsonify({
-                'success': True,
-                'status': 'waiting_for_scan',
-                'message': '等待扫描二维码...'
-            })
-        elif status == 'logged_in':
-            return jsonify({
-                'success': True,
-                'status': 'logged_in',
-                'message': '已登录，正在获取凭证...'
-            })
-        elif status == 'completed':
-            return jsonify({
-                'success': True,
-                'status': 'completed',
-                'message': '登录完成',
-                'headers': session_state['headers'],
-                'cookies': session_state['cookies']
-            })
-        elif status == 'error':
-            return jsonify({
-                'success': False,
-                'status': 'error',
-                'error': session_state['error']
-            })
-        elif status == 'timeout':
-            return jsonify({
-                'success': False,
-                'status': 'timeout',
-                'error': '登录超时，请重试'
-            })
-        elif status == 'cancelled':
-            return jsonify({
-                'success': False,
-                'status': 'cancelled',
-                'error': '会话已取消'
-            })
+        wait = min(request.args.get('wait', 0, type=float), QRCODE_LONG_POLL_MAX_WAIT)
+        if wait > 0:
+            since_version = request.args.get('version', -1, type=int)
+            session_state = session_states.wait_for_change(session_id, since_version, wait)
         else:
-            return jsonify({
-                'success': False,
-                'status': 'unknown',
-                'error': '未知状态'
-            })
+            session_state = session_states.get(session_id)
+
+        if session_state is None:
+            return jsonify({'success': False, 'error': '会话不存在或已过期'}), 404
+        return jsonify(qrcode_status_payload(session_state))
             
     except Exception as e:
         logger.error(f"检查二维码状态失败: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/config/qrcode/events/<session_id>', methods=['GET'])
+def stream_qrcode_status(session_id):
+    """以Server-Sent Events推送二维码登录状态，到达终止状态或会话过期后结束"""
+    if session_id not in session_states:
+        logger.error(f"Session not found: {session_id}")
+        return jsonify({'success': False, 'error': '会话不存在或已过期'}), 404
+
+    def generate():
+        version = -1
+        deadline = time.time() + APP_CONFIG['QRCODE_SESSION_TIMEOUT']
+        while time.time() < deadline:
+            session_state = session_states.wait_for_change(session_id, version, 15)
+            if session_state is None:
+                break
+            if session_state['version'] == version:
+                # 心跳，防止代理断开空闲连接
+                yield ": keep-alive\n\n"
+                continue
+            version = session_state['version']
+            payload = qrcode_status_payload(session_state)
+            yield f"event: status\nid: {version}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            if session_state['status'] in TERMINAL_STATUSES:
+                break
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/config/qrcode/cancel/<session_id>', methods=['POST'])
 def cancel_qrcode_session(session_id):
     """Cancel QR code session"""
@@ -578,7 +608,7 @@ def cancel_qrcode_session(session_id):
             return jsonify({'success': False, 'error': '会话不存在或已过期'}), 404
         
         # 更新会话状态为已取消
-        session_states[session_id]['status'] = 'cancelled'
+        session_states.update(session_id, status='cancelled')
         
         # 更新数据库中的会话状态
         connection = get_db_connection()
@@ -589,6 +619,8 @@ def cancel_qrcode_session(session_id):
             WHERE session_id = %s
         """, (session_id,))
         connection.commit()
+        cursor.close()
+        connection.close()
         
         return jsonify({
             'success': True,
@@ -605,6 +637,7 @@ def setup():
     if request.method == 'OPTIONS':
         return '', 200
         
+    connection = None
     try:
         data = request.json
         authCode = data.get('authCode')
@@ -649,10 +682,6 @@ def setup():
             logger.error(f"Error parsing schedule time: {str(e)}")
             return jsonify({'success': False, 'error': '无效的时间格式'}), 400
         
-        # 检查是否存在配置
-        cursor.execute("SELECT * FROM record WHERE authorization_code = %s", (authCode,))
-        existing_record = cursor.fetchone()
-        
         credentials = None
         if bashRequest:  # bash模式
             try:
@@ -712,14 +741,42 @@ def setup():
                 'cookies': cookies_str
             }
 
-        # 验证凭证是否有效（尝试执行一次阅读）
-        try:
-            success = execute_reading(credentials, read_count=1)
-            if not success:
-                return jsonify({'success': False, 'error': '凭证验证失败，请检查登录信息是否正确'}), 400
-        except Exception as e:
-            logging.error(f"验证凭证失败: {str(e)}")
-            return jsonify({'success': False, 'error': '验证凭证失败，请检查登录信息是否正确'}), 400
+        # 凭证验证需要请求微信读书并试读一次，放到后台执行，立即返回任务ID
+        job_id = setup_jobs.submit(
+            save_setup_config,
+            authCode,
+            credentials,
+            single_read_time_seconds,
+            run_time_config,
+            'bash' if bashRequest else 'qrcode'
+        )
+        return jsonify({
+            'success': True,
+            'status': 'pending',
+            'message': '配置已提交，正在验证凭证',
+            'job_id': job_id,
+            'status_url': f'/api/setup/jobs/{job_id}'
+        }), 202
+            
+    except Exception as e:
+        logging.error(f"设置失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if connection:
+            connection.close()
+
+def save_setup_config(authCode, credentials, single_read_time_seconds, run_time_config, config_method):
+    """验证凭证并保存配置（后台任务），验证结果按凭证缓存"""
+    # 验证凭证是否有效（用户信息接口 + 尝试执行一次阅读）
+    validation = validate_credentials(credentials, read_check=True)
+    if not validation['valid']:
+        raise ValueError('凭证验证失败，请检查登录信息是否正确')
+    user_info = json.dumps(validation['user_info']) if validation['user_info'] else None
+
+    # 检查是否存在配置
+    existing_record = record_cache.get(authCode)
+
+    with get_db_connection() as connection, connection.cursor() as cursor:
         if existing_record:
             # 更新现有配置
             cursor.execute("""
@@ -727,6 +784,7 @@ def setup():
                 SET single_read_time_seconds = %s,
                     run_time_config = %s,
                     credentials = %s,
+                    user_info = %s,
                     last_validated_at = CURRENT_TIMESTAMP,
                     is_active = TRUE
                 WHERE authorization_code = %s
@@ -734,30 +792,26 @@ def setup():
                 single_read_time_seconds,
                 run_time_config,
                 json.dumps(credentials),
+                user_info,
                 authCode
             ))
             connection.commit()
-            # 更新定时任务
-            schedule_task(authCode, run_time_config)
-            
-            return jsonify({
-                'success': True,
-                'message': '配置更新成功'
-            })
+            message = '配置更新成功'
         else:
             # 保存新配置
             try:
                 cursor.execute("""
                     INSERT INTO record 
                     (authorization_code, single_read_time_seconds, run_time_config, 
-                     config_method, credentials, is_active)
-                    VALUES (%s, %s, %s, %s, %s, TRUE)
+                     config_method, credentials, user_info, is_active, last_validated_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, TRUE, CURRENT_TIMESTAMP)
                 """, (
                     authCode,
                     single_read_time_seconds,
                     run_time_config,
-                    'bash' if bashRequest else 'qrcode',
-                    json.dumps(credentials)
+                    config_method,
+                    json.dumps(credentials),
+                    user_info
                 ))
                 
                 # 标记授权码为已使用
@@ -771,145 +825,208 @@ def setup():
                 
                 # 确保事务提交
                 connection.commit()
+                code_pool.notify_consumed()
                 logger.info(f"Successfully inserted new configuration for auth code: {authCode}")
-                
-                # 设置定时任务
-                schedule_task(authCode, run_time_config)
-                
-                return jsonify({
-                    'success': True,
-                    'message': '配置保存成功'
-                })
+                message = '配置保存成功'
             except Exception as e:
                 # 回滚事务
                 connection.rollback()
                 logger.error(f"Error inserting configuration: {str(e)}", exc_info=True)
-                return jsonify({'success': False, 'error': f'保存配置失败: {str(e)}'}), 500
-            
+                raise RuntimeError(f'保存配置失败: {str(e)}')
+
+    record_cache.invalidate(authCode)
+    # 设置定时任务
+    schedule_task(authCode, run_time_config)
+    return {'message': message}
+
+@app.route('/api/setup/jobs/<job_id>', methods=['GET'])
+def get_setup_job(job_id):
+    """查询配置任务（凭证验证与保存）的状态"""
+    job = setup_jobs.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': '任务不存在或已过期'}), 404
+
+    response = {'success': job['status'] != 'failed', 'status': job['status']}
+    if job['status'] == 'succeeded':
+        response['message'] = job['result']['message']
+    elif job['status'] == 'failed':
+        response['error'] = job['error']
+    return jsonify(response)
+
+@app.route('/api/config/notify', methods=['POST'])
+def set_notify_channels():
+    """设置授权码自己的推送渠道，阅读任务结束时推送到其中的每个渠道
+
+    请求体：{"authCode": "...", "channels": {"telegram": {"bot_token": "...", "chat_id": "..."},
+    "pushplus": {"token": "..."}, "wxpusher": {"spt": "..."}}}，channels为空对象时关闭推送。
+    """
+    try:
+        data = request.json or {}
+        authCode = data.get('authCode')
+        if not authCode:
+            return jsonify({'success': False, 'error': '缺少必要参数'}), 400
+        try:
+            channels = normalize_channels(data.get('channels') or {})
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        with get_db_connection() as connection, connection.cursor() as cursor:
+            # 保留updated_at，推送设置的变化不需要重新同步定时任务
+            cursor.execute("""
+                UPDATE record SET notify_channels = %s, updated_at = updated_at
+                WHERE authorization_code = %s
+            """, (json.dumps(channels) if channels else None, authCode))
+            connection.commit()
+            if cursor.rowcount == 0:
+                cursor.execute("SELECT 1 FROM record WHERE authorization_code = %s", (authCode,))
+                if not cursor.fetchone():
+                    return jsonify({'success': False, 'error': '未找到该授权码的配置'}), 404
+
+        record_cache.invalidate(authCode)
+        return jsonify({'success': True, 'channels': sorted(channels)})
     except Exception as e:
-        logging.error(f"设置失败: {str(e)}")
+        logger.error(f"设置推送渠道失败: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def load_scheduled_tasks():
-    """从数据库加载所有活动的定时任务"""
-    try:
-        logger.info("Loading scheduled tasks from database")
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        
-        # 获取所有活动的配置
+# 增量同步的水位线在scheduler_state表中的名称
+RECONCILE_WATERMARK = 'record_watermark'
+RECONCILE_EPOCH = datetime(1970, 1, 2)
+
+def get_reconcile_watermark():
+    """读取上次同步到的record.updated_at"""
+    if SCHEDULER_CONFIG['JOBSTORE'] != 'mysql':
+        # 内存任务存储在进程重启后为空，需要全量加载
+        return RECONCILE_EPOCH
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        cursor.execute("SELECT value FROM scheduler_state WHERE name = %s", (RECONCILE_WATERMARK,))
+        row = cursor.fetchone()
+    return datetime.fromisoformat(row['value']) if row else RECONCILE_EPOCH
+
+def save_reconcile_watermark(watermark):
+    with get_db_connection() as connection, connection.cursor() as cursor:
         cursor.execute("""
-            SELECT authorization_code, run_time_config 
-            FROM record 
-            WHERE is_active = TRUE
-        """)
-        active_configs = cursor.fetchall()
-        
-        logger.info(f"Found {len(active_configs)} active configurations")
-        
-        # 为每个配置创建定时任务
-        for config in active_configs:
-            auth_code = config['authorization_code']
-            run_time_config = config['run_time_config']
-            
-            try:
-                # 移除现有的任务（如果存在）
-                job_id = f"wxread_{auth_code}"
-                if scheduler.get_job(job_id):
-                    logger.info(f"Removing existing job: {job_id}")
-                    scheduler.remove_job(job_id)
-                
-                # 解析cron表达式
-                cron_params = parse_cron_expression(run_time_config)
-                logger.info(f"Cron parameters for job {job_id}: {cron_params}")
-                
-                # 添加新任务
-                scheduler.add_job(
-                    task_wrapper,
-                    'cron',
-                    **cron_params,
-                    id=job_id,
-                    args=[auth_code]  # 传递授权码作为参数
-                )
-                
-                logger.info(f"Successfully scheduled task for authorization code: {auth_code}")
-                
-            except Exception as e:
-                logger.error(f"Error scheduling task for {auth_code}: {str(e)}", exc_info=True)
-        
-        cursor.close()
-        connection.close()
-        logger.info("Finished loading scheduled tasks")
-        
-        # 验证任务是否已加载
-        jobs = scheduler.get_jobs()
-        logger.info(f"Total scheduled jobs after loading: {len(jobs)}")
-        for job in jobs:
-            logger.info(f"Loaded job: {job.id}, next run: {job.next_run_time}")
-        
+            INSERT INTO scheduler_state (name, value) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE value = VALUES(value)
+        """, (RECONCILE_WATERMARK, watermark.isoformat()))
+        connection.commit()
+
+def apply_record_change(auth_code, run_time_config, is_active):
+    """将一条record的变化同步到调度器"""
+    # 配置可能由其他进程修改，同步时一并让缓存失效
+    record_cache.invalidate(auth_code)
+    job_id = f"wxread_{auth_code}"
+    if not is_active:
+        if scheduler.get_job(job_id):
+            logger.info(f"Removing job for inactive configuration: {job_id}")
+            scheduler.remove_job(job_id)
+        return
+
+    cron_params = parse_cron_expression(run_time_config)
+    scheduler.add_job(
+        job_target(),
+        'cron',
+        **cron_params,
+        id=job_id,
+        args=[auth_code],  # 传递授权码作为参数
+        replace_existing=True
+    )
+
+_reconcile_watermark = None
+_reconcile_lock = threading.Lock()
+
+def reconcile_scheduled_tasks():
+    """只同步updated_at不早于水位线的record，启动与运行期间的开销与变更数量成正比"""
+    global _reconcile_watermark
+    if not _reconcile_lock.acquire(blocking=False):
+        return
+    try:
+        if _reconcile_watermark is None:
+            _reconcile_watermark = get_reconcile_watermark()
+        watermark = _reconcile_watermark
+        applied = 0
+
+        with get_db_connection() as connection, connection.cursor() as cursor:
+            # 水位线始终落后数据库时间几秒：稍晚提交、updated_at较早的事务在下一轮仍会被扫描到
+            cursor.execute("SELECT NOW() - INTERVAL %s SECOND AS safe_watermark",
+                           (SCHEDULER_CONFIG['RECONCILE_LAG_SECONDS'],))
+            safe_watermark = cursor.fetchone()['safe_watermark']
+            connection.commit()
+
+        # 按(updated_at, authorization_code)键集分页：同步期间被修改的行移到末尾时不会让后面的行被跳过
+        # updated_at精度为秒，从水位线所在的秒开始重复处理（操作是幂等的）
+        last_updated, last_code = watermark, ''
+        while True:
+            with get_db_connection() as connection, connection.cursor() as cursor:
+                cursor.execute(RECONCILE_RECORDS_SQL,
+                               (last_updated, last_code, SCHEDULER_CONFIG['RECONCILE_BATCH_SIZE']))
+                rows = cursor.fetchall()
+
+            for row in rows:
+                try:
+                    apply_record_change(row['authorization_code'], row['run_time_config'], row['is_active'])
+                except Exception as e:
+                    logger.error(f"Error scheduling task for {row['authorization_code']}: {str(e)}", exc_info=True)
+            applied += len(rows)
+            if rows:
+                last_updated, last_code = rows[-1]['updated_at'], rows[-1]['authorization_code']
+            if len(rows) < SCHEDULER_CONFIG['RECONCILE_BATCH_SIZE']:
+                break
+
+        latest = max(watermark, min(last_updated, safe_watermark))
+        if latest != watermark:
+            save_reconcile_watermark(latest)
+            _reconcile_watermark = latest
+        if applied:
+            logger.info(f"Reconciled {applied} changed configurations, watermark: {_reconcile_watermark}")
+
     except Exception as e:
-        logger.error(f"Error loading scheduled tasks: {str(e)}", exc_info=True)
+        logger.error(f"Error reconciling scheduled tasks: {str(e)}", exc_info=True)
+    finally:
+        _reconcile_lock.release()
+
+def load_scheduled_tasks():
+    """启动时同步定时任务
 
-def task_wrapper(authorization_code):
-    """定时任务包装函数"""
+    MySQL任务存储中的任务在重启后仍然存在，只需应用上次水位线之后变化的配置；
+    之后由定时的增量同步任务持续跟进record表的变化。
+    """
+    logger.info("Loading scheduled tasks from database")
+    reconcile_scheduled_tasks()
+
+    # 切换调度模式后，已持久化的任务改用当前模式的入口
+    target = job_target()
+    for job in scheduler.get_jobs(jobstore='default'):
+        if job.id.startswith('wxread_') and job.func is not target:
+            job.modify(func=target)
+    scheduler.add_job(
+        reconcile_scheduled_tasks,
+        'interval',
+        seconds=SCHEDULER_CONFIG['RECONCILE_INTERVAL'],
+        id='reconcile_scheduled_tasks',
+        jobstore='memory',
+        replace_existing=True
+    )
+    logger.info("Finished loading scheduled tasks")
+
+def resume_interrupted_runs():
+    """启动时恢复当天被中断的阅读任务，之前日期遗留的running记录标记为失败"""
     try:
-        logger.info(f"Executing scheduled task for authorization code: {authorization_code}")
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        
-        # 获取配置信息
-        cursor.execute("""
-            SELECT * FROM record 
-            WHERE authorization_code = %s AND is_active = TRUE
-        """, (authorization_code,))
-        config = cursor.fetchone()
-        
-        if not config:
-            logger.error(f"未找到有效的配置: {authorization_code}")
-            return
-            
-        # 创建执行日志
-        cursor.execute("""
-            INSERT INTO execution_log 
-            (authorization_code, start_time, status)
-            VALUES (%s, CURRENT_TIMESTAMP, 'running')
-        """, (authorization_code,))
-        log_id = cursor.lastrowid
-        
-        try:
-            # 执行阅读任务
-            success = execute_reading(
-                json.loads(config['credentials']), 
-                read_count=config['single_read_time_seconds'] // 30  # 每30秒一次阅读
-            )
-            
-            # 更新执行日志
+        with get_db_connection() as connection, connection.cursor() as cursor:
             cursor.execute("""
-                UPDATE execution_log 
-                SET end_time = CURRENT_TIMESTAMP,
-                    status = %s,
-                    details = %s
-                WHERE log_id = %s
-            """, (
-                'success' if success else 'failed',
-                '阅读任务执行成功' if success else '阅读任务执行失败',
-                log_id
-            ))
-            
-        except Exception as e:
-            logger.error(f"执行任务失败: {str(e)}")
-            cursor.execute("""
-                UPDATE execution_log 
-                SET end_time = CURRENT_TIMESTAMP,
-                    status = 'failed',
-                    details = %s
-                WHERE log_id = %s
-            """, (str(e), log_id))
-            
-        connection.commit()
-        
+                UPDATE execution_log
+                SET status = 'failure', end_time = CURRENT_TIMESTAMP, details = '阅读任务被中断'
+                WHERE status = 'running' AND start_time < CURDATE()
+            """)
+            cursor.execute(INTERRUPTED_RUNS_SQL)
+            interrupted = [row['authorization_code'] for row in cursor.fetchall()]
+            connection.commit()
+
+        for auth_code in interrupted:
+            admit(auth_code)
+        if interrupted:
+            logger.info(f"Resuming {len(interrupted)} interrupted reading runs")
     except Exception as e:
-        logger.error(f"定时任务执行失败: {str(e)}")
+        logger.error(f"Error resuming interrupted runs: {str(e)}", exc_info=True)
 
 def schedule_task(authorization_code, run_time_config):
     """Schedule a task based on the run_time_config"""
@@ -928,7 +1045,7 @@ def schedule_task(authorization_code, run_time_config):
         
         # 添加新任务
         scheduler.add_job(
-            task_wrapper,
+            job_target(),
             'cron',
             **cron_params,
             id=job_id,
@@ -941,6 +1058,42 @@ def schedule_task(authorization_code, run_time_config):
         logger.error(f"Error scheduling task: {str(e)}", exc_info=True)
         raise
 
+def count_due_jobs(horizon):
+    """统计在horizon之前触发的阅读任务数量"""
+    if SCHEDULER_CONFIG['JOBSTORE'] == 'mysql':
+        # 直接查询任务表的next_run_time索引，避免反序列化全部任务
+        with get_db_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT COUNT(*) AS due FROM {JOBSTORE_TABLE}
+                WHERE id LIKE 'wxread\\_%%' AND next_run_time <= %s
+            """, (horizon.timestamp(),))
+            return cursor.fetchone()['due']
+    return sum(
+        1 for job in scheduler.get_jobs()
+        if job.id.startswith('wxread_') and job.next_run_time and job.next_run_time <= horizon
+    )
+
+def prewarm_upstream():
+    """在下一分钟有阅读任务触发时，提前建立到微信读书的keep-alive连接"""
+    try:
+        due = count_due_jobs(datetime.now().astimezone() + timedelta(seconds=60))
+        if due:
+            logger.info(f"{due} reading jobs due within a minute, prewarming upstream connections")
+            reading_engine.prewarm(due)
+    except Exception as e:
+        logger.error(f"Error prewarming upstream connections: {str(e)}")
+
+def schedule_prewarm():
+    """每分钟在任务触发前PREWARM_LEAD_SECONDS秒检查一次是否需要预热"""
+    second = (60 - HTTP_CLIENT_CONFIG['PREWARM_LEAD_SECONDS']) % 60
+    scheduler.add_job(prewarm_upstream, 'cron', second=second, id='prewarm_upstream',
+                      jobstore='memory', replace_existing=True)
+
+def schedule_retention():
+    """每天RUN_HOUR点汇总并清理过期的执行日志与系统日志"""
+    scheduler.add_job(run_retention, 'cron', hour=RETENTION_CONFIG['RUN_HOUR'], minute=7, id='retention',
+                      jobstore='memory', replace_existing=True)
+
 def parse_cron_expression(expression):
     """Parse cron expression into APScheduler parameters"""
     try:
@@ -981,9 +1134,63 @@ def parse_cron_expression(expression):
         logger.error(f"Error parsing cron expression: {str(e)}", exc_info=True)
         raise
 
+# 任务列表每页默认与最大条数
+TASKS_PAGE_SIZE = 100
+TASKS_MAX_PAGE_SIZE = 500
+
+def format_time(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else None
+
+def local_time(value):
+    """带时区的时间转换为本地时间，与数据库及APScheduler使用的无时区本地时间比较"""
+    return value.astimezone().replace(tzinfo=None) if value and value.tzinfo else value
+
+def parse_time_arg(name):
+    """解析ISO格式的时间查询参数，未提供时返回None；带时区的时间转换为本地时间"""
+    value = request.args.get(name)
+    return local_time(datetime.fromisoformat(value)) if value else None
+
+def encode_cursor(auth_code):
+    return base64.urlsafe_b64encode(auth_code.encode()).decode()
+
+def decode_cursor(cursor):
+    return base64.urlsafe_b64decode(cursor.encode()).decode()
+
+def memory_next_runs(auth_code=None):
+    """内存任务存储中授权码 -> 下次运行时间，auth_code为None时返回全部任务"""
+    jobs = [scheduler.get_job(f"wxread_{auth_code}")] if auth_code else scheduler.get_jobs()
+    return {job.id[len('wxread_'):]: local_time(job.next_run_time)
+            for job in jobs if job and job.id.startswith('wxread_')}
+
+def tasks_etag(cursor, auth_code, next_runs):
+    """根据可见任务的版本计算任务列表的ETag，不执行分页查询
+
+    版本由record的行数与最大updated_at、任务的数量与下次运行时间组成，再加上查询参数。
+    """
+    scope, params = ("WHERE authorization_code = %s", (auth_code,)) if auth_code else ("", ())
+    cursor.execute(RECORD_VERSION_SQL.format(scope=scope), params)
+    version = [cursor.fetchone()]
+    if next_runs is None:
+        job_scope, job_params = (("AND id = %s", (f"wxread_{auth_code}",)) if auth_code else ("", ()))
+        cursor.execute(JOBS_VERSION_SQL.format(scope=job_scope), job_params)
+        version.append(cursor.fetchone())
+    else:
+        version.append(sorted(next_runs.items()))
+    version.append(sorted(request.args.items(multi=True)))
+    return hashlib.sha1(json.dumps(version, default=str).encode()).hexdigest()
+
 @app.route('/api/tasks', methods=['GET'])
 def get_scheduled_tasks():
-    """查询当前的所有定时任务，支持根据授权码筛选"""
+    """查询定时任务，支持根据授权码筛选
+
+    record与任务表在一次查询中关联得到下次运行时间，按授权码游标分页。
+    查询参数：
+        auth_code: 授权码，管理员授权码可查看全部任务
+        status: active / inactive / all（默认）
+        next_run_after, next_run_before: 下次运行时间窗口（ISO格式）
+        limit: 每页条数，cursor: 上一页返回的next_cursor
+    响应带有ETag，内容未变化时在执行分页查询之前返回304。
+    """
     try:
         logger.info("Received request to get scheduled tasks")
         
@@ -999,77 +1206,151 @@ def get_scheduled_tasks():
         # 检查是否是管理员授权码
         is_admin = auth_code == APP_CONFIG.get('ADMIN_AUTH_CODE', 'admin')
         logger.info(f"Is admin: {is_admin}")
-        
-        # 获取所有定时任务
-        jobs = scheduler.get_jobs()
-        logger.info(f"Found {len(jobs)} scheduled jobs")
-        
-        # 准备结果列表
+
+        try:
+            status = request.args.get('status', 'all')
+            if status not in ('active', 'inactive', 'all'):
+                raise ValueError(f"invalid status: {status}")
+            limit = min(max(request.args.get('limit', TASKS_PAGE_SIZE, type=int), 1), TASKS_MAX_PAGE_SIZE)
+            cursor_arg = request.args.get('cursor')
+            after_code = decode_cursor(cursor_arg) if cursor_arg else None
+            next_run_after = parse_time_arg('next_run_after')
+            next_run_before = parse_time_arg('next_run_before')
+        except ValueError as e:
+            return jsonify({'success': False, 'error': f'无效的查询参数: {str(e)}'}), 400
+
+        use_jobstore_table = SCHEDULER_CONFIG['JOBSTORE'] == 'mysql'
+        # 内存任务存储：下次运行时间只在本进程中，先取出可见任务的下次运行时间
+        next_runs = None if use_jobstore_table else memory_next_runs(None if is_admin else auth_code)
+
+        matched = None
+        if not use_jobstore_table and (next_run_after or next_run_before):
+            # 先按时间窗口筛出授权码再分页，否则筛掉的行会让某一页变少甚至为空
+            matched = [code for code, next_run_time in next_runs.items()
+                       if next_run_time
+                       and (not next_run_after or next_run_time >= next_run_after)
+                       and (not next_run_before or next_run_time < next_run_before)]
+        query, params = tasks_page_query(
+            limit + 1, use_jobstore_table,
+            auth_code=None if is_admin else auth_code,
+            status=status,
+            after_code=after_code,
+            next_run_after=next_run_after.timestamp() if next_run_after else None,
+            next_run_before=next_run_before.timestamp() if next_run_before else None,
+            codes=matched,
+        )
+
+        with get_db_connection() as connection, connection.cursor() as cursor:
+            etag = tasks_etag(cursor, None if is_admin else auth_code, next_runs)
+            if request.if_none_match.contains(etag):
+                connection.commit()
+                response = Response(status=304)
+                response.cache_control.no_cache = True
+                response.set_etag(etag)
+                return response
+
+            # 一次查询取出整页数据
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            connection.commit()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
         tasks = []
-        logger.info(f"Starting to iterate over jobs")
-        
-        # 获取数据库连接
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        
-        for job in jobs:
-            logger.info(f"Processing job: {job}")
-            # 从job_id中提取授权码
-            job_id = job.id
-            job_auth_code = job_id[7:]  # 去掉'wxread_'前缀
-            
-            # 如果不是管理员，只显示匹配的任务
-            if not is_admin and job_auth_code != auth_code:
-                logger.info(f"Skipping job {job_id} - not matching auth code")
-                continue
-            
-            # 从数据库获取任务的详细信息
-            cursor.execute("""
-                SELECT single_read_time_seconds, created_at, is_active, last_validated_at
-                FROM record
-                WHERE authorization_code = %s
-            """, (job_auth_code,))
-            record = cursor.fetchone()
-            
-            # 获取任务的下次运行时间
-            next_run_time = job.next_run_time
-            if next_run_time:
-                # 确保时间与系统时间一致
-                next_run_time = next_run_time.astimezone()
-                next_run_time = next_run_time.strftime('%Y-%m-%d %H:%M:%S')
-
-            # 构建任务信息
-            task_info = {
-                'job_id': job_id,
+        for row in rows:
+            job_auth_code = row['authorization_code']
+            if use_jobstore_table:
+                next_run_time = datetime.fromtimestamp(row['next_run_time']) if row['next_run_time'] else None
+            else:
+                next_run_time = next_runs.get(job_auth_code)
+
+            tasks.append({
+                'job_id': f"wxread_{job_auth_code}",
                 'auth_code': job_auth_code,
-                'next_run_time': next_run_time,
-                'cron_expression': job.trigger.fields_str if hasattr(job.trigger, 'fields_str') else str(job.trigger),
-                'reading_time_minutes': record['single_read_time_seconds'] // 60 if record else None,
-                'created_at': record['created_at'].strftime('%Y-%m-%d %H:%M:%S') if record and record['created_at'] else None,
-                'is_active': record['is_active'] if record else False,
-                'last_validated_at': record['last_validated_at'].strftime('%Y-%m-%d %H:%M:%S') if record and record['last_validated_at'] else None
-            }
+                'next_run_time': format_time(next_run_time),
+                'cron_expression': row['run_time_config'],
+                'reading_time_minutes': row['single_read_time_seconds'] // 60,
+                'created_at': format_time(row['created_at']),
+                'is_active': bool(row['is_active']),
+                'last_validated_at': format_time(row['last_validated_at'])
+            })
 
-            tasks.append(task_info)
-        
-        # 关闭数据库连接
-        cursor.close()
-        connection.close()
-        
         logger.info(f"Returning {len(tasks)} tasks")
-        return jsonify({
+        response = jsonify({
             'success': True,
             'tasks': tasks,
-            'total': len(tasks)
+            'total': len(tasks),
+            'has_more': has_more,
+            'next_cursor': encode_cursor(rows[-1]['authorization_code']) if has_more else None
         })
+        response.cache_control.no_cache = True
+        response.set_etag(etag)
+        return response
         
     except Exception as e:
         logger.error(f"Error getting scheduled tasks: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/tasks/history', methods=['GET'])
+def get_task_history():
+    """按天汇总的执行历史，读取execution_daily_summary，明细被清理后仍可查询
+
+    查询参数：auth_code（必填），days（默认30，最多366）
+    """
+    auth_code = request.args.get('auth_code')
+    if not auth_code:
+        return jsonify({'success': False, 'error': '必须提供授权码'}), 400
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    try:
+        rows = daily_history(auth_code, days)
+    except Exception as e:
+        logger.error(f"Error getting task history: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    history = [{
+        'date': row['run_date'].isoformat(),
+        'runs': int(row['runs']),
+        'successes': int(row['successes']),
+        'failures': int(row['failures']),
+        'read_count': int(row['read_count']),
+        'first_start_time': row['first_start_time'].isoformat() if row['first_start_time'] else None,
+        'last_end_time': row['last_end_time'].isoformat() if row['last_end_time'] else None,
+    } for row in rows]
+    return jsonify({'success': True, 'history': history})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus指标"""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
 if __name__ == '__main__':
+    # 启动异步阅读引擎
+    reading_engine.start()
+
+    # 多进程部署时按存活进程数平分上游速率额度；distributed模式下阅读由worker节点执行，
+    # 本进程不登记，额度只在worker之间平分
+    if SCHEDULER_CONFIG['MODE'] != 'distributed':
+        rate_limiter.start_coordination()
+
+    # 后台补充未使用的授权码
+    code_pool.start()
+
+    # 发送push_outbox中待重试的推送消息
+    push_dispatcher.start()
+
+    # 预先启动二维码登录使用的浏览器
+    browser_pool.start()
+
     # 加载定时任务
     load_scheduled_tasks()
+    schedule_prewarm()
+    schedule_retention()
+
+    # 继续当天被中断的阅读任务（distributed模式下由worker节点在租约过期后接管）
+    if SCHEDULER_CONFIG['MODE'] != 'distributed':
+        resume_interrupted_runs()
     
     # 启动Flask应用
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,87 @@
+# bench_signing.py 签名性能基准：对比main中的参考实现与signing中的快速实现，并逐字节校验结果
+import argparse
+import json
+import random
+import sys
+import time
+
+from config import data
+from main import KEY, encode_data, cal_hash
+from signing import ReadSigner, fast_cal_hash
+
+
+def reference_payload(values):
+    """按main.execute_reading的方式构造请求体"""
+    request_data = data.copy()
+    request_data.update(values)
+    request_data['s'] = cal_hash(encode_data(request_data))
+    return json.dumps(request_data, separators=(',', ':'))
+
+
+def random_time_fields():
+    ct = random.randint(1_600_000_000, 2_000_000_000)
+    return {'ct': ct, 'ts': ct * 1000 + random.randint(0, 999), 'rn': random.randint(0, 1000)}
+
+
+def verify(signer, samples):
+    """随机取样，比较encode、cal_hash和完整请求体是否与参考实现逐字节一致"""
+    for _ in range(samples):
+        values = signer.fields(**random_time_fields())
+        request_data = dict(data, **values)
+        if signer.encode(values) != encode_data(request_data):
+            return f"encode mismatch for {values}"
+        encoded = encode_data(request_data)
+        if fast_cal_hash(encoded) != cal_hash(encoded):
+            return f"cal_hash mismatch for {values}"
+        fast = signer.payload(ct=values['ct'], ts=values['ts'], rn=values['rn']).encode()
+        if fast != reference_payload(values).encode():
+            return f"payload mismatch for {values}"
+
+    # 非模板输入（包含非ASCII字符、各种长度）也要与参考实现一致
+    for length in range(0, 300):
+        text = ''.join(random.choice('abc%&=0123456789插图') for _ in range(length))
+        if fast_cal_hash(text) != cal_hash(text):
+            return f"cal_hash mismatch for input of length {length}"
+    return None
+
+
+def bench(name, fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    rate = iterations / elapsed
+    print(f"{name:<28} {rate:>12,.0f} signatures/sec  ({elapsed * 1e6 / iterations:.2f} µs/op)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark read request signing")
+    parser.add_argument('-n', '--iterations', type=int, default=20000)
+    parser.add_argument('--samples', type=int, default=2000, help="number of random payloads to verify")
+    args = parser.parse_args()
+
+    signer = ReadSigner(data, KEY)
+    error = verify(signer, args.samples)
+    if error:
+        print(f"FAILED: {error}")
+        return 1
+    print(f"verified {args.samples} payloads byte for byte against main.encode_data/main.cal_hash")
+
+    fixed = signer.fields(**random_time_fields())
+    encoded = signer.encode(fixed)
+
+    print("\ncal_hash only")
+    ref_hash = bench("main.cal_hash", lambda: cal_hash(encoded), args.iterations)
+    fast_hash = bench("signing.fast_cal_hash", lambda: fast_cal_hash(encoded), args.iterations)
+
+    print("\nfull payload (fields + encode + hash + json)")
+    ref_payload = bench("reference", lambda: reference_payload(signer.fields()), args.iterations)
+    fast_payload = bench("ReadSigner.payload", signer.payload, args.iterations)
+
+    print(f"\nspeedup: cal_hash x{fast_hash / ref_hash:.1f}, payload x{fast_payload / ref_payload:.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+# browser_pool.py 预启动的Playwright浏览器池，供二维码登录复用
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+from playwright.sync_api import sync_playwright
+
+from config import BROWSER_POOL_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+def process_tree_rss_mb(pid=None):
+    """统计指定进程所有子孙进程的常驻内存(MB)，仅支持Linux，读取失败返回0"""
+    pid = pid or os.getpid()
+    try:
+        children = {}
+        rss = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/status') as f:
+                    fields = dict(line.split(':', 1) for line in f if ':' in line)
+            except OSError:
+                continue
+            ppid = int(fields.get('PPid', '0').strip())
+            children.setdefault(ppid, []).append(int(entry))
+            rss[int(entry)] = int(fields.get('VmRSS', '0 kB').split()[0])
+
+        total, stack = 0, list(children.get(pid, []))
+        while stack:
+            child = stack.pop()
+            total += rss.get(child, 0)
+            stack.extend(children.get(child, []))
+        return total / 1024
+    except Exception:
+        return 0
+
+
+class BrowserSlot(threading.Thread):
+    """持有一个Playwright实例和一个Chromium进程的工作线程
+
+    Playwright的同步API只能在创建它的线程中使用，所以每个浏览器都绑定一个线程，
+    登录任务在该线程中执行。
+    """
+
+    def __init__(self, pool, index):
+        super().__init__(name=f'browser-slot-{index}', daemon=True)
+        self.pool = pool
+        self.playwright = None
+        self.browser = None
+        self.sessions = 0
+
+    def launch(self):
+        logger.info(f"[{self.name}] Launching browser")
+        self.playwright = sync_playwright().start()
+        self.browser = self.playwright.chromium.launch(
+            headless=True,
+            args=['--no-sandbox']
+        )
+        self.sessions = 0
+        logger.info(f"[{self.name}] Browser launched successfully")
+
+    def shutdown(self):
+        try:
+            if self.browser:
+                self.browser.close()
+            if self.playwright:
+                self.playwright.stop()
+        except Exception as e:
+            logger.error(f"[{self.name}] Error closing browser: {str(e)}")
+        finally:
+            self.browser = None
+            self.playwright = None
+
+    def needs_recycle(self):
+        if not self.browser or not self.browser.is_connected():
+            return True
+        if self.sessions >= self.pool.max_sessions:
+            logger.info(f"[{self.name}] Served {self.sessions} sessions, recycling browser")
+            return True
+        if self.pool.max_rss_mb:
+            rss = process_tree_rss_mb() / max(1, self.pool.size)
+            if rss > self.pool.max_rss_mb:
+                logger.info(f"[{self.name}] Browser memory {rss:.0f}MB over threshold, recycling browser")
+                return True
+        return False
+
+    def run(self):
+        try:
+            self.launch()
+        except Exception as e:
+            logger.error(f"[{self.name}] Error setting up browser: {str(e)}", exc_info=True)
+
+        while True:
+            item = self.pool._jobs.get()
+            if item is None:
+                break
+            future, fn, args = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if self.needs_recycle():
+                    self.shutdown()
+                    self.launch()
+                self.sessions += 1
+                future.set_result(fn(self.browser, *args))
+            except Exception as e:
+                logger.error(f"[{self.name}] Browser job failed: {str(e)}", exc_info=True)
+                future.set_exception(e)
+
+        self.shutdown()
+
+
+class BrowserPool:
+    """固定大小的浏览器池
+
+    浏览器在启动时预先拉起，任务通过submit提交，以fn(browser, *args)的形式
+    在空闲浏览器的线程中执行；每个任务应使用自己的browser.new_context()保持隔离。
+    """
+
+    def __init__(self, size=None, max_sessions=None, max_rss_mb=None):
+        self.size = size or BROWSER_POOL_CONFIG['SIZE']
+        self.max_sessions = max_sessions or BROWSER_POOL_CONFIG['MAX_SESSIONS_PER_BROWSER']
+        self.max_rss_mb = max_rss_mb if max_rss_mb is not None else BROWSER_POOL_CONFIG['MAX_RSS_MB']
+        self._jobs = queue.Queue()
+        self._slots = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._slots:
+                return
+            self._slots = [BrowserSlot(self, i) for i in range(self.size)]
+            for slot in self._slots:
+                slot.start()
+        logger.info(f"Browser pool started with {self.size} browsers")
+
+    def submit(self, fn, *args):
+        """提交一个浏览器任务，返回concurrent.futures.Future"""
+        self.start()
+        future = Future()
+        self._jobs.put((future, fn, args))
+        return future
+
+    def queued(self):
+        return self._jobs.qsize()
+
+    def stop(self):
+        with self._lock:
+            slots, self._slots = self._slots, []
+        for _ in slots:
+            self._jobs.put(None)
+        for slot in slots:
+            slot.join(timeout=30)
+
+
+browser_pool = BrowserPool()
@@ -110,8 +110,37 @@ DB_CONFIG = {
     'port': int(os.getenv('DB_PORT', 3306))
 }
 
+# Database connection pool configuration
+DB_POOL_CONFIG = {
+    'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', 20)),
+    # 借出连接时最多等待的秒数
+    'MAX_WAIT': float(os.getenv('DB_POOL_MAX_WAIT', 10)),
+    # 空闲超过该秒数的连接会被回收
+    'IDLE_TIMEOUT': int(os.getenv('DB_POOL_IDLE_TIMEOUT', 300)),
+    # 空闲超过该秒数的连接在借出前先ping检查，0表示每次借出都检查
+    'HEALTH_CHECK_AFTER': int(os.getenv('DB_POOL_HEALTH_CHECK_AFTER', 30)),
+}
+
 
 
+# system_log batched writer configuration
+SYSTEM_LOG_CONFIG = {
+    # 缓冲队列上限，超出后新事件被丢弃并计数
+    'QUEUE_SIZE': int(os.getenv('SYSTEM_LOG_QUEUE_SIZE', 10000)),
+    'BATCH_SIZE': int(os.getenv('SYSTEM_LOG_BATCH_SIZE', 200)),
+    'FLUSH_INTERVAL': float(os.getenv('SYSTEM_LOG_FLUSH_INTERVAL', 2)),
+}
+
+# 授权码池：后台任务保持足够的未使用授权码
+AUTH_CODE_CONFIG = {
+    # 未使用授权码的目标数量
+    'POOL_SIZE': int(os.getenv('AUTH_CODE_POOL_SIZE', 1000)),
+    # 每次批量插入的条数；消耗这么多授权码后立即补充，否则每REFILL_INTERVAL秒检查一次
+    'REFILL_CHUNK': int(os.getenv('AUTH_CODE_REFILL_CHUNK', 200)),
+    'REFILL_INTERVAL': int(os.getenv('AUTH_CODE_REFILL_INTERVAL', 300)),
+    'LENGTH': int(os.getenv('AUTH_CODE_LENGTH', 8)),
+}
+
 # Application configuration
 APP_CONFIG = {
     'SECRET_KEY': os.getenv('SECRET_KEY', 'your-secret-key-here'),
@@ -119,16 +148,173 @@ APP_CONFIG = {
     'HOST': os.getenv('HOST', '0.0.0.0'),
     'PORT': int(os.getenv('PORT', 5000)),
     'CORS_ORIGINS': os.getenv('CORS_ORIGINS', '*').split(','),
-    'QRCODE_SESSION_TIMEOUT': int(os.getenv('QRCODE_SESSION_TIMEOUT', 300))  # 5 minutes
+    'QRCODE_SESSION_TIMEOUT': int(os.getenv('QRCODE_SESSION_TIMEOUT', 300)),  # 5 minutes
+    # 二维码登录时中止图片、字体、音视频请求，减少页面加载时间和流量
+    'QRCODE_BLOCK_RESOURCES': os.getenv('QRCODE_BLOCK_RESOURCES', 'False').lower() == 'true'
+}
+
+# 日志配置
+LOG_CONFIG = {
+    # 根日志级别，TRACE会额外输出请求头、cookie、请求体和响应内容
+    'LEVEL': os.getenv('LOG_LEVEL', 'INFO'),
+    # 日志文件按大小轮转
+    'MAX_BYTES': int(os.getenv('LOG_MAX_BYTES', 50 * 1024 * 1024)),
+    'BACKUP_COUNT': int(os.getenv('LOG_BACKUP_COUNT', 5)),
+    # 等待后台线程写出的日志条数上限，超出后丢弃
+    'QUEUE_SIZE': int(os.getenv('LOG_QUEUE_SIZE', 10000)),
+    # 阅读循环中每个日志位置每HOT_PATH_INTERVAL秒最多输出HOT_PATH_BURST条INFO及以下日志
+    'HOT_PATH_BURST': int(os.getenv('LOG_HOT_PATH_BURST', 20)),
+    'HOT_PATH_INTERVAL': float(os.getenv('LOG_HOT_PATH_INTERVAL', 60)),
 }
 
 # WeChat Reading configuration
+# 指向本地的mock_weread.py即可在离线环境中运行与压测
+WXREAD_BASE_URL = os.getenv('WXREAD_BASE_URL', 'https://weread.qq.com').rstrip('/')
 WXREAD_CONFIG = {
-    'BASE_URL': 'https://weread.qq.com',
-    'LOGIN_URL': 'https://weread.qq.com/login',
+    'BASE_URL': WXREAD_BASE_URL,
+    'LOGIN_URL': f'{WXREAD_BASE_URL}/login',
     'USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 }
 
+# Reading engine configuration
+READER_CONFIG = {
+    # 单次阅读的间隔秒数，与接口的rt字段对应
+    'READ_INTERVAL_SECONDS': int(os.getenv('READ_INTERVAL_SECONDS', 30)),
+    # 异步引擎与微信读书之间的最大并发连接数
+    'MAX_CONNECTIONS': int(os.getenv('READER_MAX_CONNECTIONS', 200)),
+    'REQUEST_TIMEOUT': int(os.getenv('READER_REQUEST_TIMEOUT', 15)),
+    # 每完成多少次阅读保存一次进度检查点
+    'CHECKPOINT_EVERY': int(os.getenv('READER_CHECKPOINT_EVERY', 10)),
+    # wr_skey刷新后超过该秒数即视为即将过期，在下一次阅读前主动刷新
+    'SKEY_MAX_AGE': int(os.getenv('READER_SKEY_MAX_AGE', 3600)),
+    # 记住最近刷新得到的密钥的账号数
+    'SKEY_CACHE_SIZE': int(os.getenv('READER_SKEY_CACHE_SIZE', 10000)),
+}
+
+# record row cache configuration
+RECORD_CACHE_CONFIG = {
+    'MAX_SIZE': int(os.getenv('RECORD_CACHE_MAX_SIZE', 10000)),
+    'TTL': int(os.getenv('RECORD_CACHE_TTL', 300)),
+}
+
+# Credential validation configuration
+VALIDATION_CONFIG = {
+    # 验证结果按凭证缓存的秒数，失败结果缓存时间较短
+    'CACHE_TTL': int(os.getenv('VALIDATION_CACHE_TTL', 3600)),
+    'FAILURE_CACHE_TTL': int(os.getenv('VALIDATION_FAILURE_CACHE_TTL', 60)),
+    'CACHE_MAX_SIZE': int(os.getenv('VALIDATION_CACHE_MAX_SIZE', 10000)),
+    # 后台验证任务的线程数与结果保留秒数
+    'WORKERS': int(os.getenv('VALIDATION_WORKERS', 8)),
+    'JOB_TTL': int(os.getenv('VALIDATION_JOB_TTL', 3600)),
+}
+
+# Scheduled run admission configuration
+SCHEDULER_CONFIG = {
+    # 同时进行的阅读任务上限，超出的任务按加入抖动后的开始时间排队，时间最早的先获得空位
+    'MAX_CONCURRENT_RUNS': int(os.getenv('SCHEDULER_MAX_CONCURRENT_RUNS', 1000)),
+    # 每个任务开始前随机延迟0~N秒，打散整点集中触发
+    'START_JITTER_SECONDS': int(os.getenv('SCHEDULER_START_JITTER_SECONDS', 120)),
+    'QUEUE_SIZE': int(os.getenv('SCHEDULER_QUEUE_SIZE', 100000)),
+    # 执行任务启动阶段（查询配置、写执行日志）的线程数
+    'START_WORKERS': int(os.getenv('SCHEDULER_START_WORKERS', 8)),
+    # 定时任务存储：mysql持久化到apscheduler_jobs表，memory仅保存在内存中
+    'JOBSTORE': os.getenv('SCHEDULER_JOBSTORE', 'mysql'),
+    # 按record.updated_at增量同步定时任务的间隔秒数
+    'RECONCILE_INTERVAL': int(os.getenv('SCHEDULER_RECONCILE_INTERVAL', 60)),
+    'RECONCILE_BATCH_SIZE': int(os.getenv('SCHEDULER_RECONCILE_BATCH_SIZE', 1000)),
+    # 水位线落后数据库当前时间的秒数，覆盖提交较晚的事务
+    'RECONCILE_LAG_SECONDS': int(os.getenv('SCHEDULER_RECONCILE_LAG_SECONDS', 5)),
+    # local：本进程执行触发的任务；distributed：只写入run_queue表，由worker.py节点领取执行
+    'MODE': os.getenv('SCHEDULER_MODE', 'local'),
+}
+
+# 访问微信读书各接口的速率限制（每秒请求数与突发容量），0表示不限制
+RATE_LIMIT_CONFIG = {
+    'READ_RATE': float(os.getenv('RATE_LIMIT_READ_RATE', 50)),
+    'READ_BURST': int(os.getenv('RATE_LIMIT_READ_BURST', 100)),
+    'RENEWAL_RATE': float(os.getenv('RATE_LIMIT_RENEWAL_RATE', 5)),
+    'RENEWAL_BURST': int(os.getenv('RATE_LIMIT_RENEWAL_BURST', 10)),
+    'USER_INFO_RATE': float(os.getenv('RATE_LIMIT_USER_INFO_RATE', 10)),
+    'USER_INFO_BURST': int(os.getenv('RATE_LIMIT_USER_INFO_BURST', 20)),
+    # none：每个进程独立使用上述额度；mysql：上述额度为所有进程的总额度，按存活进程数平分
+    'COORDINATION': os.getenv('RATE_LIMIT_COORDINATION', 'none'),
+    'SYNC_INTERVAL': int(os.getenv('RATE_LIMIT_SYNC_INTERVAL', 15)),
+}
+
+# 历史数据保留：超过保留天数的执行日志先汇总到execution_daily_summary再删除，0表示永久保留
+RETENTION_CONFIG = {
+    'EXECUTION_LOG_DAYS': int(os.getenv('RETENTION_EXECUTION_LOG_DAYS', 90)),
+    'SYSTEM_LOG_DAYS': int(os.getenv('RETENTION_SYSTEM_LOG_DAYS', 30)),
+    # 每批删除的行数与批次之间的间隔秒数，每批是一个短事务
+    'BATCH_SIZE': int(os.getenv('RETENTION_BATCH_SIZE', 1000)),
+    'BATCH_PAUSE': float(os.getenv('RETENTION_BATCH_PAUSE', 0.2)),
+    # 每天执行清理的时刻（小时）
+    'RUN_HOUR': int(os.getenv('RETENTION_RUN_HOUR', 4)),
+    # system_log已按天分区时（python retention.py --partition-system-log）以删除分区代替逐行删除
+    'PARTITION_DAYS_AHEAD': int(os.getenv('RETENTION_PARTITION_DAYS_AHEAD', 7)),
+}
+
+# 多节点worker通过run_queue表租约领取任务
+RUN_QUEUE_CONFIG = {
+    # 每个worker节点同时持有的任务上限
+    'CAPACITY': int(os.getenv('RUN_QUEUE_CAPACITY', 500)),
+    # 租约时长，节点超过该时间没有续约时任务可被其他节点接管
+    'LEASE_SECONDS': int(os.getenv('RUN_QUEUE_LEASE_SECONDS', 90)),
+    'HEARTBEAT_INTERVAL': int(os.getenv('RUN_QUEUE_HEARTBEAT_INTERVAL', 30)),
+    'POLL_INTERVAL': float(os.getenv('RUN_QUEUE_POLL_INTERVAL', 2)),
+    'CLAIM_BATCH_SIZE': int(os.getenv('RUN_QUEUE_CLAIM_BATCH_SIZE', 50)),
+    # 同一授权码在该时间窗口内只入队一次（多个调度器同时触发同一任务时去重）
+    'DEDUP_WINDOW': int(os.getenv('RUN_QUEUE_DEDUP_WINDOW', 300)),
+    'MAX_ATTEMPTS': int(os.getenv('RUN_QUEUE_MAX_ATTEMPTS', 3)),
+    # worker.py暴露Prometheus指标的端口，0表示不启动
+    'METRICS_PORT': int(os.getenv('WORKER_METRICS_PORT', 9100)),
+}
+
+# 推送通知的后台发送队列
+PUSH_CONFIG = {
+    # 等待合并的通知条数上限，超出后新通知被丢弃并计数
+    'QUEUE_SIZE': int(os.getenv('PUSH_QUEUE_SIZE', 10000)),
+    # 同一渠道同一接收方在该时间窗口内的通知合并为一条消息
+    'DIGEST_WINDOW': float(os.getenv('PUSH_DIGEST_WINDOW', 10)),
+    'DIGEST_MAX_ITEMS': int(os.getenv('PUSH_DIGEST_MAX_ITEMS', 50)),
+    'DIGEST_MAX_CHARS': int(os.getenv('PUSH_DIGEST_MAX_CHARS', 4000)),
+    # 扫描push_outbox表中到期消息的间隔秒数与每次发送的条数
+    'POLL_INTERVAL': float(os.getenv('PUSH_POLL_INTERVAL', 10)),
+    'BATCH_SIZE': int(os.getenv('PUSH_BATCH_SIZE', 100)),
+    # 发送失败后随机等待RETRY_MIN~RETRY_MAX秒重试，最多MAX_ATTEMPTS次
+    'MAX_ATTEMPTS': int(os.getenv('PUSH_MAX_ATTEMPTS', 5)),
+    'RETRY_MIN': int(os.getenv('PUSH_RETRY_MIN', 180)),
+    'RETRY_MAX': int(os.getenv('PUSH_RETRY_MAX', 360)),
+    # 领取的消息在该秒数内不会被其他进程重复领取
+    'CLAIM_LEASE': int(os.getenv('PUSH_CLAIM_LEASE', 300)),
+    # 并发发送消息的线程数，也是每个渠道会话的连接池大小
+    'WORKERS': int(os.getenv('PUSH_WORKERS', 16)),
+    'TIMEOUT': int(os.getenv('PUSH_TIMEOUT', 10)),
+    # 建立连接的超时秒数，Telegram代理不可用时尽快改为直连
+    'CONNECT_TIMEOUT': float(os.getenv('PUSH_CONNECT_TIMEOUT', 5)),
+}
+
+# WeRead HTTP client configuration
+HTTP_CLIENT_CONFIG = {
+    # 所有会话共享的keep-alive连接池大小
+    'POOL_MAXSIZE': int(os.getenv('HTTP_POOL_MAXSIZE', 50)),
+    # 按凭证缓存的会话数量上限
+    'MAX_SESSIONS': int(os.getenv('HTTP_MAX_SESSIONS', 1000)),
+    'TIMEOUT': int(os.getenv('HTTP_TIMEOUT', 15)),
+    # 定时任务集中触发前多少秒预热连接
+    'PREWARM_LEAD_SECONDS': int(os.getenv('HTTP_PREWARM_LEAD_SECONDS', 15)),
+}
+
+# Playwright browser pool configuration (QR code login)
+BROWSER_POOL_CONFIG = {
+    # 预先启动的Chromium数量，同时也是可并发处理的二维码登录会话数
+    'SIZE': int(os.getenv('BROWSER_POOL_SIZE', 2)),
+    # 单个浏览器处理多少个登录会话后重启
+    'MAX_SESSIONS_PER_BROWSER': int(os.getenv('BROWSER_MAX_SESSIONS', 50)),
+    # 浏览器进程树平均内存超过该值(MB)时重启，0表示不限制
+    'MAX_RSS_MB': int(os.getenv('BROWSER_MAX_RSS_MB', 1024)),
+}
+
 # Selenium configuration
 SELENIUM_CONFIG = {
     'HEADLESS': os.getenv('SELENIUM_HEADLESS', 'True').lower() == 'true',
@@ -1,23 +1,44 @@
-import json
 import logging
-import random
+import secrets
 import string
+import threading
 
 import pymysql
 
-from config import DB_CONFIG
+from config import AUTH_CODE_CONFIG, DB_CONFIG
+from db_pool import get_db_connection
+from migrations import apply_migrations
+from queries import UNUSED_AUTHORIZATION_CODES_SQL
+from system_log import writer as system_log_writer
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-def generate_authorization_code(length=8):
+def generate_authorization_code(length=None):
     """Generate a random authorization code"""
     characters = string.ascii_letters + string.digits
-    return ''.join(random.choice(characters) for _ in range(length))
+    return ''.join(secrets.choice(characters) for _ in range(length or AUTH_CODE_CONFIG['LENGTH']))
+
+def insert_authorization_codes(connection, count, chunk_size=None):
+    """分批生成并插入count个授权码，每批一条INSERT并提交，返回实际插入的条数"""
+    chunk_size = chunk_size or AUTH_CODE_CONFIG['REFILL_CHUNK']
+    inserted = 0
+    with connection.cursor() as cursor:
+        for start in range(0, count, chunk_size):
+            chunk = [(generate_authorization_code(),) for _ in range(min(chunk_size, count - start))]
+            # 与已有授权码重复的行被忽略，差额留给下次补充
+            inserted += cursor.executemany("INSERT IGNORE INTO authorization_codes (code) VALUES (%s)", chunk)
+            connection.commit()
+    return inserted
+
+def ensure_column(cursor, table, column, definition):
+    """Add a column to an existing table if it is missing"""
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    if cursor.fetchone()[0] == 0:
+        logger.info(f"Adding column {table}.{column}")
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
 
 def init_database():
     """Initialize database and tables"""
@@ -45,6 +66,8 @@ def init_database():
                     user_info JSON,
                     is_active BOOLEAN DEFAULT TRUE,
                     last_validated_at TIMESTAMP NULL,
+                    skey_renewed_at TIMESTAMP NULL,
+                    notify_channels JSON NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
                     credentials JSON NOT NULL
@@ -60,10 +83,24 @@ def init_database():
                     end_time TIMESTAMP NULL,
                     status ENUM('running', 'success', 'failure', 'invalid_credentials') NOT NULL,
                     details TEXT,
+                    read_count INTEGER NULL,
+                    success_count INTEGER NOT NULL DEFAULT 0,
+                    checkpoint_at TIMESTAMP NULL,
                     FOREIGN KEY (authorization_code) REFERENCES record(authorization_code)
                 )
             """)
             
+            # 已存在的record补充密钥刷新时间字段
+            ensure_column(cursor, 'record', 'skey_renewed_at', 'TIMESTAMP NULL')
+
+            # 已存在的record补充用户自己的推送渠道配置字段
+            ensure_column(cursor, 'record', 'notify_channels', 'JSON NULL')
+
+            # 已存在的execution_log补充阅读进度检查点字段
+            ensure_column(cursor, 'execution_log', 'read_count', 'INTEGER NULL')
+            ensure_column(cursor, 'execution_log', 'success_count', 'INTEGER NOT NULL DEFAULT 0')
+            ensure_column(cursor, 'execution_log', 'checkpoint_at', 'TIMESTAMP NULL')
+            
             # Create qrcode_sessions table
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS qrcode_sessions (
@@ -98,24 +135,92 @@ def init_database():
                 )
             """)
             
+            # Create scheduler_state table (增量同步定时任务的水位线等调度器状态)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS scheduler_state (
+                    name VARCHAR(64) PRIMARY KEY,
+                    value VARCHAR(255) NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Create rate_limit_nodes table (按存活进程数平分上游速率额度)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limit_nodes (
+                    node_id VARCHAR(128) PRIMARY KEY,
+                    heartbeat_at DATETIME NOT NULL
+                )
+            """)
+
+            # Create run_queue table (多节点worker按租约领取的待执行任务)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS run_queue (
+                    run_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                    authorization_code VARCHAR(64) NOT NULL,
+                    scheduled_at DATETIME NOT NULL,
+                    status ENUM('pending', 'claimed', 'done', 'failed') NOT NULL DEFAULT 'pending',
+                    owner VARCHAR(128),
+                    attempts INT NOT NULL DEFAULT 0,
+                    claimed_at DATETIME,
+                    lease_expires_at DATETIME,
+                    finished_at DATETIME,
+                    INDEX idx_run_queue_claim (status, lease_expires_at),
+                    INDEX idx_run_queue_code (authorization_code, scheduled_at)
+                )
+            """)
+
+            # Create execution_daily_summary table (execution_log按授权码与日期汇总，明细过期删除后仍可查询历史)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS execution_daily_summary (
+                    authorization_code VARCHAR(64) NOT NULL,
+                    run_date DATE NOT NULL,
+                    runs INT NOT NULL DEFAULT 0,
+                    successes INT NOT NULL DEFAULT 0,
+                    failures INT NOT NULL DEFAULT 0,
+                    read_count INT NOT NULL DEFAULT 0,
+                    first_start_time TIMESTAMP NULL,
+                    last_end_time TIMESTAMP NULL,
+                    PRIMARY KEY (authorization_code, run_date),
+                    INDEX idx_execution_daily_summary_date (run_date)
+                )
+            """)
+
+            # Create push_outbox table (待发送与待重试的推送消息，每行是一个渠道的一条合并消息)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS push_outbox (
+                    push_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                    channel VARCHAR(20) NOT NULL,
+                    target JSON,
+                    content TEXT NOT NULL,
+                    items INT NOT NULL DEFAULT 1,
+                    status ENUM('pending', 'sent', 'failed') NOT NULL DEFAULT 'pending',
+                    attempts INT NOT NULL DEFAULT 0,
+                    next_attempt_at DATETIME NOT NULL,
+                    last_error VARCHAR(255),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    sent_at DATETIME,
+                    INDEX idx_push_outbox_due (status, next_attempt_at)
+                )
+            """)
+
             # Generate initial authorization codes if needed
-            cursor.execute("SELECT COUNT(*) FROM authorization_codes WHERE is_used = FALSE")
+            cursor.execute(UNUSED_AUTHORIZATION_CODES_SQL)
             result = cursor.fetchone()
             available_codes = result[0] if result else 0
             
-            if available_codes < 1000:
-                codes_to_generate = 1000 - available_codes
-                logger.info(f"Generating {codes_to_generate} new authorization codes")
-                
-                new_codes = [(generate_authorization_code(),) for _ in range(codes_to_generate)]
-                cursor.executemany(
-                    "INSERT IGNORE INTO authorization_codes (code) VALUES (%s)",
-                    new_codes
-                )
-                
-                logger.info(f"Generated {len(new_codes)} new authorization codes")
-            
         connection.commit()
+        if available_codes < AUTH_CODE_CONFIG['POOL_SIZE']:
+            codes_to_generate = AUTH_CODE_CONFIG['POOL_SIZE'] - available_codes
+            logger.info(f"Generating {codes_to_generate} new authorization codes")
+            inserted = insert_authorization_codes(connection, codes_to_generate)
+            logger.info(f"Generated {inserted} new authorization codes")
+
+        connection.close()
+
+        # 热点查询使用的索引等结构变更按版本执行
+        applied = apply_migrations()
+        if applied:
+            logger.info(f"Applied schema migrations: {applied}")
         logger.info("Database and tables created successfully!")
         
     except Exception as e:
@@ -124,79 +229,104 @@ def init_database():
 
 
 def log_system_event(level, message, context=None):
-    """Log system events to the database"""
-    try:
-        connection = pymysql.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            database=DB_CONFIG['database'],
-            charset='utf8mb4'
-        )
-        
-        with connection.cursor() as cursor:
-            sql = """
-                INSERT INTO system_log 
-                (level, message, context)
-                VALUES (%s, %s, %s)
-            """
-            cursor.execute(sql, (
-                level,
-                message,
-                json.dumps(context) if context else None
-            ))
-            
-        connection.commit()
-        
-    except Exception as e:
-        logger.error(f"Error logging system event: {str(e)}")
+    """Log system events to the database
+
+    事件先进入内存缓冲区，由后台线程批量写入system_log，调用方不等待MySQL。
+    """
+    if not system_log_writer.write(level, message, context):
+        logger.warning(f"System log buffer full, dropped event: {message}")
 
 def check_authorization_code(code):
-    """Check if an authorization code is valid and mark it as used"""
+    """Check if an authorization code is valid and mark it as used
+
+    一条条件UPDATE完成检查与占用，并发请求中只有一个能使影响行数为1；补充新授权码由code_pool在后台完成。
+    """
     try:
-        connection = pymysql.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            database=DB_CONFIG['database'],
-            charset='utf8mb4'
-        )
-        
-        with connection.cursor() as cursor:
-            # Check if code exists and is unused
+        with get_db_connection() as connection, connection.cursor() as cursor:
             cursor.execute("""
-                SELECT code FROM authorization_codes 
+                UPDATE authorization_codes
+                SET is_used = TRUE, used_at = CURRENT_TIMESTAMP
                 WHERE code = %s AND is_used = FALSE
             """, (code,))
-            
-            result = cursor.fetchone()
-            
-            if result:
-                # Mark code as used
-                cursor.execute("""
-                    UPDATE authorization_codes 
-                    SET is_used = TRUE, used_at = CURRENT_TIMESTAMP
-                    WHERE code = %s
-                """, (code,))
-                
-                connection.commit()
-                log_system_event('INFO', f'Authorization code {code} used')
-                
-                # Generate new code to maintain count
-                new_code = generate_authorization_code()
-                cursor.execute(
-                    "INSERT INTO authorization_codes (code) VALUES (%s)",
-                    (new_code,)
-                )
-                connection.commit()
-                
-                return True
-                
-            return False
-            
+            connection.commit()
+            if cursor.rowcount != 1:
+                return False
+
+        log_system_event('INFO', f'Authorization code {code} used')
+        code_pool.notify_consumed()
+        return True
+
     except Exception as e:
         logger.error(f"Error checking authorization code: {str(e)}")
         return False
 
+
+class AuthorizationCodePool:
+    """在后台把未使用的授权码补充到POOL_SIZE
+
+    每消耗REFILL_CHUNK个授权码唤醒一次，另外每REFILL_INTERVAL秒检查一次（覆盖其他进程的消耗）；
+    补充时按REFILL_CHUNK分批插入，请求线程不再为每个授权码单独插入一行。
+    """
+
+    def __init__(self, pool_size=None, chunk_size=None, interval=None):
+        self.pool_size = pool_size or AUTH_CODE_CONFIG['POOL_SIZE']
+        self.chunk_size = chunk_size or AUTH_CODE_CONFIG['REFILL_CHUNK']
+        self.interval = interval or AUTH_CODE_CONFIG['REFILL_INTERVAL']
+        self._consumed = 0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {'consumed': 0, 'refills': 0, 'generated': 0, 'available': 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='auth-code-refill', daemon=True)
+            self._thread.start()
+
+    def notify_consumed(self):
+        with self._lock:
+            self._consumed += 1
+            self.stats['consumed'] += 1
+            if self._consumed >= self.chunk_size:
+                self._wake.set()
+
+    def _run(self):
+        while True:
+            self.refill()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def refill(self):
+        """补足未使用的授权码，返回插入的条数"""
+        with self._lock:
+            self._consumed = 0
+        try:
+            with get_db_connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(UNUSED_AUTHORIZATION_CODES_SQL)
+                    available = cursor.fetchone()['available']
+                connection.commit()
+                missing = self.pool_size - available
+                inserted = insert_authorization_codes(connection, missing, self.chunk_size) if missing > 0 else 0
+        except Exception as e:
+            logger.error(f"Error refilling authorization codes: {str(e)}")
+            return 0
+
+        self.stats['available'] = available + inserted
+        if inserted:
+            self.stats['refills'] += 1
+            self.stats['generated'] += inserted
+            logger.info(f"Generated {inserted} new authorization codes")
+        return inserted
+
+
+code_pool = AuthorizationCodePool()
+
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
     init_database() 
\ No newline at end of file
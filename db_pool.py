@@ -0,0 +1,207 @@
+# db_pool.py 进程内共享的MySQL连接池
+import logging
+import threading
+import time
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+
+from config import DB_CONFIG, DB_POOL_CONFIG
+from metrics import DB_POOL_ACQUIRE_SECONDS, DB_QUERY_SECONDS, db_operation
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """在max_wait时间内没有可用连接"""
+
+
+class TimedDictCursor(pymysql.cursors.DictCursor):
+    """记录每条语句（包括executemany拆分出的每个批次）执行耗时的DictCursor"""
+
+    def _query(self, q):
+        started = time.monotonic()
+        try:
+            return super()._query(q)
+        finally:
+            DB_QUERY_SECONDS.labels(db_operation(q)).observe(time.monotonic() - started)
+
+
+class PooledConnection:
+    """从连接池借出的连接
+
+    用法与pymysql连接一致，close()时连接归还连接池而不是真正断开；
+    也可以作为上下文管理器使用。未显式关闭的连接在被回收时自动归还。
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise pymysql.err.InterfaceError("Connection already returned to pool")
+        return getattr(self._conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        if self._conn is not None:
+            logger.warning("Leased connection was not closed, returning it to the pool")
+            self.close()
+
+
+class ConnectionPool:
+    """有界连接池：借出时健康检查、空闲回收、最长等待时间与饱和度计数"""
+
+    def __init__(self, max_size=None, max_wait=None, idle_timeout=None, health_check_after=None, **connect_kwargs):
+        self.max_size = max_size or DB_POOL_CONFIG['MAX_SIZE']
+        self.max_wait = max_wait if max_wait is not None else DB_POOL_CONFIG['MAX_WAIT']
+        self.idle_timeout = idle_timeout if idle_timeout is not None else DB_POOL_CONFIG['IDLE_TIMEOUT']
+        self.health_check_after = (health_check_after if health_check_after is not None
+                                   else DB_POOL_CONFIG['HEALTH_CHECK_AFTER'])
+        self.connect_kwargs = connect_kwargs
+
+        self._idle = []  # [(conn, last_used)]，尾部为最近归还的连接
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.stats = {
+            'created': 0,
+            'closed': 0,
+            'borrowed': 0,
+            'waited': 0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+            'evicted_idle': 0,
+            'peak_in_use': 0,
+        }
+
+    def _connect(self):
+        conn = pymysql.connect(**self.connect_kwargs)
+        self.stats['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        self.stats['closed'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _evict_idle(self, now):
+        """回收空闲过久的连接，调用方需持有锁"""
+        if not self.idle_timeout:
+            return []
+        keep, stale = [], []
+        for conn, last_used in self._idle:
+            (stale if now - last_used > self.idle_timeout else keep).append((conn, last_used))
+        self._idle = keep
+        self.stats['evicted_idle'] += len(stale)
+        return [conn for conn, _ in stale]
+
+    def acquire(self, timeout=None):
+        """借出一个连接，超过等待时间抛出PoolTimeoutError"""
+        timeout = self.max_wait if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._cond:
+            stale = self._evict_idle(time.time())
+            waited = False
+            while not self._idle and self._in_use >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise PoolTimeoutError(f"No database connection available within {timeout}s "
+                                           f"(in use: {self._in_use}/{self.max_size})")
+                if not waited:
+                    self.stats['waited'] += 1
+                    waited = True
+                self._cond.wait(remaining)
+
+            entry = self._idle.pop() if self._idle else None
+            self._in_use += 1
+            self.stats['borrowed'] += 1
+            self.stats['peak_in_use'] = max(self.stats['peak_in_use'], self._in_use)
+        DB_POOL_ACQUIRE_SECONDS.observe(time.monotonic() - started)
+
+        for conn in stale:
+            self._discard(conn)
+
+        try:
+            conn = self._checkout(entry)
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, conn)
+
+    def _checkout(self, entry):
+        if entry is None:
+            return self._connect()
+
+        conn, last_used = entry
+        if time.time() - last_used >= self.health_check_after:
+            try:
+                conn.ping(reconnect=False)
+            except Exception as e:
+                logger.warning(f"Pooled connection failed health check, reconnecting: {str(e)}")
+                self.stats['health_check_failures'] += 1
+                self._discard(conn)
+                return self._connect()
+        return conn
+
+    def release(self, conn):
+        """归还连接，未提交的事务会被回滚"""
+        healthy = True
+        try:
+            if conn.open and conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                conn.rollback()
+            healthy = conn.open
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((conn, time.time()))
+            self._cond.notify()
+        if not healthy:
+            self._discard(conn)
+
+    def snapshot(self):
+        """返回连接池当前状态与累计计数"""
+        with self._cond:
+            return dict(self.stats, in_use=self._in_use, idle=len(self._idle), max_size=self.max_size)
+
+    def close_all(self):
+        """关闭所有空闲连接，借出中的连接归还后仍会进入连接池"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+pool = ConnectionPool(
+    host=DB_CONFIG['host'],
+    user=DB_CONFIG['user'],
+    password=DB_CONFIG['password'],
+    database=DB_CONFIG['database'],
+    port=DB_CONFIG['port'],
+    charset='utf8mb4',
+    cursorclass=TimedDictCursor,
+)
+
+
+def get_db_connection():
+    """从共享连接池借出一个连接，close()后自动归还"""
+    return pool.acquire()
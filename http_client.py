@@ -0,0 +1,135 @@
+# http_client.py 访问微信读书的HTTP客户端：共享keep-alive连接池，按凭证复用会话
+import hashlib
+import ipaddress
+import json
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import HTTP_CLIENT_CONFIG, WXREAD_CONFIG
+
+logger = logging.getLogger(__name__)
+
+def cookie_domain(base_url):
+    """凭证中的cookie按微信读书的域名写入cookie jar，才能被服务端Set-Cookie正确覆盖
+
+    本地mock服务使用IP地址时cookie域必须与主机完全一致，不能带前导点。
+    """
+    hostname = urlparse(base_url).hostname
+    try:
+        ipaddress.ip_address(hostname)
+        return hostname
+    except ValueError:
+        return '.' + hostname
+
+
+COOKIE_DOMAIN = cookie_domain(WXREAD_CONFIG['BASE_URL'])
+
+
+def parse_credentials(credentials):
+    """将record.credentials解析为(headers, cookies)两个字典
+
+    headers为JSON字符串；cookies可能是JSON字符串、Playwright的列表格式，
+    也可能是二维码登录得到的原始Cookie字符串。
+    """
+    headers = credentials.get('headers') or {}
+    cookies = credentials.get('cookies') or {}
+
+    if isinstance(headers, str):
+        headers = json.loads(headers)
+
+    if isinstance(cookies, str):
+        try:
+            cookies = json.loads(cookies)
+        except ValueError:
+            cookies = parse_cookie_string(cookies)
+
+    if isinstance(cookies, list):
+        cookies = {c['name']: c['value'] for c in cookies
+                   if isinstance(c, dict) and 'name' in c and 'value' in c}
+
+    # 请求头中自带的cookie合并进cookies，统一由cookies生成Cookie头
+    cookie_header = next((v for k, v in headers.items() if k.lower() == 'cookie'), '')
+    for key, value in parse_cookie_string(cookie_header).items():
+        cookies.setdefault(key, value)
+    headers = {k: v for k, v in headers.items() if k.lower() != 'cookie'}
+
+    return headers, cookies
+
+
+def parse_cookie_string(cookie_str):
+    """解析 a=1; b=2 形式的Cookie字符串"""
+    cookies = {}
+    for item in cookie_str.split(';'):
+        if '=' in item:
+            key, value = item.split('=', 1)
+            cookies[key.strip()] = value.strip()
+    return cookies
+
+
+def credentials_key(credentials):
+    """凭证的稳定标识，用于按凭证缓存会话"""
+    headers, cookies = parse_credentials(credentials)
+    raw = json.dumps([headers, cookies], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class WeReadClient:
+    """按凭证复用requests.Session的HTTP客户端
+
+    所有会话挂载同一个HTTPAdapter，TCP/TLS连接在会话之间共享并保持keep-alive；
+    每个会话拥有自己的cookie jar，服务端下发的Set-Cookie（如刷新后的wr_skey）自动生效。
+    """
+
+    def __init__(self, pool_maxsize=None, max_sessions=None, timeout=None):
+        self.timeout = timeout or HTTP_CLIENT_CONFIG['TIMEOUT']
+        self.max_sessions = max_sessions or HTTP_CLIENT_CONFIG['MAX_SESSIONS']
+        self.adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=pool_maxsize or HTTP_CLIENT_CONFIG['POOL_MAXSIZE'],
+        )
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _new_session(self, headers, cookies):
+        session = requests.Session()
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        session.headers.update(headers)
+        for name, value in cookies.items():
+            session.cookies.set(name, value, domain=COOKIE_DOMAIN, path='/')
+        return session
+
+    def session_for(self, credentials):
+        """返回该凭证对应的会话，不存在时创建；超过上限时淘汰最久未使用的会话"""
+        key = credentials_key(credentials)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                return session
+
+        session = self._new_session(*parse_credentials(credentials))
+        with self._lock:
+            self._sessions[key] = session
+            while len(self._sessions) > self.max_sessions:
+                # 淘汰的会话不关闭，连接属于共享的adapter
+                self._sessions.popitem(last=False)
+        return session
+
+    def request(self, credentials, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session_for(credentials).request(method, url, **kwargs)
+
+    def post(self, credentials, url, **kwargs):
+        return self.request(credentials, 'POST', url, **kwargs)
+
+    def get(self, credentials, url, **kwargs):
+        return self.request(credentials, 'GET', url, **kwargs)
+
+
+client = WeReadClient()
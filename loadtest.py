@@ -0,0 +1,226 @@
+# loadtest.py 端到端压测：模拟N个用户在一天中的不同时间开始阅读，统计吞吐量、延迟分位数与资源占用
+#
+# 一天被压缩为--day-seconds秒，每个用户在其中的某个时间点开始一次阅读任务：
+#   python loadtest.py --spawn-mock --users 2000 --day-seconds 300 --reads 10 --read-interval 1
+#   python loadtest.py --base-url http://127.0.0.1:8900 --users 500 --distribution hourly
+import argparse
+import json
+import os
+import random
+import resource
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Drive the reading engine against a WeRead stand-in")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--day-seconds', type=float, default=300, help="length of the simulated day")
+    parser.add_argument('--distribution', choices=('uniform', 'hourly'), default='uniform',
+                        help="uniform start times, or every user on the hour like '0 H * * *' cron jobs")
+    parser.add_argument('--reads', type=int, default=10, help="reads per run")
+    parser.add_argument('--read-interval', type=float, default=1.0, help="seconds between reads (30 in production)")
+    parser.add_argument('--connections', type=int, default=None, help="reading engine connection limit")
+    parser.add_argument('--base-url', default=os.getenv('WXREAD_BASE_URL'), help="WeRead stand-in to test against")
+    parser.add_argument('--spawn-mock', action='store_true', help="start mock_weread.py on a free local port")
+    parser.add_argument('--latency', type=float, default=0.05, help="mock latency (with --spawn-mock)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="mock error rate (with --spawn-mock)")
+    parser.add_argument('--skey-ttl', type=int, default=0, help="mock wr_skey lifetime (with --spawn-mock)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+    if not args.base_url and not args.spawn_mock:
+        parser.error("either --base-url (or WXREAD_BASE_URL) or --spawn-mock is required")
+    return args
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def spawn_mock(args, port, timeout=15):
+    """在子进程中启动mock服务并等待端口可用，避免其开销计入压测进程的资源占用"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_weread.py')
+    process = subprocess.Popen([
+        sys.executable, script, '--port', str(port),
+        '--latency', str(args.latency), '--error-rate', str(args.error_rate), '--skey-ttl', str(args.skey_ttl),
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("mock_weread.py did not start")
+
+
+def start_offsets(users, day_seconds, distribution):
+    if distribution == 'hourly':
+        hour = day_seconds / 24
+        return sorted(random.randrange(24) * hour for _ in range(users))
+    return sorted(random.uniform(0, day_seconds) for _ in range(users))
+
+
+def fake_credentials(user):
+    return {
+        'headers': {'Content-Type': 'application/json', 'User-Agent': 'wxread-loadtest'},
+        'cookies': {'wr_vid': str(10 ** 7 + user), 'wr_skey': secrets.token_hex(4)},
+    }
+
+
+def percentiles(values, points=(50, 90, 99)):
+    if not values:
+        return {f"p{p}": None for p in points} | {'max': None}
+    ordered = sorted(values)
+    result = {f"p{p}": round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000, 2) for p in points}
+    result['max'] = round(ordered[-1] * 1000, 2)
+    return result
+
+
+def resource_usage():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    fd_dir = '/proc/self/fd'
+    return {
+        'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 2),
+        'max_rss_mb': round(usage.ru_maxrss / 1024, 1),  # Linux下ru_maxrss单位为KB
+        'threads': threading.active_count(),
+        'open_fds': len(os.listdir(fd_dir)) if os.path.isdir(fd_dir) else None,
+    }
+
+
+def fetch_mock_stats(base_url):
+    try:
+        with urllib.request.urlopen(f"{base_url}/mock/stats", timeout=5) as response:
+            return json.loads(response.read())
+    except Exception:
+        return None
+
+
+def run(args, base_url):
+    # reader_engine在导入时从WXREAD_BASE_URL计算接口地址
+    os.environ['WXREAD_BASE_URL'] = base_url
+    from reader_engine import ReadingEngine
+
+    class MeasuredEngine(ReadingEngine):
+        """记录每次阅读请求的耗时与刷新密钥次数"""
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.read_latencies = []
+            self.renewal_calls = 0
+
+        async def _read(self, headers, cookies):
+            started = time.perf_counter()
+            try:
+                return await super()._read(headers, cookies)
+            finally:
+                self.read_latencies.append(time.perf_counter() - started)
+
+        async def renew_skey(self, headers, cookies):
+            self.renewal_calls += 1
+            return await super().renew_skey(headers, cookies)
+
+    engine = MeasuredEngine(max_connections=args.connections, read_interval=args.read_interval)
+    engine.start()
+
+    offsets = start_offsets(args.users, args.day_seconds, args.distribution)
+    results = {'success': 0, 'failure': 0}
+    run_durations = []
+    lock = threading.Lock()
+    done = threading.Semaphore(0)
+    peak = {'active_runs': 0}
+
+    def on_done(started, future):
+        with lock:
+            results['success' if future.exception() is None and future.result() else 'failure'] += 1
+            run_durations.append(time.monotonic() - started)
+        done.release()
+
+    def monitor(stop):
+        while not stop.wait(0.5):
+            peak['active_runs'] = max(peak['active_runs'], engine.active_runs)
+
+    stop = threading.Event()
+    threading.Thread(target=monitor, args=(stop,), daemon=True).start()
+
+    began = time.monotonic()
+    for user, offset in enumerate(offsets):
+        delay = began + offset - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        started = time.monotonic()
+        future = engine.submit(fake_credentials(user), read_count=args.reads)
+        future.add_done_callback(lambda f, started=started: on_done(started, f))
+    for _ in offsets:
+        done.acquire()
+    elapsed = time.monotonic() - began
+    stop.set()
+    engine.stop()
+
+    reads = len(engine.read_latencies)
+    return {
+        'users': args.users,
+        'reads_per_run': args.reads,
+        'elapsed_seconds': round(elapsed, 2),
+        'runs': dict(results),
+        'read_requests': reads,
+        'throughput_reads_per_second': round(reads / elapsed, 1) if elapsed else None,
+        'read_latency_ms': percentiles(engine.read_latencies),
+        'run_duration_ms': percentiles(run_durations),
+        'renewals': engine.renewal_calls,
+        'peak_active_runs': peak['active_runs'],
+        'resources': resource_usage(),
+        'upstream': fetch_mock_stats(base_url),
+    }
+
+
+def print_report(report):
+    print(f"users {report['users']}, {report['reads_per_run']} reads per run, {report['elapsed_seconds']}s")
+    print(f"runs: {report['runs']['success']} succeeded, {report['runs']['failure']} failed, "
+          f"peak {report['peak_active_runs']} concurrent")
+    print(f"read requests: {report['read_requests']} ({report['throughput_reads_per_second']}/s), "
+          f"{report['renewals']} skey renewals")
+    print("read latency ms: " + ', '.join(f"{k} {v}" for k, v in report['read_latency_ms'].items()))
+    print("run duration ms: " + ', '.join(f"{k} {v}" for k, v in report['run_duration_ms'].items()))
+    print("resources: " + ', '.join(f"{k} {v}" for k, v in report['resources'].items()))
+    if report['upstream']:
+        print(f"upstream responses: {json.dumps(report['upstream'])}")
+
+
+def main():
+    args = parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    mock = None
+    base_url = args.base_url
+    if args.spawn_mock:
+        port = free_port()
+        mock = spawn_mock(args, port)
+        base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        report = run(args, base_url.rstrip('/'))
+    finally:
+        if mock:
+            mock.terminate()
+            mock.wait()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    return 0 if report['runs']['failure'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+# log_setup.py 非阻塞日志：调用方只把记录放入队列，文件与控制台输出由后台监听线程完成
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+from config import LOG_CONFIG
+
+# 比DEBUG更详细的级别，用于请求头、cookie、请求体、响应内容等大段数据
+TRACE = 5
+logging.addLevelName(TRACE, 'TRACE')
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列已满时丢弃日志并计数，而不是阻塞调用方"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """按调用位置（文件与行号）限流：每个位置每interval秒最多输出burst条
+
+    只作用于低于max_level的日志，警告和错误始终输出。被丢弃的条数附加在该位置下一条输出的日志后面。
+    """
+
+    def __init__(self, burst=None, interval=None, max_level=logging.INFO):
+        super().__init__()
+        self.burst = burst or LOG_CONFIG['HOT_PATH_BURST']
+        self.interval = interval or LOG_CONFIG['HOT_PATH_INTERVAL']
+        self.max_level = max_level
+        self._sites = {}  # (pathname, lineno) -> [window_start, count, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.interval:
+                suppressed = site[2] if site else 0
+                self._sites[key] = [now, 1, 0]
+            elif site[1] < self.burst:
+                site[1] += 1
+                suppressed = 0
+            else:
+                site[2] += 1
+                return False
+
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+        return True
+
+
+_listener = None
+_handler = None
+
+
+def configure_logging(log_file, level=None):
+    """把根日志器的输出改为经由队列写入按大小轮转的日志文件和控制台
+
+    重复调用时直接返回；会替换之前basicConfig等方式添加的处理器。
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file,
+        maxBytes=LOG_CONFIG['MAX_BYTES'],
+        backupCount=LOG_CONFIG['BACKUP_COUNT'],
+        encoding='utf-8'
+    )
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(LOG_CONFIG['QUEUE_SIZE'])
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    _handler = DroppingQueueHandler(log_queue)
+    root.addHandler(_handler)
+    root.setLevel(level or logging.getLevelName(LOG_CONFIG['LEVEL'].upper()))
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    # 阅读循环中每次请求都会输出的日志按调用位置限流
+    logging.getLogger('reader_engine').addFilter(RateLimitFilter())
+
+
+def snapshot():
+    """返回队列中待写入的日志条数与丢弃的条数"""
+    if _handler is None:
+        return {'queued': 0, 'dropped': 0}
+    return {'queued': _handler.queue.qsize(), 'dropped': _handler.dropped}
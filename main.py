@@ -6,9 +6,10 @@ import random
 import time
 import urllib.parse
 
-import requests
-
-from config import data, headers, cookies
+from config import data, headers, cookies, WXREAD_CONFIG
+from http_client import client, parse_credentials
+from log_setup import TRACE
+from rate_limit import limiter
 
 # 配置日志格式
 logger = logging.getLogger(__name__)
@@ -17,8 +18,8 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)-8s -
 # 加密盐及其它默认值
 KEY = "3c5c8717f3daf09iop3423zafeqoi"
 COOKIE_DATA = {"rq": "%2Fweb%2Fbook%2Fread"}
-READ_URL = "https://weread.qq.com/web/book/read"
-RENEW_URL = "https://weread.qq.com/web/login/renewal"
+READ_URL = f"{WXREAD_CONFIG['BASE_URL']}/web/book/read"
+RENEW_URL = f"{WXREAD_CONFIG['BASE_URL']}/web/login/renewal"
 
 def execute_reading(credentials, read_count=1):
     """
@@ -33,10 +34,9 @@ def execute_reading(credentials, read_count=1):
     """
     try:
         # 解析凭证信息
-        headers = json.loads(credentials.get('headers', '{}'))
-        cookies = credentials.get('cookies', '{}')
-        logger.info("headers: %s", headers)
-        logger.info("cookies: %s", cookies)
+        headers, cookies = parse_credentials(credentials)
+        logger.log(TRACE, "headers: %s", headers)
+        logger.log(TRACE, "cookies: %s", cookies)
         if not headers or not cookies:
             logging.error("凭证信息不完整")
             return False
@@ -53,15 +53,15 @@ def execute_reading(credentials, read_count=1):
         success_count = 0
         for i in range(read_count):
             logging.info(f"⏱️ 尝试第 {i+1}/{read_count} 次阅读...")
-            logger.info("Request data: %s", request_data)
-            # 发送阅读请求
-            response = requests.post(
+            logger.log(TRACE, "Request data: %s", request_data)
+            # 发送阅读请求（按凭证复用的keep-alive会话），所有调用方共享上游速率限制
+            limiter.acquire('read')
+            response = client.post(
+                credentials,
                 READ_URL, 
-                headers=headers, 
-
                 data=json.dumps(request_data, separators=(',', ':'))
             )
-            logger.info(f"Response: {response.text}")
+            logger.log(TRACE, "Response: %s", response.text)
             if response.status_code == 200:
                 res_data = response.json()
                 if 'succ' in res_data:
@@ -112,11 +112,12 @@ def cal_hash(input_string):
     return hex(_7032f5 + _cc1055)[2:].lower()
 
 def get_wr_skey(headers, cookies):
-    """刷新cookie密钥"""
+    """刷新cookie密钥，新的wr_skey同时写入该凭证会话的cookie jar"""
     try:
-        response = requests.post(
+        limiter.acquire('renewal')
+        response = client.post(
+            {'headers': headers, 'cookies': cookies},
             RENEW_URL, 
-            headers=headers,
             data=json.dumps(COOKIE_DATA, separators=(',', ':'))
         )
         
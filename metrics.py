@@ -0,0 +1,100 @@
+# metrics.py Prometheus指标：阅读请求、密钥刷新、数据库、二维码登录、推送、任务队列与调度器
+import logging
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# 阅读请求与单次请求的上游耗时
+READ_REQUEST_SECONDS = Histogram(
+    'wxread_read_request_seconds', 'Latency of read requests to WeRead by outcome',
+    ['outcome'], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+READ_RUNS = Counter('wxread_read_runs', 'Finished reading runs by outcome', ['outcome'])
+
+# wr_skey刷新
+SKEY_RENEWALS = Counter('wxread_skey_renewals', 'wr_skey renewal attempts by outcome', ['outcome'])
+SKEY_RENEWAL_SECONDS = Histogram(
+    'wxread_skey_renewal_seconds', 'Latency of wr_skey renewal requests',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+
+# 上游速率限制
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    'wxread_rate_limit_wait_seconds', 'Time requests wait for the upstream rate limiter by endpoint',
+    ['endpoint'], buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60)
+)
+
+# 数据库
+DB_QUERY_SECONDS = Histogram(
+    'wxread_db_query_seconds', 'MySQL statement execution time by statement type',
+    ['operation'], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+DB_POOL_ACQUIRE_SECONDS = Histogram(
+    'wxread_db_pool_acquire_seconds', 'Time spent waiting for a pooled MySQL connection',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+)
+
+# 二维码登录各阶段耗时与最终状态
+QRCODE_STAGE_SECONDS = Histogram(
+    'wxread_qrcode_stage_seconds', 'Duration of QR code login stages',
+    ['stage'], buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+)
+QRCODE_SESSIONS = Counter('wxread_qrcode_sessions', 'QR code login sessions by final status', ['status'])
+
+# 推送通知
+PUSH_DELIVERIES = Counter('wxread_push_deliveries', 'Push notification delivery attempts by channel and outcome',
+                          ['channel', 'outcome'])
+
+# 调度器与准入队列
+SCHEDULER_LAG_SECONDS = Histogram(
+    'wxread_scheduler_lag_seconds', 'Delay between a job\'s scheduled time and its submission',
+    buckets=(0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+)
+SCHEDULER_MISSED_RUNS = Counter('wxread_scheduler_missed_runs', 'Job runs skipped after the misfire grace time')
+ADMISSION_WAIT_SECONDS = Histogram(
+    'wxread_admission_wait_seconds', 'Time runs spend in the admission queue before starting',
+    buckets=(0.1, 1, 5, 10, 30, 60, 120, 300, 900, 3600)
+)
+
+# 统计语句类型时只取首个关键字，避免标签基数随SQL增长
+DB_OPERATIONS = ('select', 'insert', 'update', 'delete', 'replace')
+
+
+def db_operation(query):
+    keyword = query.lstrip()[:7].lower()
+    for operation in DB_OPERATIONS:
+        if keyword.startswith(operation):
+            return operation
+    return 'other'
+
+
+class SnapshotCollector:
+    """在抓取时调用组件的snapshot()，把其中的字段导出为gauge或counter"""
+
+    def __init__(self, prefix, snapshot, gauges=(), counters=()):
+        self.prefix = prefix
+        self.snapshot = snapshot
+        self.gauges = gauges
+        self.counters = counters
+
+    def collect(self):
+        try:
+            values = self.snapshot()
+        except Exception as e:
+            logger.error(f"Error collecting {self.prefix} metrics: {str(e)}")
+            return
+        for name in self.gauges:
+            yield GaugeMetricFamily(f"{self.prefix}_{name}", f"{self.prefix} {name}", value=values[name])
+        for name in self.counters:
+            yield CounterMetricFamily(f"{self.prefix}_{name}", f"{self.prefix} {name}", value=values[name])
+
+
+def register_snapshot(prefix, snapshot, gauges=(), counters=()):
+    REGISTRY.register(SnapshotCollector(prefix, snapshot, gauges, counters))
+
+
+def render():
+    """返回(指标文本, Content-Type)"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
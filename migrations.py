@@ -0,0 +1,197 @@
+# migrations.py 版本化的表结构迁移：为热点查询补充复合索引，并用EXPLAIN检查这些查询是否能使用索引
+#
+#   python migrations.py            执行尚未执行的迁移
+#   python migrations.py --status   列出各迁移的执行情况
+#   python migrations.py --explain  检查热点查询的执行计划
+import argparse
+import logging
+import sys
+
+import pymysql
+
+from config import SCHEDULER_CONFIG
+from db_pool import get_db_connection
+from queries import (DAILY_LIVE_SQL, DAILY_SUMMARY_SQL, EXECUTION_LOG_PURGE_CONDITION, INTERRUPTED_RUNS_SQL,
+                     JOBS_VERSION_SQL, JOBSTORE_TABLE, PURGE_ROWS_SQL, RECONCILE_RECORDS_SQL, RECORD_VERSION_SQL,
+                     RESUME_EXECUTION_LOG_SQL, UNUSED_AUTHORIZATION_CODES_SQL, tasks_page_query)
+
+logger = logging.getLogger(__name__)
+
+# 多个进程同时启动时只有一个执行迁移
+MIGRATION_LOCK = 'wxread_schema_migrations'
+MIGRATION_LOCK_TIMEOUT = 600
+
+# MySQL错误码：索引名已存在（上次执行到一半中断时会遇到）
+ER_DUP_KEYNAME = 1061
+
+# (版本, 说明, 语句)；版本号只增不改，已发布的迁移不要修改，新的变更追加新版本。
+# 索引使用在线DDL，建索引期间表仍可读写。
+MIGRATIONS = [
+    (1, 'record: reconcile by updated_at, list tasks by is_active', [
+        "ALTER TABLE record ADD INDEX idx_record_updated (updated_at, authorization_code), "
+        "ALGORITHM=INPLACE, LOCK=NONE",
+        "ALTER TABLE record ADD INDEX idx_record_active (is_active, authorization_code), "
+        "ALGORITHM=INPLACE, LOCK=NONE",
+    ]),
+    (2, 'execution_log: runs of a code by status and time, interrupted runs by status and time', [
+        "ALTER TABLE execution_log ADD INDEX idx_execution_log_code_status (authorization_code, status, start_time), "
+        "ALGORITHM=INPLACE, LOCK=NONE",
+        "ALTER TABLE execution_log ADD INDEX idx_execution_log_status_start (status, start_time), "
+        "ALGORITHM=INPLACE, LOCK=NONE",
+    ]),
+    (3, 'system_log: scan by created_at', [
+        "ALTER TABLE system_log ADD INDEX idx_system_log_created (created_at), ALGORITHM=INPLACE, LOCK=NONE",
+    ]),
+    (4, 'authorization_codes: count unused codes for refill', [
+        "ALTER TABLE authorization_codes ADD INDEX idx_authorization_codes_unused (is_used), "
+        "ALGORITHM=INPLACE, LOCK=NONE",
+    ]),
+    (5, 'execution_log: rollup and purge by start_time', [
+        "ALTER TABLE execution_log ADD INDEX idx_execution_log_start (start_time), ALGORITHM=INPLACE, LOCK=NONE",
+    ]),
+]
+
+
+def hot_queries():
+    """返回[(名称, 语句, 参数, {表名或别名: 期望使用的索引})]
+
+    语句取自queries.py中业务代码实际执行的SQL，参数为探测用的取值。
+    """
+    use_jobstore_table = SCHEDULER_CONFIG['JOBSTORE'] == 'mysql'
+    tasks_query, tasks_params = tasks_page_query(
+        101, use_jobstore_table, status='active', after_code='probe', next_run_after=0.0, next_run_before=2e9)
+    tasks_indexes = {'r': 'idx_record_active', 'j': 'PRIMARY'} if use_jobstore_table else {'r': 'idx_record_active'}
+
+    queries = [
+        ('reconcile_records', RECONCILE_RECORDS_SQL, ('2024-01-01', '', 1000), {'record': 'idx_record_updated'}),
+        ('tasks_record_version', RECORD_VERSION_SQL.format(scope=''), (), {'record': 'idx_record_updated'}),
+        ('list_tasks', tasks_query, tasks_params, tasks_indexes),
+        ('resume_execution_log', RESUME_EXECUTION_LOG_SQL, ('probe',),
+         {'execution_log': 'idx_execution_log_code_status'}),
+        ('interrupted_runs', INTERRUPTED_RUNS_SQL, (), {'execution_log': 'idx_execution_log_status_start'}),
+        ('purge_system_log', PURGE_ROWS_SQL.format(table='system_log', column='created_at', condition=''),
+         ('2024-01-01', 1000), {'system_log': 'idx_system_log_created'}),
+        ('purge_execution_log',
+         PURGE_ROWS_SQL.format(table='execution_log', column='start_time', condition=EXECUTION_LOG_PURGE_CONDITION),
+         ('2024-01-01', 1000), {'execution_log': 'idx_execution_log_start'}),
+        ('daily_history_summary', DAILY_SUMMARY_SQL, ('probe', '2024-01-01', '2024-02-01'),
+         {'execution_daily_summary': 'PRIMARY'}),
+        ('daily_history_live', DAILY_LIVE_SQL, ('probe', '2024-01-01'),
+         {'execution_log': 'idx_execution_log_code_status'}),
+        ('unused_authorization_codes', UNUSED_AUTHORIZATION_CODES_SQL, (),
+         {'authorization_codes': 'idx_authorization_codes_unused'}),
+    ]
+    if use_jobstore_table:
+        # 任务表由APScheduler创建，只在使用MySQL任务存储时检查
+        queries.append(('tasks_jobs_version', JOBS_VERSION_SQL.format(scope=''), (), {JOBSTORE_TABLE: 'PRIMARY'}))
+    return queries
+
+
+def ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row['version'] for row in cursor.fetchall()}
+
+
+def apply_migrations():
+    """按版本顺序执行尚未执行的迁移，返回本次执行的版本号列表"""
+    applied = []
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        ensure_migrations_table(cursor)
+        cursor.execute("SELECT GET_LOCK(%s, %s) AS locked", (MIGRATION_LOCK, MIGRATION_LOCK_TIMEOUT))
+        if not cursor.fetchone()['locked']:
+            raise RuntimeError("timed out waiting for another process to finish migrations")
+        try:
+            done = applied_versions(cursor)
+            for version, description, statements in sorted(MIGRATIONS):
+                if version in done:
+                    continue
+                logger.info(f"Applying migration {version}: {description}")
+                for statement in statements:
+                    try:
+                        cursor.execute(statement)
+                    except pymysql.err.OperationalError as e:
+                        if e.args[0] != ER_DUP_KEYNAME:
+                            raise
+                        logger.info(f"Index already exists, skipping: {statement.split(' ADD INDEX ')[-1]}")
+                # DDL会隐式提交，版本记录单独提交
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+                connection.commit()
+                applied.append(version)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+            cursor.fetchall()
+    return applied
+
+
+def migration_status():
+    """返回[(版本, 说明, 执行时间或None)]"""
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        ensure_migrations_table(cursor)
+        cursor.execute("SELECT version, applied_at FROM schema_migrations")
+        applied_at = {row['version']: row['applied_at'] for row in cursor.fetchall()}
+        connection.commit()
+    return [(version, description, applied_at.get(version)) for version, description, _ in sorted(MIGRATIONS)]
+
+
+def check_query_plans():
+    """对每个热点查询执行EXPLAIN，检查执行计划的每一行，返回[(名称, 表, 期望索引, 可用索引, 实际索引, 预估行数, 是否通过)]
+
+    每张表的期望索引必须出现在possible_keys中，或是全索引扫描实际使用的索引；小表上优化器可能仍选择全表扫描，
+    因此不要求实际使用。计划中出现未列出期望索引的表时不通过。
+    """
+    results = []
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        for name, query, params, indexes in hot_queries():
+            cursor.execute("EXPLAIN " + query, params)
+            for plan in cursor.fetchall():
+                if plan['table'] is None:
+                    # 不访问表的步骤，例如Select tables optimized away
+                    continue
+                expected = indexes.get(plan['table'])
+                possible = (plan['possible_keys'] or '').split(',')
+                ok = expected is not None and (expected in possible or plan['key'] == expected)
+                results.append((name, plan['table'], expected, plan['possible_keys'], plan['key'], plan['rows'], ok))
+        connection.commit()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations and check hot query plans")
+    parser.add_argument('--status', action='store_true', help="list migrations and when they were applied")
+    parser.add_argument('--explain', action='store_true', help="check that hot queries can use their indexes")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.status:
+        for version, description, applied_at in migration_status():
+            print(f"{version:>4}  {applied_at or 'pending':<20}  {description}")
+        return 0
+
+    if args.explain:
+        failed = 0
+        for name, table, expected, possible, key, rows, ok in check_query_plans():
+            failed += not ok
+            print(f"{'OK ' if ok else 'BAD'}  {name:<28} {table:<24} expected {expected}, possible {possible}, "
+                  f"using {key}, ~{rows} rows")
+        return 1 if failed else 0
+
+    applied = apply_migrations()
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
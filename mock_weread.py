@@ -0,0 +1,265 @@
+# mock_weread.py 本地的微信读书替身服务：阅读、刷新密钥、用户信息接口，以及供二维码登录流程使用的最小阅读页
+#
+# 启动后将WXREAD_BASE_URL指向它即可离线运行服务与压测：
+#   python mock_weread.py --port 8900 --latency 0.05 --error-rate 0.01 --skey-ttl 600
+#   WXREAD_BASE_URL=http://127.0.0.1:8900 python app.py
+#
+# 录制与回放真实的响应：
+#   python mock_weread.py --record-upstream https://weread.qq.com --trace-file traces.jsonl
+#   python mock_weread.py --replay traces.jsonl
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import secrets
+import time
+from collections import defaultdict
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# 延迟与错误注入只作用于这些接口
+API_PATHS = ('/web/book/read', '/web/login/renewal', '/web/user/info')
+
+# 转发到上游时不复制的头
+HOP_BY_HOP_HEADERS = {'host', 'content-length', 'transfer-encoding', 'connection', 'accept-encoding',
+                      'content-encoding', 'keep-alive'}
+
+LOGIN_EXPIRED = {'errcode': -2012, 'errmsg': '登录超时'}
+
+# 1x1透明PNG，作为二维码图片
+QRCODE_IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8'
+                'AAAAASUVORK5CYII=')
+
+READER_PAGE = """<!doctype html>
+<html>
+<head><meta charset="utf-8"><title>微信读书 (mock)</title></head>
+<body>
+<div class="readerTopBar">
+  <a class="readerTopBar_link">书架</a>
+  <a class="readerTopBar_link">目录</a>
+  <a class="readerTopBar_link" id="login">登录</a>
+  <span class="readerTopBar_avatar" style="display: none">mock-user</span>
+</div>
+<div id="qrcode"></div>
+<script>
+  const avatar = document.querySelector('.readerTopBar_avatar');
+  function read() {
+    fetch('/web/book/read', {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({b: '%(book_id)s'})
+    });
+  }
+  if (document.cookie.includes('wr_skey=')) {
+    avatar.style.display = 'inline';
+    read();
+  }
+  document.getElementById('login').addEventListener('click', () => {
+    document.getElementById('qrcode').innerHTML =
+      '<img alt="扫码登录" width="200" height="200" src="%(qrcode)s">';
+    // 模拟用户在scan_delay毫秒后扫码确认
+    setTimeout(() => fetch('/mock/login/confirm', {method: 'POST'})
+      .then(() => { avatar.style.display = 'inline'; }), %(scan_delay_ms)d);
+  });
+</script>
+</body>
+</html>
+"""
+
+
+class SkeyStore:
+    """wr_skey的签发与过期
+
+    压测脚本可以直接构造凭证，第一次出现的密钥视为刚刚签发；ttl为0时密钥永不过期。
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._expires = {}
+
+    def issue(self):
+        skey = secrets.token_hex(4)
+        self._expires[skey] = time.monotonic() + self.ttl
+        return skey
+
+    def is_valid(self, skey):
+        if not skey:
+            return False
+        if not self.ttl:
+            return True
+        return self._expires.setdefault(skey, time.monotonic() + self.ttl) > time.monotonic()
+
+
+class TraceRecorder:
+    """把上游的响应按行写入JSON文件
+
+    只记录响应（状态码、Content-Type、Set-Cookie、响应体与耗时），不记录请求头中的凭证；
+    Set-Cookie中含有新签发的密钥，录制文件不要提交到仓库。
+    """
+
+    def __init__(self, upstream, trace_file):
+        self.upstream = upstream.rstrip('/')
+        self.trace_file = trace_file
+        self._session = None
+
+    async def forward(self, request):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(cookie_jar=aiohttp.DummyCookieJar())
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        body = await request.read()
+        started = time.monotonic()
+        async with self._session.request(request.method, self.upstream + request.path_qs, headers=headers,
+                                         data=body, allow_redirects=False) as upstream_response:
+            payload = await upstream_response.read()
+            trace = {
+                'method': request.method,
+                'path': request.path,
+                'status': upstream_response.status,
+                'latency': round(time.monotonic() - started, 4),
+                'content_type': upstream_response.headers.get('Content-Type'),
+                'set_cookie': upstream_response.headers.getall('Set-Cookie', []),
+                'body': payload.decode('utf-8', errors='replace'),
+            }
+        with open(self.trace_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(trace, ensure_ascii=False) + '\n')
+        return trace_response(trace)
+
+
+def trace_response(trace):
+    response = web.Response(status=trace['status'], text=trace['body'],
+                            content_type=(trace['content_type'] or 'text/plain').split(';')[0])
+    for cookie in trace['set_cookie']:
+        response.headers.add('Set-Cookie', cookie)
+    return response
+
+
+def load_traces(trace_file):
+    """按(method, path)分组的录制响应，回放时循环使用"""
+    grouped = defaultdict(list)
+    with open(trace_file, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                trace = json.loads(line)
+                grouped[(trace['method'], trace['path'])].append(trace)
+    return {key: itertools.cycle(traces) for key, traces in grouped.items()}
+
+
+class MockWeRead:
+    def __init__(self, latency=0.0, jitter=0.5, error_rate=0.0, skey_ttl=0, scan_delay=3.0,
+                 recorder=None, replay=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.scan_delay = scan_delay
+        self.skeys = SkeyStore(skey_ttl)
+        self.recorder = recorder
+        self.replay = replay or {}
+        self.stats = defaultdict(lambda: defaultdict(int))  # path -> status -> count
+
+    def create_app(self):
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_post('/web/book/read', self.read)
+        app.router.add_post('/web/login/renewal', self.renewal)
+        app.router.add_get('/web/user/info', self.user_info)
+        app.router.add_get('/web/reader/{book_id}', self.reader_page)
+        app.router.add_post('/mock/login/confirm', self.confirm_login)
+        app.router.add_get('/mock/stats', self.get_stats)
+        app.router.add_get('/', self.index)
+        return app
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        if self.recorder and not request.path.startswith('/mock/'):
+            response = await self.recorder.forward(request)
+        elif (request.method, request.path) in self.replay:
+            trace = next(self.replay[(request.method, request.path)])
+            await asyncio.sleep(trace['latency'] if self.latency is None else self.delay())
+            response = trace_response(trace)
+        elif request.path in API_PATHS:
+            await asyncio.sleep(self.delay())
+            if random.random() < self.error_rate:
+                response = web.json_response({'errcode': -1, 'errmsg': 'injected error'}, status=503)
+            else:
+                response = await handler(request)
+        else:
+            response = await handler(request)
+        self.stats[request.path if request.path in API_PATHS else 'other'][response.status] += 1
+        return response
+
+    def delay(self):
+        if not self.latency:
+            return 0
+        return self.latency * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def read(self, request):
+        if not self.skeys.is_valid(request.cookies.get('wr_skey')):
+            return web.json_response(LOGIN_EXPIRED)
+        return web.json_response({'succ': 1, 'synckey': random.randint(1, 2 ** 31)})
+
+    async def renewal(self, request):
+        response = web.json_response({'succ': 1})
+        response.set_cookie('wr_skey', self.skeys.issue(), path='/')
+        return response
+
+    async def user_info(self, request):
+        if not self.skeys.is_valid(request.cookies.get('wr_skey')):
+            return web.json_response(LOGIN_EXPIRED)
+        vid = request.cookies.get('wr_vid', '0')
+        return web.json_response({'userVid': vid, 'name': f'mock-user-{vid}', 'avatar': ''})
+
+    async def reader_page(self, request):
+        html = READER_PAGE % {
+            'book_id': request.match_info['book_id'],
+            'qrcode': QRCODE_IMAGE,
+            'scan_delay_ms': int(self.scan_delay * 1000),
+        }
+        return web.Response(text=html, content_type='text/html')
+
+    async def confirm_login(self, request):
+        response = web.json_response({'succ': 1})
+        response.set_cookie('wr_vid', str(random.randint(10 ** 7, 10 ** 8)), path='/')
+        response.set_cookie('wr_skey', self.skeys.issue(), path='/')
+        return response
+
+    async def get_stats(self, request):
+        return web.json_response({path: dict(statuses) for path, statuses in self.stats.items()})
+
+    async def index(self, request):
+        return web.Response(text='mock weread')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the WeRead endpoints used by this service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=None,
+                        help="mean response latency in seconds (replay uses the recorded latency by default)")
+    parser.add_argument('--jitter', type=float, default=0.5, help="latency varies by ±jitter of the mean")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of API requests answered with 503")
+    parser.add_argument('--skey-ttl', type=int, default=0, help="seconds until a wr_skey expires, 0 = never")
+    parser.add_argument('--scan-delay', type=float, default=3.0, help="seconds until the mock QR code is 'scanned'")
+    parser.add_argument('--record-upstream', help="proxy every request to this base URL and record the responses")
+    parser.add_argument('--trace-file', default='weread_traces.jsonl')
+    parser.add_argument('--replay', help="serve recorded responses from this trace file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    mock = MockWeRead(
+        latency=args.latency if args.latency is not None or args.replay else 0.0,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        skey_ttl=args.skey_ttl,
+        scan_delay=args.scan_delay,
+        recorder=TraceRecorder(args.record_upstream, args.trace_file) if args.record_upstream else None,
+        replay=load_traces(args.replay) if args.replay else None,
+    )
+    web.run_app(mock.create_app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == '__main__':
+    main()
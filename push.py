@@ -1,16 +1,32 @@
 # push.py 支持 PushPlus 、wxpusher、Telegram 的消息推送模块
+import atexit
 import os
-import random
-import time
 import json
 import requests
 import logging
-from config import PUSHPLUS_TOKEN, TELEGRAM_CHAT_ID, TELEGRAM_BOT_TOKEN, WXPUSHER_SPT
+import threading
+from urllib.parse import quote
+
+from requests.adapters import HTTPAdapter
+
+from config import PUSHPLUS_TOKEN, TELEGRAM_CHAT_ID, TELEGRAM_BOT_TOKEN, WXPUSHER_SPT, PUSH_CONFIG
+from push_queue import PushDispatcher
 
 logger = logging.getLogger(__name__)
 
+CHANNELS = ('pushplus', 'telegram', 'wxpusher')
+
+# 每个渠道的接收方配置中必填的字段
+CHANNEL_FIELDS = {
+    'pushplus': ('token',),
+    'telegram': ('bot_token', 'chat_id'),
+    'wxpusher': ('spt',),
+}
+
 
 class PushNotification:
+    """各渠道的发送器：每个渠道复用一个requests会话，失败时返回False，重试由push_queue按计划进行"""
+
     def __init__(self):
         self.pushplus_url = "https://www.pushplus.plus/send"
         self.telegram_url = "https://api.telegram.org/bot{}/sendMessage"
@@ -21,88 +37,143 @@ class PushNotification:
             'https': os.getenv('https_proxy')
         }
         self.wxpusher_simple_url = "https://wxpusher.zjiecode.com/api/send/message/{}/{}"
+        self.timeout = (PUSH_CONFIG['CONNECT_TIMEOUT'], PUSH_CONFIG['TIMEOUT'])
+        # 会话在多个发送线程间共享，连接池与发送线程数一致
+        self.sessions = {channel: self._session() for channel in CHANNELS}
+        # Telegram代理失败后的直连会话，不读取环境变量中的代理
+        self.telegram_direct = self._session()
+        self.telegram_direct.trust_env = False
+        # bot_token -> 上次成功的线路，下次优先使用
+        self.telegram_routes = {}
+        self._routes_lock = threading.Lock()
+
+    @staticmethod
+    def _session():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PUSH_CONFIG['WORKERS'])
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
 
     def push_pushplus(self, content, token):
         """PushPlus消息推送"""
-        attempts = 5
-        for attempt in range(attempts):
-            try:
-                response = requests.post(
-                    self.pushplus_url,
-                    data=json.dumps({
-                        "token": token,
-                        "title": "微信阅读推送...",
-                        "content": content
-                    }).encode('utf-8'),
-                    headers=self.headers,
-                    timeout=10
-                )
-                response.raise_for_status()
-                logger.info("✅ PushPlus响应: %s", response.text)
-                break  # 成功推送，跳出循环
-            except requests.exceptions.RequestException as e:
-                logger.error("❌ PushPlus推送失败: %s", e)
-                if attempt < attempts - 1:  # 如果不是最后一次尝试
-                    sleep_time = random.randint(180, 360)  # 随机3到6分钟
-                    logger.info("将在 %d 秒后重试...", sleep_time)
-                    time.sleep(sleep_time)
+        try:
+            response = self.sessions['pushplus'].post(
+                self.pushplus_url,
+                data=json.dumps({
+                    "token": token,
+                    "title": "微信阅读推送...",
+                    "content": content
+                }).encode('utf-8'),
+                headers=self.headers,
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            logger.debug("✅ PushPlus响应: %s", response.text)
+            return True
+        except requests.exceptions.RequestException as e:
+            logger.error("❌ PushPlus推送失败: %s", e)
+            return False
 
     def push_telegram(self, content, bot_token, chat_id):
-        """Telegram消息推送，失败时自动尝试直连"""
+        """Telegram消息推送，代理与直连互为后备
+
+        两条线路不同时发送，否则两者都可用时用户会收到重复消息；上次成功的线路优先，
+        没有配置代理时直接直连，代理不可用时在CONNECT_TIMEOUT秒内转为直连。
+        """
         url = self.telegram_url.format(bot_token)
         payload = {"chat_id": chat_id, "text": content}
+        routes = ['proxy', 'direct'] if any(self.proxies.values()) else ['direct']
+        if self.telegram_routes.get(bot_token) == 'direct':
+            routes.reverse()
 
-        try:
-            # 先尝试代理
-            response = requests.post(url, json=payload, proxies=self.proxies, timeout=30)
-            logger.info("✅ Telegram响应: %s", response.text)
-            response.raise_for_status()
-            return True
-        except Exception as e:
-            logger.error("❌ Telegram代理发送失败: %s", e)
+        for route in routes:
             try:
-                # 代理失败后直连
-                response = requests.post(url, json=payload, timeout=30)
+                if route == 'proxy':
+                    response = self.sessions['telegram'].post(url, json=payload, proxies=self.proxies,
+                                                              timeout=(self.timeout[0], 30))
+                else:
+                    response = self.telegram_direct.post(url, json=payload, timeout=(self.timeout[0], 30))
+                logger.debug("✅ Telegram响应: %s", response.text)
                 response.raise_for_status()
+                with self._routes_lock:
+                    self.telegram_routes[bot_token] = route
                 return True
             except Exception as e:
-                logger.error("❌ Telegram发送失败: %s", e)
-                return False
-    
+                logger.error("❌ Telegram%s发送失败: %s", '代理' if route == 'proxy' else '直连', e)
+        return False
+
     def push_wxpusher(self, content, spt):
         """WxPusher消息推送（极简方式）"""
-        attempts = 5
-        url = self.wxpusher_simple_url.format(spt, content)
-        
-        for attempt in range(attempts):
-            try:
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()
-                logger.info("✅ WxPusher响应: %s", response.text)
-                break
-            except requests.exceptions.RequestException as e:
-                logger.error("❌ WxPusher推送失败: %s", e)
-                if attempt < attempts - 1:
-                    sleep_time = random.randint(180, 360)
-                    logger.info("将在 %d 秒后重试...", sleep_time)
-                    time.sleep(sleep_time)
+        url = self.wxpusher_simple_url.format(spt, quote(content, safe=''))
+        try:
+            response = self.sessions['wxpusher'].get(url, timeout=self.timeout)
+            response.raise_for_status()
+            logger.debug("✅ WxPusher响应: %s", response.text)
+            return True
+        except requests.exceptions.RequestException as e:
+            logger.error("❌ WxPusher推送失败: %s", e)
+            return False
 
+    def send(self, method, content, target):
+        """按渠道发送一条消息，target为该渠道的接收方配置"""
+        if method == "pushplus":
+            return self.push_pushplus(content, target['token'])
+        elif method == "telegram":
+            return self.push_telegram(content, target['bot_token'], target['chat_id'])
+        elif method == "wxpusher":
+            return self.push_wxpusher(content, target['spt'])
+        raise ValueError(f"unknown push channel {method}")
 
-"""外部调用"""
 
+def normalize_channels(channels):
+    """校验用户提交的推送渠道配置，返回{渠道: 接收方配置}，不合法时抛出ValueError"""
+    if not isinstance(channels, dict):
+        raise ValueError("推送渠道配置必须是对象")
+    normalized = {}
+    for method, target in channels.items():
+        if method not in CHANNEL_FIELDS:
+            raise ValueError(f"无效的通知渠道: {method}")
+        if not isinstance(target, dict):
+            raise ValueError(f"{method} 的配置必须是对象")
+        missing = [field for field in CHANNEL_FIELDS[method]
+                   if target.get(field) is None or not str(target[field]).strip()]
+        if missing:
+            raise ValueError(f"{method} 缺少配置: {', '.join(missing)}")
+        normalized[method] = {field: str(target[field]).strip() for field in CHANNEL_FIELDS[method]}
+    return normalized
 
-def push(content, method):
-    """统一推送接口，支持 PushPlus、Telegram 和 WxPusher"""
-    notifier = PushNotification()
 
+def default_target(method):
+    """config.py中配置的全局接收方"""
     if method == "pushplus":
-        token = PUSHPLUS_TOKEN
-        return notifier.push_pushplus(content, token)
+        return {'token': PUSHPLUS_TOKEN}
     elif method == "telegram":
-        bot_token = TELEGRAM_BOT_TOKEN
-        chat_id = TELEGRAM_CHAT_ID
-        return notifier.push_telegram(content, bot_token, chat_id)
+        return {'bot_token': TELEGRAM_BOT_TOKEN, 'chat_id': TELEGRAM_CHAT_ID}
     elif method == "wxpusher":
-        return notifier.push_wxpusher(content, WXPUSHER_SPT)
-    else:
-        raise ValueError("❌ 无效的通知渠道，请选择 'pushplus'、'telegram' 或 'wxpusher'")
+        return {'spt': WXPUSHER_SPT}
+    raise ValueError("❌ 无效的通知渠道，请选择 'pushplus'、'telegram' 或 'wxpusher'")
+
+
+notifier = PushNotification()
+dispatcher = PushDispatcher(notifier.send)
+atexit.register(dispatcher.close)
+
+
+"""外部调用"""
+
+
+def push(content, method, target=None):
+    """统一推送接口，支持 PushPlus、Telegram 和 WxPusher
+
+    只把通知放入后台发送队列，不等待发送结果；同一渠道同一接收方的通知按窗口合并发送。
+    """
+    target = target or default_target(method)
+    return dispatcher.enqueue(method, content, target)
+
+
+def notify(channels, content):
+    """把一条通知发送到一个用户配置的所有渠道，channels为record.notify_channels"""
+    if isinstance(channels, str):
+        channels = json.loads(channels)
+    return [push(content, method, target) for method, target in (channels or {}).items()]
@@ -0,0 +1,221 @@
+# push_queue.py 推送通知的后台发送队列：按渠道与接收方合并通知，失败的消息持久化在push_outbox表中按计划重试
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from config import PUSH_CONFIG
+from db_pool import get_db_connection
+from metrics import PUSH_DELIVERIES
+
+logger = logging.getLogger(__name__)
+
+INSERT_SQL = """
+    INSERT INTO push_outbox (channel, target, content, items, next_attempt_at)
+    VALUES (%s, %s, %s, %s, NOW())
+"""
+
+
+def build_digest(contents, max_items=None, max_chars=None):
+    """把同一窗口内的多条通知合并为一条消息，超出条数或长度时截断并注明省略的条数"""
+    max_items = max_items or PUSH_CONFIG['DIGEST_MAX_ITEMS']
+    max_chars = max_chars or PUSH_CONFIG['DIGEST_MAX_CHARS']
+    if len(contents) == 1:
+        return contents[0][:max_chars]
+
+    header = f"共{len(contents)}条通知"
+    parts = []
+    length = len(header)
+    for content in contents[:max_items]:
+        if length + len(content) + 2 > max_chars:
+            break
+        parts.append(content)
+        length += len(content) + 2
+    omitted = len(contents) - len(parts)
+    footer = [f"……另有{omitted}条未显示"] if omitted else []
+    return '\n\n'.join([header, *parts, *footer])
+
+
+class PushDispatcher:
+    """推送通知的后台发送器
+
+    调用方只把通知放入内存队列。后台线程每DIGEST_WINDOW秒把同一渠道、同一接收方的通知合并成一条消息写入
+    push_outbox表，再按next_attempt_at领取到期的消息发送；发送失败的消息推迟后重试，进程重启后继续。
+    领取使用SELECT ... FOR UPDATE SKIP LOCKED并把next_attempt_at推后CLAIM_LEASE秒，多个进程不会重复发送。
+    领取到的消息由WORKERS个线程并发发送，一个慢渠道或慢接收方不会拖住其他消息。
+    """
+
+    def __init__(self, sender, queue_size=None, digest_window=None, poll_interval=None, batch_size=None,
+                 max_attempts=None, workers=None):
+        self.sender = sender  # sender(channel, content, target)，成功返回True
+        self.digest_window = digest_window or PUSH_CONFIG['DIGEST_WINDOW']
+        self.poll_interval = poll_interval or PUSH_CONFIG['POLL_INTERVAL']
+        self.batch_size = batch_size or PUSH_CONFIG['BATCH_SIZE']
+        self.max_attempts = max_attempts or PUSH_CONFIG['MAX_ATTEMPTS']
+        self._executor = ThreadPoolExecutor(max_workers=workers or PUSH_CONFIG['WORKERS'],
+                                            thread_name_prefix='push-sender')
+        self._queue = queue.Queue(maxsize=queue_size or PUSH_CONFIG['QUEUE_SIZE'])
+        self._digests = OrderedDict()  # (channel, target JSON) -> [content]
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'enqueued': 0, 'dropped': 0, 'digests': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='push-dispatcher', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, channel, content, target):
+        """非阻塞地提交一条通知，缓冲区已满时返回False"""
+        self.start()
+        try:
+            self._queue.put_nowait((channel, content, target))
+            self.stats['enqueued'] += 1
+            return True
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+
+    def _run(self):
+        digest_at = time.monotonic() + self.digest_window
+        poll_at = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                channel, content, target = self._queue.get(
+                    timeout=max(0.0, min(digest_at, poll_at) - time.monotonic()))
+                key = (channel, json.dumps(target, sort_keys=True))
+                self._digests.setdefault(key, []).append(content)
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            if now >= digest_at:
+                if self._flush_digests():
+                    # 新写入的消息立即发送，不等下一次轮询
+                    poll_at = now
+                digest_at = now + self.digest_window
+            if now >= poll_at:
+                # 领满一批时可能还有到期的消息，立即继续
+                if self._dispatch_due() < self.batch_size:
+                    poll_at = time.monotonic() + self.poll_interval
+
+        # 退出前把尚未合并的通知写入push_outbox，由下次启动的进程发送
+        while not self._queue.empty():
+            channel, content, target = self._queue.get_nowait()
+            self._digests.setdefault((channel, json.dumps(target, sort_keys=True)), []).append(content)
+        self._flush_digests()
+
+    def _flush_digests(self):
+        """把合并后的消息写入push_outbox，返回写入的条数"""
+        if not self._digests:
+            return 0
+        rows = [(channel, target, build_digest(contents), len(contents))
+                for (channel, target), contents in self._digests.items()]
+        self._digests.clear()
+        self.stats['digests'] += len(rows)
+        try:
+            with get_db_connection() as connection, connection.cursor() as cursor:
+                cursor.executemany(INSERT_SQL, rows)
+                connection.commit()
+            return len(rows)
+        except Exception as e:
+            # 无法持久化时直接尝试发送一次，失败则丢弃
+            logger.error(f"Error writing {len(rows)} push messages to the outbox: {str(e)}")
+            list(self._executor.map(lambda row: self._deliver(row[0], row[2], json.loads(row[1])), rows))
+            return 0
+
+    def claim(self, limit):
+        """领取到期的消息，返回[(push_id, channel, content, target, attempts)]"""
+        with get_db_connection() as connection, connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT push_id, channel, target, content, attempts FROM push_outbox
+                WHERE status = 'pending' AND next_attempt_at <= NOW()
+                ORDER BY next_attempt_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (limit,))
+            rows = cursor.fetchall()
+            if rows:
+                placeholders = ', '.join(['%s'] * len(rows))
+                cursor.execute(f"""
+                    UPDATE push_outbox SET next_attempt_at = NOW() + INTERVAL %s SECOND
+                    WHERE push_id IN ({placeholders})
+                """, (PUSH_CONFIG['CLAIM_LEASE'], *[row['push_id'] for row in rows]))
+            connection.commit()
+        return [(row['push_id'], row['channel'], row['content'], json.loads(row['target'] or '{}'), row['attempts'])
+                for row in rows]
+
+    def _dispatch_due(self):
+        """并发发送一批到期的消息，返回领取的条数"""
+        try:
+            claimed = self.claim(self.batch_size)
+        except Exception as e:
+            logger.error(f"Error claiming push messages: {str(e)}")
+            return 0
+
+        errors = self._executor.map(lambda row: self._deliver(row[1], row[2], row[3]), claimed)
+        results = [(row[0], row[4] + 1, error) for row, error in zip(claimed, errors)]
+        if results:
+            self._record(results)
+        return len(claimed)
+
+    def _deliver(self, channel, content, target):
+        """发送一条消息，成功返回None，失败返回错误描述"""
+        try:
+            error = None if self.sender(channel, content, target) else 'delivery failed'
+        except Exception as e:
+            error = str(e)[:255]
+        PUSH_DELIVERIES.labels(channel, 'failure' if error else 'success').inc()
+        if not error:
+            # 多个发送线程同时更新计数
+            with self._lock:
+                self.stats['sent'] += 1
+        return error
+
+    def _record(self, results):
+        try:
+            with get_db_connection() as connection, connection.cursor() as cursor:
+                for push_id, attempts, error in results:
+                    if error is None:
+                        cursor.execute("""
+                            UPDATE push_outbox SET status = 'sent', attempts = %s, sent_at = NOW()
+                            WHERE push_id = %s
+                        """, (attempts, push_id))
+                    elif attempts >= self.max_attempts:
+                        self.stats['failed'] += 1
+                        logger.error(f"Push message {push_id} failed after {attempts} attempts: {error}")
+                        cursor.execute("""
+                            UPDATE push_outbox SET status = 'failed', attempts = %s, last_error = %s
+                            WHERE push_id = %s
+                        """, (attempts, error, push_id))
+                    else:
+                        self.stats['retried'] += 1
+                        delay = random.randint(PUSH_CONFIG['RETRY_MIN'], PUSH_CONFIG['RETRY_MAX'])
+                        logger.info(f"Push message {push_id} will be retried in {delay} seconds")
+                        cursor.execute("""
+                            UPDATE push_outbox
+                            SET attempts = %s, last_error = %s, next_attempt_at = NOW() + INTERVAL %s SECOND
+                            WHERE push_id = %s
+                        """, (attempts, error, delay, push_id))
+                connection.commit()
+        except Exception as e:
+            # 未记录结果的消息在CLAIM_LEASE秒后会被重新领取
+            logger.error(f"Error recording push results: {str(e)}")
+
+    def snapshot(self):
+        return {**self.stats, 'pending': self._queue.qsize() + sum(len(c) for c in list(self._digests.values()))}
+
+    def close(self, timeout=10):
+        """把缓冲中的通知写入push_outbox后停止后台线程"""
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
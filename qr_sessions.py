@@ -0,0 +1,104 @@
+# qr_sessions.py 二维码登录会话状态，状态变化通过每个会话自己的条件变量通知等待者
+import threading
+import time
+
+from metrics import QRCODE_SESSIONS, QRCODE_STAGE_SECONDS
+
+# 到达这些状态后会话不会再变化
+TERMINAL_STATUSES = ('completed', 'error', 'timeout', 'cancelled')
+
+
+class QRSessionStore:
+    """线程安全的会话状态表
+
+    登录线程通过update修改状态，版本号随之递增并唤醒在该会话上等待的请求；
+    读取方使用wait_for_change按版本号长轮询，不需要sleep轮询。
+    已结束的会话保留ttl_seconds秒；浏览器任务卡住或客户端离开而一直未结束的会话，
+    超过stale_seconds秒没有更新时同样清理（默认为ttl_seconds的两倍）。
+    """
+
+    def __init__(self, ttl_seconds=600, stale_seconds=None):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds or ttl_seconds * 2
+        self._states = {}
+        self._conditions = {}
+        self._lock = threading.Lock()
+
+    def create(self, session_id, **fields):
+        self._purge_expired()
+        state = {
+            'status': 'initializing',
+            'qrcode': None,
+            'error': None,
+            'headers': None,
+            'cookies': None,
+            'success': False,
+            'version': 0,
+            'updated_at': time.time(),
+            'status_since': time.time(),
+        }
+        state.update(fields)
+        with self._lock:
+            self._states[session_id] = state
+            self._conditions[session_id] = threading.Condition()
+        return dict(state)
+
+    def __contains__(self, session_id):
+        return session_id in self._states
+
+    def __getitem__(self, session_id):
+        return self._states[session_id]
+
+    def get(self, session_id):
+        """返回会话状态的快照，不存在时返回None"""
+        condition = self._conditions.get(session_id)
+        if condition is None:
+            return None
+        with condition:
+            return dict(self._states[session_id])
+
+    def update(self, session_id, **fields):
+        """修改会话状态并通知所有等待者，会话已被清理时忽略
+
+        状态变化时记录上一个状态持续的时间，作为登录流程各阶段的耗时。
+        """
+        condition = self._conditions.get(session_id)
+        if condition is None:
+            return
+        with condition:
+            state = self._states[session_id]
+            now = time.time()
+            previous = state['status']
+            if fields.get('status', previous) != previous and previous not in TERMINAL_STATUSES:
+                QRCODE_STAGE_SECONDS.labels(previous).observe(now - state['status_since'])
+                state['status_since'] = now
+                if fields['status'] in TERMINAL_STATUSES:
+                    QRCODE_SESSIONS.labels(fields['status']).inc()
+            state.update(fields)
+            state['version'] += 1
+            state['updated_at'] = now
+            condition.notify_all()
+
+    def wait_for_change(self, session_id, since_version, timeout):
+        """等待会话版本号超过since_version或进入终止状态，超时返回当前快照"""
+        condition = self._conditions.get(session_id)
+        if condition is None:
+            return None
+        with condition:
+            state = self._states[session_id]
+            condition.wait_for(
+                lambda: state['version'] > since_version or state['status'] in TERMINAL_STATUSES,
+                timeout=timeout
+            )
+            return dict(state)
+
+    def _purge_expired(self):
+        """清理已结束且超过保留时间的会话，以及长时间没有更新的未结束会话"""
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, state in self._states.items()
+                       if state['updated_at'] < now - (self.ttl_seconds if state['status'] in TERMINAL_STATUSES
+                                                       else self.stale_seconds)]
+            for sid in expired:
+                self._states.pop(sid, None)
+                self._conditions.pop(sid, None)
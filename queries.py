@@ -0,0 +1,120 @@
+# queries.py 热点查询语句：业务代码与migrations.py的执行计划检查共用同一份SQL，修改查询后检查随之生效
+
+# 持久化任务表，与APScheduler默认表名一致
+JOBSTORE_TABLE = 'apscheduler_jobs'
+
+# app.py reconcile_scheduled_tasks：按(updated_at, authorization_code)键集分页扫描变更的配置
+RECONCILE_RECORDS_SQL = """
+    SELECT authorization_code, run_time_config, is_active, updated_at
+    FROM record
+    WHERE (updated_at, authorization_code) > (%s, %s)
+    ORDER BY updated_at, authorization_code
+    LIMIT %s
+"""
+
+# app.py get_scheduled_tasks：任务列表的ETag版本，不执行分页查询
+RECORD_VERSION_SQL = "SELECT COUNT(*) AS records, MAX(updated_at) AS updated FROM record {scope}"
+
+JOBS_VERSION_SQL = f"""
+    SELECT COUNT(*) AS jobs, COALESCE(SUM(next_run_time), 0) AS next_runs
+    FROM {JOBSTORE_TABLE}
+    WHERE id LIKE 'wxread\\_%%' {{scope}}
+"""
+
+# app.py get_scheduled_tasks：一页任务，多取一条用于判断是否还有下一页
+TASKS_PAGE_SQL = """
+    SELECT r.authorization_code, r.run_time_config, r.single_read_time_seconds,
+           r.created_at, r.is_active, r.last_validated_at, {next_run_column}
+    FROM record r
+    {join}
+    {where}
+    ORDER BY r.authorization_code
+    LIMIT %s
+"""
+
+
+def tasks_page_query(limit, use_jobstore_table, auth_code=None, status='all', after_code=None,
+                     next_run_after=None, next_run_before=None, codes=None):
+    """构造任务列表的分页查询，返回(语句, 参数)
+
+    next_run_after、next_run_before为时间戳，只在使用MySQL任务存储时作为条件；
+    codes为内存任务存储中已按时间窗口筛出的授权码。
+    """
+    conditions, params = [], []
+    if auth_code is not None:
+        conditions.append("r.authorization_code = %s")
+        params.append(auth_code)
+    if status != 'all':
+        conditions.append("r.is_active = %s")
+        params.append(status == 'active')
+    if after_code:
+        conditions.append("r.authorization_code > %s")
+        params.append(after_code)
+    if use_jobstore_table:
+        if next_run_after is not None:
+            conditions.append("j.next_run_time >= %s")
+            params.append(next_run_after)
+        if next_run_before is not None:
+            conditions.append("j.next_run_time < %s")
+            params.append(next_run_before)
+    if codes is not None:
+        conditions.append(f"r.authorization_code IN ({', '.join(['%s'] * len(codes)) or 'NULL'})")
+        params.extend(codes)
+
+    query = TASKS_PAGE_SQL.format(
+        next_run_column="j.next_run_time" if use_jobstore_table else "NULL AS next_run_time",
+        join=(f"LEFT JOIN {JOBSTORE_TABLE} j ON j.id = CONCAT('wxread_', r.authorization_code)"
+              if use_jobstore_table else ""),
+        where=f"WHERE {' AND '.join(conditions)}" if conditions else "",
+    )
+    return query, (*params, limit)
+
+
+# runs.py start_execution_log：当天被中断的执行记录
+RESUME_EXECUTION_LOG_SQL = """
+    SELECT log_id, success_count FROM execution_log
+    WHERE authorization_code = %s AND status = 'running' AND start_time >= CURDATE()
+    ORDER BY log_id DESC
+    LIMIT 1
+    FOR UPDATE
+"""
+
+# app.py resume_interrupted_runs：启动时恢复当天被中断的任务
+INTERRUPTED_RUNS_SQL = """
+    SELECT DISTINCT authorization_code FROM execution_log
+    WHERE status = 'running' AND start_time >= CURDATE()
+"""
+
+# db_init.py：补充授权码前统计未使用的数量
+UNUSED_AUTHORIZATION_CODES_SQL = "SELECT COUNT(*) AS available FROM authorization_codes WHERE is_used = FALSE"
+
+# retention.py purge_rows：按时间分批删除
+PURGE_ROWS_SQL = """
+    DELETE FROM {table}
+    WHERE {column} < %s {condition}
+    ORDER BY {column}
+    LIMIT %s
+"""
+
+# 仍在执行的记录保存着检查点，不删除
+EXECUTION_LOG_PURGE_CONDITION = "AND status <> 'running'"
+
+# retention.py daily_history：水位线之前读汇总表，之后从execution_log按天统计
+DAILY_SUMMARY_SQL = """
+    SELECT run_date, runs, successes, failures, read_count, first_start_time, last_end_time
+    FROM execution_daily_summary
+    WHERE authorization_code = %s AND run_date >= %s AND run_date < %s
+    ORDER BY run_date
+"""
+
+DAILY_LIVE_SQL = """
+    SELECT DATE(start_time) AS run_date, COUNT(*) AS runs,
+           SUM(status = 'success') AS successes,
+           SUM(status IN ('failure', 'invalid_credentials')) AS failures,
+           COALESCE(SUM(success_count), 0) AS read_count,
+           MIN(start_time) AS first_start_time, MAX(end_time) AS last_end_time
+    FROM execution_log
+    WHERE authorization_code = %s AND start_time >= %s
+    GROUP BY DATE(start_time)
+    ORDER BY run_date
+"""
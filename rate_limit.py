@@ -0,0 +1,135 @@
+# rate_limit.py 访问微信读书的进程级速率限制：每个接口一个令牌桶，可通过MySQL在多个进程间分配总额度
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+
+from config import RATE_LIMIT_CONFIG
+from db_pool import get_db_connection
+from metrics import RATE_LIMIT_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 接口名 -> 配置项前缀
+ENDPOINTS = {
+    'read': 'READ',
+    'renewal': 'RENEWAL',
+    'user_info': 'USER_INFO',
+}
+
+
+class TokenBucket:
+    """线程安全的令牌桶
+
+    reserve()立即预留一个令牌并返回需要等待的秒数，同步与异步调用方各自负责等待，
+    因此等待期间不持有锁，等待者按预留顺序依次放行。
+    """
+
+    def __init__(self, rate, burst):
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def set_rate(self, rate, burst):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+            self.burst = max(1, burst)
+            self._tokens = min(self._tokens, self.burst)
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class RateLimiter:
+    """按接口划分的令牌桶集合，额度来自RATE_LIMIT_CONFIG"""
+
+    def __init__(self):
+        self.buckets = {
+            endpoint: TokenBucket(RATE_LIMIT_CONFIG[f'{prefix}_RATE'], RATE_LIMIT_CONFIG[f'{prefix}_BURST'])
+            for endpoint, prefix in ENDPOINTS.items()
+        }
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.nodes = 1
+        self._coordinator = None
+
+    def acquire(self, endpoint):
+        """阻塞直到可以向该接口发送一个请求"""
+        delay = self.buckets[endpoint].reserve()
+        RATE_LIMIT_WAIT_SECONDS.labels(endpoint).observe(delay)
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self, endpoint):
+        """acquire的协程版本，等待期间不占用事件循环"""
+        delay = self.buckets[endpoint].reserve()
+        RATE_LIMIT_WAIT_SECONDS.labels(endpoint).observe(delay)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def start_coordination(self):
+        """COORDINATION为mysql时，定期在rate_limit_nodes表登记本进程并按存活进程数平分总额度"""
+        if RATE_LIMIT_CONFIG['COORDINATION'] != 'mysql' or self._coordinator:
+            return
+        self.sync()
+        self._coordinator = threading.Thread(target=self._coordinate, name='rate-limit-coordinator', daemon=True)
+        self._coordinator.start()
+
+    def _coordinate(self):
+        while True:
+            time.sleep(RATE_LIMIT_CONFIG['SYNC_INTERVAL'])
+            self.sync()
+
+    def sync(self):
+        """登记心跳、统计最近仍有心跳的进程数，并调整各令牌桶的速率"""
+        # 超过三个同步周期没有心跳的进程视为已退出
+        expiry = RATE_LIMIT_CONFIG['SYNC_INTERVAL'] * 3
+        try:
+            with get_db_connection() as connection, connection.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO rate_limit_nodes (node_id, heartbeat_at) VALUES (%s, NOW())
+                    ON DUPLICATE KEY UPDATE heartbeat_at = NOW()
+                """, (self.node_id,))
+                cursor.execute(
+                    "DELETE FROM rate_limit_nodes WHERE heartbeat_at < NOW() - INTERVAL %s SECOND",
+                    (expiry * 10,)
+                )
+                cursor.execute("""
+                    SELECT COUNT(*) AS nodes FROM rate_limit_nodes
+                    WHERE heartbeat_at >= NOW() - INTERVAL %s SECOND
+                """, (expiry,))
+                nodes = max(1, cursor.fetchone()['nodes'])
+                connection.commit()
+        except Exception as e:
+            logger.error(f"Error syncing rate limit budget: {str(e)}")
+            return
+
+        if nodes != self.nodes:
+            logger.info(f"Rate limit budget shared by {nodes} processes")
+        self.nodes = nodes
+        for endpoint, prefix in ENDPOINTS.items():
+            self.buckets[endpoint].set_rate(
+                RATE_LIMIT_CONFIG[f'{prefix}_RATE'] / nodes,
+                max(1, RATE_LIMIT_CONFIG[f'{prefix}_BURST'] // nodes)
+            )
+
+    def snapshot(self):
+        return {'nodes': self.nodes,
+                **{f'{endpoint}_rate': bucket.rate for endpoint, bucket in self.buckets.items()}}
+
+
+limiter = RateLimiter()
@@ -0,0 +1,268 @@
+# reader_engine.py 异步阅读引擎：在单个事件循环中以协程驱动所有用户的阅读任务
+import asyncio
+import json
+import logging
+import threading
+import time
+
+import aiohttp
+
+from config import data, READER_CONFIG, WXREAD_CONFIG
+from http_client import parse_credentials
+from metrics import READ_REQUEST_SECONDS, READ_RUNS, SKEY_RENEWAL_SECONDS, SKEY_RENEWALS
+from main import KEY, COOKIE_DATA, READ_URL, RENEW_URL
+from rate_limit import limiter
+from signing import ReadSigner
+from skey_renewal import SkeyRenewalManager
+
+logger = logging.getLogger(__name__)
+
+# 模板中不变字段的编码结果只计算一次
+signer = ReadSigner(data, KEY)
+
+
+def build_read_payload():
+    """构造一次阅读请求的数据，每次请求都重新签名"""
+    return signer.payload()
+
+
+class ReadingEngine:
+    """异步阅读引擎
+
+    引擎在一个后台线程中运行独立的事件循环，每个阅读任务只是循环中的一个协程，
+    等待30秒的阅读间隔时不占用任何线程，因此单个进程可以同时承载成千上万个阅读会话。
+    """
+
+    def __init__(self, max_connections=None, read_interval=None, request_timeout=None):
+        self.max_connections = max_connections or READER_CONFIG['MAX_CONNECTIONS']
+        self.read_interval = read_interval if read_interval is not None else READER_CONFIG['READ_INTERVAL_SECONDS']
+        self.request_timeout = request_timeout or READER_CONFIG['REQUEST_TIMEOUT']
+        self.checkpoint_every = READER_CONFIG['CHECKPOINT_EVERY']
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._started = threading.Event()
+        self._lock = threading.Lock()
+        self.active_runs = 0
+        self.renewals = SkeyRenewalManager()
+
+    def start(self):
+        """启动事件循环线程（重复调用无副作用）"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._started.clear()
+            self._thread = threading.Thread(target=self._run_loop, name='reading-engine', daemon=True)
+            self._thread.start()
+        self._started.wait()
+        logger.info("Reading engine started")
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._open_session())
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.run_until_complete(self._session.close())
+            self._loop.close()
+
+    async def _open_session(self):
+        # 共享连接池，cookie由每次请求的Cookie头显式携带，避免不同用户之间串号
+        connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300, keepalive_timeout=75)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            cookie_jar=aiohttp.DummyCookieJar(),
+            timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+        )
+
+    def stop(self):
+        """停止事件循环，正在进行的阅读任务会被取消"""
+        if self._loop and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+            logger.info("Reading engine stopped")
+
+    def snapshot(self):
+        """返回正在进行的阅读任务数与连接上限"""
+        return {'active_runs': self.active_runs, 'max_connections': self.max_connections}
+
+    def submit(self, credentials, read_count=1, start_count=0, on_progress=None,
+               skey_renewed_at=None, on_renewed=None):
+        """提交阅读任务，立即返回concurrent.futures.Future，结果为bool"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(
+            self.run_reading(credentials, read_count, start_count, on_progress, skey_renewed_at, on_renewed),
+            self._loop
+        )
+
+    async def run_reading(self, credentials, read_count=1, start_count=0, on_progress=None,
+                          skey_renewed_at=None, on_renewed=None):
+        """执行阅读任务的协程版本，语义与main.execute_reading一致
+
+        start_count为已完成的阅读次数，用于从检查点恢复；
+        on_progress(success_count)每完成checkpoint_every次阅读在线程池中调用一次，用于保存检查点。
+        skey_renewed_at为凭证中wr_skey的刷新时间（时间戳），超过有效期时在阅读前主动刷新；
+        刷新得到新密钥后on_renewed(skey)在线程池中调用一次，用于写回存储。
+        """
+        self.active_runs += 1
+        outcome = 'failure'
+        try:
+            headers, cookies = parse_credentials(credentials)
+            if not headers or not cookies:
+                logger.error("凭证信息不完整")
+                return False
+
+            # 同一账号的其他阅读任务已经刷新过密钥时直接使用
+            account = cookies.get('wr_vid')
+            latest = self.renewals.latest(account, newer_than=skey_renewed_at) if account else None
+            if latest and latest[0] != cookies.get('wr_skey'):
+                cookies['wr_skey'], skey_renewed_at = latest
+
+            success_count = start_count
+            renewed = False
+            # 主动刷新失败后本次任务不再主动刷新，只在阅读失败时刷新，避免每次阅读前都请求一次刷新接口
+            proactive_failed = False
+            while success_count < read_count:
+                if not renewed and not proactive_failed and self.renewals.is_stale(skey_renewed_at):
+                    logger.info("密钥即将过期，阅读前主动刷新")
+                    entry = await self.renewals.renew(
+                        account, skey_renewed_at, lambda: self.renew_skey(headers, cookies), on_renewed, proactive=True
+                    )
+                    if entry:
+                        cookies['wr_skey'], skey_renewed_at = entry
+                        renewed = True
+                    else:
+                        proactive_failed = True
+
+                logger.info("⏱️ 尝试第 %d/%d 次阅读...", success_count + 1, read_count)
+                status, res_data = await self._read(headers, cookies)
+                if status != 200:
+                    logger.error(f"❌ 请求失败，状态码：{status}")
+                    return False
+
+                if 'succ' in res_data:
+                    success_count += 1
+                    renewed = False
+                    logger.info("✅ 阅读成功，阅读进度：%d/%d", success_count, read_count)
+                    if on_progress and success_count % self.checkpoint_every == 0:
+                        await self._checkpoint(on_progress, success_count)
+                    if success_count < read_count:
+                        await asyncio.sleep(self.read_interval)
+                    continue
+
+                # 连续两次需要刷新说明密钥已失效，不再重试
+                if renewed:
+                    logger.error("❌ 刷新密钥后仍阅读失败，终止阅读")
+                    return False
+                logger.warning("❌ 阅读失败，尝试刷新cookie...")
+                entry = await self.renewals.renew(
+                    account, skey_renewed_at, lambda: self.renew_skey(headers, cookies), on_renewed
+                )
+                if not entry:
+                    logger.error("❌ 无法获取新密钥，终止阅读")
+                    return False
+                cookies['wr_skey'], skey_renewed_at = entry
+                renewed = True
+                logger.info("✅ 密钥刷新成功")
+
+            outcome = 'success'
+            return True
+
+        except asyncio.CancelledError:
+            outcome = 'cancelled'
+            raise
+        except Exception as e:
+            outcome = 'error'
+            logger.error(f"执行阅读任务失败: {str(e)}")
+            return False
+        finally:
+            self.active_runs -= 1
+            READ_RUNS.labels(outcome).inc()
+
+    async def _read(self, headers, cookies):
+        """发送一次阅读请求，按结果（succ、failure、http_error、error）记录耗时"""
+        await limiter.acquire_async('read')
+        started = time.monotonic()
+        outcome = 'error'
+        try:
+            status, res_data = await self._post(READ_URL, headers, cookies, build_read_payload())
+            if status != 200:
+                outcome = 'http_error'
+            else:
+                outcome = 'succ' if 'succ' in res_data else 'failure'
+            return status, res_data
+        finally:
+            READ_REQUEST_SECONDS.labels(outcome).observe(time.monotonic() - started)
+
+    async def _checkpoint(self, on_progress, success_count):
+        """在线程池中执行检查点回调，失败不影响阅读"""
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, on_progress, success_count)
+        except Exception as e:
+            logger.error(f"保存阅读检查点失败: {str(e)}")
+
+    async def renew_skey(self, headers, cookies):
+        """刷新wr_skey，返回新密钥或None"""
+        await limiter.acquire_async('renewal')
+        started = time.monotonic()
+        outcome = 'failure'
+        try:
+            async with self._session.post(
+                RENEW_URL,
+                headers=self._with_cookie(headers, cookies),
+                data=json.dumps(COOKIE_DATA, separators=(',', ':')),
+            ) as response:
+                for cookie in response.headers.getall('Set-Cookie', []):
+                    for part in cookie.split(';'):
+                        if 'wr_skey' in part:
+                            outcome = 'success'
+                            return part.split('=')[-1][:8]
+            return None
+        except Exception as e:
+            outcome = 'error'
+            logger.error(f"刷新密钥失败: {str(e)}")
+            return None
+        finally:
+            SKEY_RENEWALS.labels(outcome).inc()
+            SKEY_RENEWAL_SECONDS.observe(time.monotonic() - started)
+
+    async def _post(self, url, headers, cookies, body):
+        async with self._session.post(url, headers=self._with_cookie(headers, cookies), data=body) as response:
+            # 服务端下发的cookie自动更新到本次阅读使用的cookies中
+            for name, morsel in response.cookies.items():
+                cookies[name] = morsel.value
+            if response.status != 200:
+                return response.status, None
+            return response.status, await response.json(content_type=None)
+
+    def prewarm(self, count):
+        """提前建立count个到微信读书的keep-alive连接（DNS解析与TLS握手），返回Future"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self._prewarm(count), self._loop)
+
+    async def _prewarm(self, count):
+        async def touch():
+            try:
+                async with self._session.head(WXREAD_CONFIG['BASE_URL']) as response:
+                    await response.read()
+            except Exception as e:
+                logger.warning(f"Prewarm request failed: {str(e)}")
+
+        await asyncio.gather(*(touch() for _ in range(min(count, self.max_connections))))
+        logger.info(f"Prewarmed {min(count, self.max_connections)} upstream connections")
+
+    @staticmethod
+    def _with_cookie(headers, cookies):
+        merged = dict(headers)
+        merged['cookie'] = '; '.join(f"{k}={v}" for k, v in cookies.items())
+        return merged
+
+
+engine = ReadingEngine()
+
+
+def execute_reading(credentials, read_count=1):
+    """与main.execute_reading签名一致的同步入口，阻塞直到阅读结束"""
+    return engine.submit(credentials, read_count).result()
@@ -0,0 +1,94 @@
+# record_cache.py record表的进程内读穿缓存（LRU + TTL），写入配置时显式失效
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from config import RECORD_CACHE_CONFIG
+from db_pool import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+
+class RecordCache:
+    """按授权码缓存record行
+
+    未命中或过期时从MySQL读取并缓存；修改record的代码路径需要调用invalidate。
+    不存在的授权码不缓存，新建配置后可以立即读到。
+    每个授权码有一个失效代数，读取期间发生invalidate或clear时不缓存读到的行，避免旧数据在失效后被写回。
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size or RECORD_CACHE_CONFIG['MAX_SIZE']
+        self.ttl = ttl if ttl is not None else RECORD_CACHE_CONFIG['TTL']
+        self._rows = OrderedDict()  # auth_code -> (row, expires_at)
+        self._generations = {}  # auth_code -> invalidate的次数
+        self._epoch = 0  # clear的次数
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0, 'stale_loads': 0}
+
+    def get(self, authorization_code):
+        """返回record行的副本，不存在时返回None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._rows.get(authorization_code)
+            if entry is not None:
+                row, expires_at = entry
+                if expires_at > now:
+                    self._rows.move_to_end(authorization_code)
+                    self.stats['hits'] += 1
+                    return dict(row)
+                del self._rows[authorization_code]
+                self.stats['expired'] += 1
+            self.stats['misses'] += 1
+            generation = self._generation(authorization_code)
+
+        row = self._load(authorization_code)
+        if row is not None:
+            self.put(authorization_code, row, generation)
+            return dict(row)
+        return None
+
+    def _generation(self, authorization_code):
+        return self._epoch, self._generations.get(authorization_code, 0)
+
+    def put(self, authorization_code, row, generation=None):
+        """缓存一行；generation为读取前的失效代数，读取期间已失效时不缓存"""
+        with self._lock:
+            if generation is not None and generation != self._generation(authorization_code):
+                self.stats['stale_loads'] += 1
+                return
+            self._rows[authorization_code] = (row, time.monotonic() + self.ttl)
+            self._rows.move_to_end(authorization_code)
+            while len(self._rows) > self.max_size:
+                self._rows.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, authorization_code):
+        with self._lock:
+            # 未缓存时也增加代数：可能有读取正在进行
+            self._generations[authorization_code] = self._generations.get(authorization_code, 0) + 1
+            if self._rows.pop(authorization_code, None) is not None:
+                self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+    def snapshot(self):
+        """返回命中率等统计信息"""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(self.stats, size=len(self._rows), max_size=self.max_size,
+                        hit_ratio=self.stats['hits'] / lookups if lookups else 0.0)
+
+    @staticmethod
+    def _load(authorization_code):
+        with get_db_connection() as connection, connection.cursor() as cursor:
+            cursor.execute("SELECT * FROM record WHERE authorization_code = %s", (authorization_code,))
+            return cursor.fetchone()
+
+
+record_cache = RecordCache()
@@ -0,0 +1,238 @@
+# retention.py 历史数据保留：execution_log先按天汇总再分批删除，system_log分批删除或按天分区后删除过期分区
+#
+#   python retention.py                         执行一次汇总与清理（app.py每天RUN_HOUR点自动执行）
+#   python retention.py --partition-system-log  一次性把system_log改为按天分区（会复制整张表，建议在低峰期执行）
+import argparse
+import logging
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from config import RETENTION_CONFIG
+from db_pool import get_db_connection
+from queries import DAILY_LIVE_SQL, DAILY_SUMMARY_SQL, EXECUTION_LOG_PURGE_CONDITION, PURGE_ROWS_SQL
+
+logger = logging.getLogger(__name__)
+
+# 多个进程同时触发时只有一个执行
+RETENTION_LOCK = 'wxread_retention'
+
+# 已汇总到的日期（不含）在scheduler_state表中的名称
+ROLLUP_WATERMARK = 'execution_rollup_date'
+
+# 分区名：p_history保存分区前的旧数据，p20261018保存该日的数据，p_future接收尚未建分区的日期
+HISTORY_PARTITION = 'p_history'
+FUTURE_PARTITION = 'p_future'
+
+ROLLUP_SQL = """
+    INSERT INTO execution_daily_summary
+    (authorization_code, run_date, runs, successes, failures, read_count, first_start_time, last_end_time)
+    SELECT authorization_code, DATE(start_time), COUNT(*),
+           SUM(status = 'success'), SUM(status IN ('failure', 'invalid_credentials')),
+           COALESCE(SUM(success_count), 0), MIN(start_time), MAX(end_time)
+    FROM execution_log
+    WHERE start_time >= %s AND start_time < %s
+    GROUP BY authorization_code, DATE(start_time)
+    ON DUPLICATE KEY UPDATE
+        runs = VALUES(runs), successes = VALUES(successes), failures = VALUES(failures),
+        read_count = VALUES(read_count), first_start_time = VALUES(first_start_time),
+        last_end_time = VALUES(last_end_time)
+"""
+
+
+def get_rollup_watermark(cursor):
+    cursor.execute("SELECT value FROM scheduler_state WHERE name = %s", (ROLLUP_WATERMARK,))
+    row = cursor.fetchone()
+    if row:
+        return date.fromisoformat(row['value'])
+    cursor.execute("SELECT DATE(MIN(start_time)) AS first_day FROM execution_log")
+    return cursor.fetchone()['first_day']
+
+
+def rollup_execution_log():
+    """把截至昨天的execution_log按授权码与日期汇总到execution_daily_summary，返回已汇总到的日期（不含）
+
+    按天逐条执行，每天一个短事务；从水位线前一天开始重算，覆盖跨零点结束的任务。
+    """
+    today = date.today()
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        watermark = get_rollup_watermark(cursor)
+        connection.commit()
+    if watermark is None:
+        return today
+
+    day = watermark - timedelta(days=1)
+    while day < today:
+        with get_db_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(ROLLUP_SQL, (day, day + timedelta(days=1)))
+            day += timedelta(days=1)
+            cursor.execute("""
+                INSERT INTO scheduler_state (name, value) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE value = VALUES(value)
+            """, (ROLLUP_WATERMARK, day.isoformat()))
+            connection.commit()
+    return day
+
+
+def purge_rows(table, column, cutoff, condition=''):
+    """按column分批删除早于cutoff的行，每批一个短事务并在批次之间暂停，返回删除的行数"""
+    batch_size = RETENTION_CONFIG['BATCH_SIZE']
+    deleted = 0
+    while True:
+        with get_db_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(PURGE_ROWS_SQL.format(table=table, column=column, condition=condition),
+                           (cutoff, batch_size))
+            batch = cursor.rowcount
+            connection.commit()
+        deleted += batch
+        if batch < batch_size:
+            return deleted
+        time.sleep(RETENTION_CONFIG['BATCH_PAUSE'])
+
+
+def system_log_partitions(cursor):
+    """返回system_log的分区名列表，未分区时为空"""
+    cursor.execute("""
+        SELECT PARTITION_NAME AS name FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'system_log' AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """)
+    return [row['name'] for row in cursor.fetchall()]
+
+
+def partition_name(day):
+    return f"p{day:%Y%m%d}"
+
+
+def partition_clause(day):
+    """保存day当天数据的分区定义"""
+    upper = (day + timedelta(days=1)).isoformat()
+    return f"PARTITION {partition_name(day)} VALUES LESS THAN (UNIX_TIMESTAMP('{upper} 00:00:00'))"
+
+
+def partition_system_log():
+    """把system_log改为按created_at每天一个分区
+
+    分区表的每个唯一键都必须包含分区列，因此主键改为(log_id, created_at)。
+    保留期之前的数据放在p_history中，下一次清理时整体删除。
+    """
+    today = date.today()
+    first_day = today - timedelta(days=RETENTION_CONFIG['SYSTEM_LOG_DAYS'] or 1)
+    days = [first_day + timedelta(days=i)
+            for i in range((today - first_day).days + RETENTION_CONFIG['PARTITION_DAYS_AHEAD'] + 1)]
+    partitions = [f"PARTITION {HISTORY_PARTITION} VALUES LESS THAN (UNIX_TIMESTAMP('{first_day} 00:00:00'))",
+                  *[partition_clause(day) for day in days],
+                  f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE"]
+
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        if system_log_partitions(cursor):
+            logger.info("system_log is already partitioned")
+            return False
+        logger.info(f"Partitioning system_log into {len(partitions)} partitions")
+        cursor.execute(f"""
+            ALTER TABLE system_log
+            MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (log_id, created_at)
+            PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) ({', '.join(partitions)})
+        """)
+    return True
+
+
+def maintain_system_log_partitions(cutoff_day):
+    """提前建好未来几天的分区，并删除cutoff_day之前的分区，返回删除的分区名"""
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        partitions = system_log_partitions(cursor)
+        daily = sorted(datetime.strptime(name[1:], '%Y%m%d').date() for name in partitions
+                       if name not in (HISTORY_PARTITION, FUTURE_PARTITION))
+
+        # 从p_future中拆出尚未建立的日期分区
+        last_day = daily[-1] if daily else date.today() - timedelta(days=1)
+        horizon = date.today() + timedelta(days=RETENTION_CONFIG['PARTITION_DAYS_AHEAD'])
+        new_days = [last_day + timedelta(days=i) for i in range(1, (horizon - last_day).days + 1)]
+        if new_days:
+            clauses = [partition_clause(day) for day in new_days]
+            cursor.execute(f"""
+                ALTER TABLE system_log REORGANIZE PARTITION {FUTURE_PARTITION} INTO
+                ({', '.join(clauses)}, PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE)
+            """)
+
+        expired = [partition_name(day) for day in daily if day < cutoff_day]
+        if HISTORY_PARTITION in partitions:
+            expired.insert(0, HISTORY_PARTITION)
+        if expired:
+            cursor.execute(f"ALTER TABLE system_log DROP PARTITION {', '.join(expired)}")
+    return expired
+
+
+def run_retention():
+    """汇总并清理过期的执行日志与系统日志，返回各项处理结果"""
+    result = {}
+    with get_db_connection() as lock_connection, lock_connection.cursor() as lock_cursor:
+        lock_cursor.execute("SELECT GET_LOCK(%s, 0) AS locked", (RETENTION_LOCK,))
+        if not lock_cursor.fetchone()['locked']:
+            logger.info("Retention is already running in another process")
+            return result
+        try:
+            started = time.monotonic()
+            today = date.today()
+
+            # 即使永久保留明细也汇总，历史查询只读汇总表
+            rolled_up_to = rollup_execution_log()
+            if RETENTION_CONFIG['EXECUTION_LOG_DAYS']:
+                # 只删除已经汇总过的日期
+                cutoff = min(today - timedelta(days=RETENTION_CONFIG['EXECUTION_LOG_DAYS']),
+                             rolled_up_to - timedelta(days=1))
+                result['execution_log_rows'] = purge_rows(
+                    'execution_log', 'start_time', cutoff, EXECUTION_LOG_PURGE_CONDITION)
+
+            if RETENTION_CONFIG['SYSTEM_LOG_DAYS']:
+                cutoff = today - timedelta(days=RETENTION_CONFIG['SYSTEM_LOG_DAYS'])
+                with get_db_connection() as connection, connection.cursor() as cursor:
+                    partitioned = bool(system_log_partitions(cursor))
+                if partitioned:
+                    result['system_log_partitions'] = maintain_system_log_partitions(cutoff)
+                else:
+                    result['system_log_rows'] = purge_rows('system_log', 'created_at', cutoff)
+
+            logger.info(f"Retention finished in {time.monotonic() - started:.1f}s: {result}")
+            return result
+        finally:
+            lock_cursor.execute("SELECT RELEASE_LOCK(%s)", (RETENTION_LOCK,))
+            lock_cursor.fetchall()
+
+
+def daily_history(authorization_code, days):
+    """最近days天每天的执行汇总
+
+    汇总水位线之前的日期读execution_daily_summary；水位线及之后的日期（今天，以及汇总任务没有按时执行时的
+    前几天）尚未汇总，直接从execution_log按天统计。
+    """
+    first_day = date.today() - timedelta(days=days)
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        watermark = get_rollup_watermark(cursor) or date.today()
+        live_from = max(watermark, first_day)
+        cursor.execute(DAILY_SUMMARY_SQL, (authorization_code, first_day, live_from))
+        rows = cursor.fetchall()
+        cursor.execute(DAILY_LIVE_SQL, (authorization_code, live_from))
+        rows.extend(cursor.fetchall())
+        connection.commit()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll up and purge old execution_log and system_log rows")
+    parser.add_argument('--partition-system-log', action='store_true',
+                        help="convert system_log to daily partitions (copies the table once)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.partition_system_log:
+        partition_system_log()
+        return 0
+    print(run_retention())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,246 @@
+# run_queue.py 多节点执行阅读任务：调度器把到期任务写入run_queue表，worker节点按租约领取
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import Future
+
+from config import RUN_QUEUE_CONFIG
+from db_pool import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_run(authorization_code):
+    """distributed模式下调度器的任务入口：写入一条待领取的任务
+
+    多个app进程共享同一个任务存储时同一任务可能被触发多次，
+    锁住record行后检查去重窗口内是否已经入队，保证只写入一次。
+    """
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT authorization_code FROM record WHERE authorization_code = %s FOR UPDATE",
+            (authorization_code,)
+        )
+        if cursor.fetchone() is None:
+            connection.rollback()
+            logger.error(f"未找到配置，跳过入队: {authorization_code}")
+            return False
+
+        cursor.execute("""
+            SELECT run_id FROM run_queue
+            WHERE authorization_code = %s AND scheduled_at > NOW() - INTERVAL %s SECOND
+            LIMIT 1
+            FOR UPDATE
+        """, (authorization_code, RUN_QUEUE_CONFIG['DEDUP_WINDOW']))
+        if cursor.fetchone() is not None:
+            connection.rollback()
+            logger.info(f"Run for {authorization_code} is already queued, skipping")
+            return False
+
+        cursor.execute(
+            "INSERT INTO run_queue (authorization_code, scheduled_at, status) VALUES (%s, NOW(), 'pending')",
+            (authorization_code,)
+        )
+        connection.commit()
+        return True
+
+
+class RunQueueWorker:
+    """从run_queue表领取任务并执行的worker
+
+    领取使用SELECT ... FOR UPDATE SKIP LOCKED，多个节点并发领取时互不阻塞也不会重复领取。
+    持有的任务定期续约；节点崩溃后租约过期，任务由其他节点接管，
+    阅读进度从execution_log的检查点继续。所有时间以MySQL服务器时间为准。
+    """
+
+    def __init__(self, runner, node_id=None, capacity=None, lease_seconds=None,
+                 heartbeat_interval=None, poll_interval=None, claim_batch_size=None, max_attempts=None):
+        self.runner = runner  # runner(authorization_code)，可以返回Future
+        self.node_id = node_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.capacity = capacity or RUN_QUEUE_CONFIG['CAPACITY']
+        self.lease_seconds = lease_seconds or RUN_QUEUE_CONFIG['LEASE_SECONDS']
+        self.heartbeat_interval = heartbeat_interval or RUN_QUEUE_CONFIG['HEARTBEAT_INTERVAL']
+        self.poll_interval = poll_interval or RUN_QUEUE_CONFIG['POLL_INTERVAL']
+        self.claim_batch_size = claim_batch_size or RUN_QUEUE_CONFIG['CLAIM_BATCH_SIZE']
+        self.max_attempts = max_attempts or RUN_QUEUE_CONFIG['MAX_ATTEMPTS']
+        self._held = {}  # run_id -> Future或None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._threads = []
+        self.stats = {'claimed': 0, 'takeovers': 0, 'done': 0, 'failed': 0, 'lost': 0}
+
+    def start(self):
+        if self._threads:
+            return
+        for target, name in ((self._claim_loop, 'run-queue-claim'), (self._heartbeat_loop, 'run-queue-heartbeat')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Run queue worker {self.node_id} started, capacity {self.capacity}")
+
+    def stop(self, timeout=10):
+        """停止领取，取消正在执行的任务并释放租约，其他节点可以立即接管"""
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        with self._lock:
+            futures = [future for future in self._held.values() if future is not None]
+        for future in futures:
+            future.cancel()
+        self.release()
+        logger.info(f"Run queue worker {self.node_id} stopped")
+
+    def claim(self, limit):
+        """领取最多limit个到期或租约已过期的任务，返回[(run_id, authorization_code, attempts, takeover)]
+
+        takeover表示任务的上一个租约已过期，即接管了崩溃节点上的任务。
+        """
+        with get_db_connection() as connection, connection.cursor() as cursor:
+            # 多次接管仍未完成的任务不再重试
+            cursor.execute("""
+                UPDATE run_queue SET status = 'failed', finished_at = NOW()
+                WHERE status = 'claimed' AND lease_expires_at < NOW() AND attempts >= %s
+            """, (self.max_attempts,))
+
+            cursor.execute("""
+                SELECT run_id, authorization_code, attempts, status FROM run_queue
+                WHERE status = 'pending'
+                   OR (status = 'claimed' AND lease_expires_at < NOW())
+                ORDER BY scheduled_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (limit,))
+            rows = cursor.fetchall()
+            if rows:
+                placeholders = ', '.join(['%s'] * len(rows))
+                cursor.execute(f"""
+                    UPDATE run_queue
+                    SET status = 'claimed', owner = %s, attempts = attempts + 1,
+                        claimed_at = NOW(), lease_expires_at = NOW() + INTERVAL %s SECOND
+                    WHERE run_id IN ({placeholders})
+                """, (self.node_id, self.lease_seconds, *[row['run_id'] for row in rows]))
+            connection.commit()
+        return [(row['run_id'], row['authorization_code'], row['attempts'], row['status'] == 'claimed')
+                for row in rows]
+
+    def _claim_loop(self):
+        while not self._stopping.is_set():
+            try:
+                with self._lock:
+                    free = self.capacity - len(self._held)
+                claimed = self.claim(min(free, self.claim_batch_size)) if free > 0 else []
+                for run_id, authorization_code, attempts, takeover in claimed:
+                    self._start(run_id, authorization_code, attempts, takeover)
+            except Exception as e:
+                logger.error(f"Error claiming runs: {str(e)}", exc_info=True)
+                claimed = []
+            # 队列中可能还有更多任务时立即继续领取
+            if len(claimed) < self.claim_batch_size:
+                self._stopping.wait(self.poll_interval)
+
+    def _start(self, run_id, authorization_code, attempts, takeover=False):
+        self.stats['claimed'] += 1
+        if takeover:
+            self.stats['takeovers'] += 1
+            logger.info(f"Taking over run {run_id} for {authorization_code} (attempt {attempts + 1})")
+        with self._lock:
+            self._held[run_id] = None
+
+        try:
+            result = self.runner(authorization_code)
+        except Exception as e:
+            logger.error(f"Run {run_id} for {authorization_code} failed to start: {str(e)}", exc_info=True)
+            self._finish(run_id, False)
+            return
+
+        if isinstance(result, Future):
+            with self._lock:
+                if run_id in self._held:
+                    self._held[run_id] = result
+            result.add_done_callback(lambda future: self._on_done(run_id, future))
+        else:
+            # 配置不存在或已停用，没有需要执行的阅读
+            self._finish(run_id, True)
+
+    def _on_done(self, run_id, future):
+        if future.cancelled():
+            # 租约丢失或节点停止，任务留给接管的节点
+            with self._lock:
+                self._held.pop(run_id, None)
+            return
+        self._finish(run_id, future.exception() is None and bool(future.result()))
+
+    def _finish(self, run_id, success):
+        with self._lock:
+            self._held.pop(run_id, None)
+        self.stats['done' if success else 'failed'] += 1
+        try:
+            with get_db_connection() as connection, connection.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE run_queue SET status = %s, finished_at = NOW(), lease_expires_at = NULL
+                    WHERE run_id = %s AND owner = %s
+                """, ('done' if success else 'failed', run_id, self.node_id))
+                connection.commit()
+        except Exception as e:
+            logger.error(f"Error finishing run {run_id}: {str(e)}", exc_info=True)
+
+    def _heartbeat_loop(self):
+        while not self._stopping.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.error(f"Error renewing run leases: {str(e)}", exc_info=True)
+
+    def heartbeat(self):
+        """续约持有的任务；已被其他节点接管的任务在本节点取消"""
+        with self._lock:
+            run_ids = list(self._held)
+        if not run_ids:
+            return
+
+        placeholders = ', '.join(['%s'] * len(run_ids))
+        with get_db_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(f"""
+                UPDATE run_queue SET lease_expires_at = NOW() + INTERVAL %s SECOND
+                WHERE owner = %s AND status = 'claimed' AND run_id IN ({placeholders})
+            """, (self.lease_seconds, self.node_id, *run_ids))
+            cursor.execute(f"""
+                SELECT run_id FROM run_queue
+                WHERE owner = %s AND status = 'claimed' AND run_id IN ({placeholders})
+            """, (self.node_id, *run_ids))
+            owned = {row['run_id'] for row in cursor.fetchall()}
+            connection.commit()
+
+        for run_id in set(run_ids) - owned:
+            with self._lock:
+                future = self._held.pop(run_id, None)
+            if future is not None:
+                self.stats['lost'] += 1
+                logger.warning(f"Lease for run {run_id} was lost, cancelling local execution")
+                future.cancel()
+
+    def release(self):
+        """把本节点仍持有的任务放回队列
+
+        正常停止时放回的任务不计入尝试次数，滚动重启不会让任务达到MAX_ATTEMPTS而失败。
+        """
+        try:
+            with get_db_connection() as connection, connection.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE run_queue
+                    SET status = 'pending', owner = NULL, lease_expires_at = NULL,
+                        attempts = GREATEST(attempts - 1, 0)
+                    WHERE owner = %s AND status = 'claimed'
+                """, (self.node_id,))
+                released = cursor.rowcount
+                connection.commit()
+            if released:
+                logger.info(f"Released {released} runs back to the queue")
+        except Exception as e:
+            logger.error(f"Error releasing runs: {str(e)}", exc_info=True)
+
+    def snapshot(self):
+        """返回本节点持有的任务数与累计计数"""
+        with self._lock:
+            return dict(self.stats, node_id=self.node_id, held=len(self._held), capacity=self.capacity)
@@ -0,0 +1,168 @@
+# runs.py 单次阅读任务的执行：读取配置、写执行日志与检查点，提交给异步阅读引擎
+import json
+import logging
+
+from db_pool import get_db_connection
+from http_client import parse_credentials
+from push import notify
+from queries import RESUME_EXECUTION_LOG_SQL
+from reader_engine import engine as reading_engine
+from record_cache import record_cache
+
+logger = logging.getLogger(__name__)
+
+
+def task_wrapper(authorization_code):
+    """定时任务包装函数
+
+    阅读任务提交给异步阅读引擎后立即返回，不再在调度线程中阻塞整个阅读时长。
+    执行期间只在保存检查点时短暂借用数据库连接；当天被中断（进程退出、重新部署）
+    的执行记录会从检查点继续，而不是重新开始。
+    """
+    try:
+        logger.info(f"Executing scheduled task for authorization code: {authorization_code}")
+
+        # 获取配置信息（读穿缓存）
+        config = record_cache.get(authorization_code)
+        if not config or not config['is_active']:
+            logger.error(f"未找到有效的配置: {authorization_code}")
+            return
+
+        read_count = config['single_read_time_seconds'] // 30  # 每30秒一次阅读
+        log_id, start_count = start_execution_log(authorization_code, read_count)
+        if start_count:
+            logger.info(f"Resuming run {log_id} for {authorization_code} from checkpoint {start_count}/{read_count}")
+
+        # 执行阅读任务
+        renewed_at = config.get('skey_renewed_at')
+        future = reading_engine.submit(
+            json.loads(config['credentials']),
+            read_count=read_count,
+            start_count=start_count,
+            on_progress=lambda success_count: save_checkpoint(log_id, success_count),
+            skey_renewed_at=renewed_at.timestamp() if renewed_at else None,
+            on_renewed=lambda skey: save_renewed_skey(authorization_code, skey)
+        )
+        future.add_done_callback(lambda f: finish_execution_log(authorization_code, log_id, read_count, f))
+        return future
+
+    except Exception as e:
+        logger.error(f"定时任务执行失败: {str(e)}")
+
+
+def start_execution_log(authorization_code, read_count):
+    """返回(log_id, 已完成次数)：当天有被中断的执行记录时沿用它，否则新建一条"""
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(RESUME_EXECUTION_LOG_SQL, (authorization_code,))
+        interrupted = cursor.fetchone()
+
+        if interrupted:
+            cursor.execute("""
+                UPDATE execution_log SET read_count = %s, checkpoint_at = CURRENT_TIMESTAMP
+                WHERE log_id = %s
+            """, (read_count, interrupted['log_id']))
+            connection.commit()
+            return interrupted['log_id'], min(interrupted['success_count'], read_count)
+
+        # 创建执行日志
+        cursor.execute("""
+            INSERT INTO execution_log 
+            (authorization_code, start_time, status, read_count, success_count)
+            VALUES (%s, CURRENT_TIMESTAMP, 'running', %s, 0)
+        """, (authorization_code, read_count))
+        log_id = cursor.lastrowid
+        connection.commit()
+        return log_id, 0
+
+
+def save_checkpoint(log_id, success_count):
+    """在一个短事务中保存阅读进度"""
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE execution_log
+            SET success_count = %s, checkpoint_at = CURRENT_TIMESTAMP
+            WHERE log_id = %s
+        """, (success_count, log_id))
+        connection.commit()
+
+
+def save_renewed_skey(authorization_code, skey):
+    """把刷新后的wr_skey写回record.credentials，下次执行直接使用新密钥
+
+    cookies统一保存为JSON字典，其中的值优先于请求头里旧的Cookie；
+    显式保留updated_at，避免密钥刷新触发定时任务的重新同步。
+    """
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT credentials FROM record WHERE authorization_code = %s FOR UPDATE",
+            (authorization_code,)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            connection.rollback()
+            return
+
+        credentials = json.loads(row['credentials'])
+        _, cookies = parse_credentials(credentials)
+        cookies['wr_skey'] = skey
+        credentials['cookies'] = json.dumps(cookies)
+        cursor.execute("""
+            UPDATE record
+            SET credentials = %s, skey_renewed_at = CURRENT_TIMESTAMP, updated_at = updated_at
+            WHERE authorization_code = %s
+        """, (json.dumps(credentials), authorization_code))
+        connection.commit()
+    record_cache.invalidate(authorization_code)
+
+
+def finish_execution_log(authorization_code, log_id, read_count, future):
+    """阅读任务结束后更新执行日志，并把结果推送给用户"""
+    if future.cancelled():
+        # 引擎停止时任务被取消，保留running状态，重启后从检查点继续
+        logger.info(f"Run {log_id} was interrupted, keeping checkpoint for resume")
+        return
+
+    try:
+        error = future.exception()
+        success = future.result() if error is None else False
+        if error is not None:
+            logger.error(f"执行任务失败: {str(error)}")
+
+        with get_db_connection() as connection, connection.cursor() as cursor:
+            cursor.execute("""
+                UPDATE execution_log 
+                SET end_time = CURRENT_TIMESTAMP,
+                    status = %s,
+                    details = %s,
+                    success_count = IF(%s, %s, success_count)
+                WHERE log_id = %s
+            """, (
+                'success' if success else 'failure',
+                str(error) if error else ('阅读任务执行成功' if success else '阅读任务执行失败'),
+                success,
+                read_count,
+                log_id
+            ))
+            connection.commit()
+
+    except Exception as e:
+        logger.error(f"更新执行日志失败: {str(e)}")
+        return
+
+    notify_run_finished(authorization_code, success, read_count, error)
+
+
+def notify_run_finished(authorization_code, success, read_count, error=None):
+    """按record.notify_channels把阅读任务的结果推送到用户的所有渠道，只入队不等待发送"""
+    try:
+        config = record_cache.get(authorization_code)
+        channels = config and config.get('notify_channels')
+        if not channels:
+            return
+        if success:
+            content = f"✅ 微信读书阅读完成（{authorization_code}）：共阅读{read_count}次，约{read_count // 2}分钟"
+        else:
+            content = f"❌ 微信读书阅读失败（{authorization_code}）：{error or '阅读任务执行失败'}"
+        notify(channels, content)
+    except Exception as e:
+        logger.error(f"推送阅读结果失败: {str(e)}")
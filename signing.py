@@ -0,0 +1,107 @@
+# signing.py 阅读请求的快速签名：缓存模板中不变字段的编码结果，只重新编码变化的字段
+import hashlib
+import json
+import random
+import time
+import urllib.parse
+from functools import lru_cache, reduce
+from operator import lshift, xor
+
+# 每次请求都会变化的字段
+VARIABLE_KEYS = ('ct', 'ts', 'rn', 'sg')
+
+_HASH_SEED = 0x15051505
+_HASH_MASK = 0x7fffffff
+
+
+@lru_cache(maxsize=64)
+def _shift_tables(length):
+    """cal_hash中与位置相关的移位量只取决于字符串长度，按长度缓存"""
+    positions = range(length - 1, 0, -2)
+    return (
+        tuple((length - i) % 30 for i in positions),
+        tuple(i % 30 for i in positions),
+    )
+
+
+def fast_cal_hash(input_string):
+    """与main.cal_hash结果一致的快速实现
+
+    掩码对异或满足分配律，因此可以把逐步掩码推迟到最后一次完成，
+    剩下的移位与异或交给map/reduce在C层执行。
+    """
+    length = len(input_string)
+    try:
+        codes = input_string.encode('ascii')
+    except UnicodeEncodeError:
+        codes = [ord(ch) for ch in input_string]
+
+    if length < 2:
+        return hex(_HASH_SEED * 2)[2:]
+
+    shifts_a, shifts_b = _shift_tables(length)
+    hash_a = reduce(xor, map(lshift, codes[length - 1:0:-2], shifts_a), _HASH_SEED) & _HASH_MASK
+    hash_b = reduce(xor, map(lshift, codes[length - 2::-2], shifts_b), _HASH_SEED) & _HASH_MASK
+    return hex(hash_a + hash_b)[2:]
+
+
+class ReadSigner:
+    """按config.data模板生成带签名的阅读请求体
+
+    模板中不变字段的排序、百分号编码以及JSON序列化结果在初始化时计算一次，
+    每次签名只填入ct、ts、rn、sg和s。
+    """
+
+    def __init__(self, template, key):
+        self.template = dict(template)
+        self.key = key
+        for name in VARIABLE_KEYS:
+            self.template.setdefault(name, 0)
+
+        # encode_data的结果：按键排序后拼接的 k=v 片段
+        encoded = []
+        for name in sorted(self.template):
+            if name in VARIABLE_KEYS:
+                encoded.append(f"{name}={{{name}}}")
+            else:
+                value = urllib.parse.quote(str(self.template[name]), safe='')
+                encoded.append(f"{name}={value}".replace('{', '{{').replace('}', '}}'))
+        self._encoded_template = '&'.join(encoded)
+
+        # json.dumps(request_data, separators=(',', ':'))的结果，字段顺序与模板一致，最后追加s
+        fields = []
+        for name in self.template:
+            if name in VARIABLE_KEYS:
+                fields.append(f"{json.dumps(name)}:{{{name}}}")
+            else:
+                fields.append(f"{json.dumps(name)}:{json.dumps(self.template[name])}"
+                              .replace('{', '{{').replace('}', '}}'))
+        fields.append('"s":"{s}"')
+        self._json_template = '{{' + ','.join(fields) + '}}'
+
+    def fields(self, ct=None, ts=None, rn=None):
+        """生成一组变化字段，参数为空时与main.execute_reading的取值方式一致"""
+        now = time.time()
+        ct = int(now) if ct is None else ct
+        ts = int(now * 1000) if ts is None else ts
+        rn = random.randint(0, 1000) if rn is None else rn
+        sg = hashlib.sha256(f"{ts}{rn}{self.key}".encode()).hexdigest()
+        return {'ct': ct, 'ts': ts, 'rn': rn, 'sg': sg}
+
+    def encode(self, values):
+        """与encode_data(request_data)结果一致"""
+        return self._encoded_template.format(**values)
+
+    def sign(self, ct=None, ts=None, rn=None):
+        """返回(变化字段, s签名)"""
+        values = self.fields(ct, ts, rn)
+        return values, fast_cal_hash(self.encode(values))
+
+    def payload(self, ct=None, ts=None, rn=None):
+        """返回可直接发送的JSON请求体"""
+        values, signature = self.sign(ct, ts, rn)
+        # sg是十六进制字符串，在JSON中需要引号
+        return self._json_template.format(
+            ct=values['ct'], ts=values['ts'], rn=values['rn'],
+            sg=json.dumps(values['sg']), s=signature
+        )
@@ -0,0 +1,88 @@
+# skey_renewal.py wr_skey刷新管理：同一账号的并发刷新合并为一次上游请求，并记住最新的密钥
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from config import READER_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class SkeyRenewalManager:
+    """按账号（wr_vid）管理wr_skey的刷新
+
+    只在阅读引擎的事件循环中使用，不需要加锁：
+    - 同一账号正在刷新时，其他阅读任务等待同一个结果，不再重复请求上游；
+    - 其他任务已经拿到更新的密钥时直接复用；
+    - 密钥刷新后超过max_age秒视为即将过期，由调用方在阅读前主动刷新。
+    """
+
+    def __init__(self, max_age=None, cache_size=None):
+        self.max_age = max_age or READER_CONFIG['SKEY_MAX_AGE']
+        self.cache_size = cache_size or READER_CONFIG['SKEY_CACHE_SIZE']
+        self._latest = OrderedDict()  # account -> (skey, renewed_at)
+        self._inflight = {}  # account -> asyncio.Task
+        self.stats = {'renewals': 0, 'failures': 0, 'coalesced': 0, 'reused': 0, 'proactive': 0}
+
+    def is_stale(self, renewed_at):
+        """密钥刷新时间未知时不主动刷新，由阅读失败触发"""
+        return renewed_at is not None and time.time() - renewed_at >= self.max_age
+
+    def latest(self, account, newer_than=None):
+        """返回该账号比newer_than更新的(skey, renewed_at)，没有时返回None"""
+        entry = self._latest.get(account)
+        if entry is None or (newer_than is not None and entry[1] <= newer_than):
+            return None
+        self._latest.move_to_end(account)
+        return entry
+
+    async def renew(self, account, renewed_at, renew_fn, on_renewed=None, proactive=False):
+        """刷新账号的密钥，返回(skey, renewed_at)或None
+
+        renewed_at为调用方当前密钥的刷新时间；已有更新的密钥时直接返回它。
+        renew_fn()是真正请求上游的协程，on_renewed(skey)在线程池中执行，用于写回存储。
+        """
+        if account is None:
+            return await self._renew(None, renew_fn, on_renewed)
+
+        entry = self.latest(account, newer_than=renewed_at if renewed_at is not None else 0)
+        if entry is not None:
+            self.stats['reused'] += 1
+            return entry
+
+        task = self._inflight.get(account)
+        if task is None:
+            if proactive:
+                self.stats['proactive'] += 1
+            task = asyncio.ensure_future(self._renew(account, renew_fn, on_renewed))
+            self._inflight[account] = task
+            task.add_done_callback(lambda _: self._inflight.pop(account, None))
+        else:
+            self.stats['coalesced'] += 1
+        # 发起刷新的任务被取消时，其他等待者仍然能拿到结果
+        return await asyncio.shield(task)
+
+    async def _renew(self, account, renew_fn, on_renewed):
+        skey = await renew_fn()
+        if not skey:
+            self.stats['failures'] += 1
+            return None
+
+        self.stats['renewals'] += 1
+        entry = (skey, time.time())
+        if account is not None:
+            self._latest[account] = entry
+            self._latest.move_to_end(account)
+            while len(self._latest) > self.cache_size:
+                self._latest.popitem(last=False)
+
+        if on_renewed:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, on_renewed, skey)
+            except Exception as e:
+                logger.error(f"保存刷新后的密钥失败: {str(e)}")
+        return entry
+
+    def snapshot(self):
+        return dict(self.stats, cached_accounts=len(self._latest), inflight=len(self._inflight))
@@ -0,0 +1,93 @@
+# system_log.py system_log表的后台批量写入器
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+
+from config import SYSTEM_LOG_CONFIG
+from db_pool import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+INSERT_SQL = """
+    INSERT INTO system_log
+    (level, message, context)
+    VALUES (%s, %s, %s)
+"""
+
+
+class SystemLogWriter:
+    """缓冲system_log事件并在后台线程中批量提交
+
+    攒够batch_size条或距上次写入超过flush_interval秒时用executemany一次写入；
+    队列写满时直接丢弃新事件并计数，请求线程永远不会等待MySQL。
+    """
+
+    def __init__(self, queue_size=None, batch_size=None, flush_interval=None):
+        self.batch_size = batch_size or SYSTEM_LOG_CONFIG['BATCH_SIZE']
+        self.flush_interval = flush_interval or SYSTEM_LOG_CONFIG['FLUSH_INTERVAL']
+        self._queue = queue.Queue(maxsize=queue_size or SYSTEM_LOG_CONFIG['QUEUE_SIZE'])
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'enqueued': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'failed': 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='system-log-writer', daemon=True)
+            self._thread.start()
+
+    def write(self, level, message, context=None):
+        """非阻塞地记录一条事件，缓冲区已满时返回False"""
+        self.start()
+        row = (level, message, json.dumps(context) if context else None)
+        try:
+            self._queue.put_nowait(row)
+            self.stats['enqueued'] += 1
+            return True
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while not self._stop.is_set() or not self._queue.empty():
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+        self._flush(batch)
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            with get_db_connection() as connection, connection.cursor() as cursor:
+                cursor.executemany(INSERT_SQL, batch)
+                connection.commit()
+            self.stats['written'] += len(batch)
+            self.stats['batches'] += 1
+        except Exception as e:
+            self.stats['failed'] += len(batch)
+            logger.error(f"Error writing {len(batch)} system events: {str(e)}")
+
+    def close(self, timeout=10):
+        """写完缓冲区中剩余的事件后停止后台线程"""
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+
+
+writer = SystemLogWriter()
+atexit.register(writer.close)
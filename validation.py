@@ -0,0 +1,150 @@
+# validation.py 凭证验证：结果按凭证缓存，配置请求中的验证以后台任务执行
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from config import VALIDATION_CONFIG, WXREAD_CONFIG
+from log_setup import TRACE
+from rate_limit import limiter
+from http_client import client as http_client, credentials_key, parse_credentials
+from reader_engine import engine as reading_engine
+
+logger = logging.getLogger(__name__)
+
+# 验证凭证使用的用户信息接口
+WXREAD_USER_INFO_URL = f"{WXREAD_CONFIG['BASE_URL']}/web/user/info"
+
+
+def fetch_user_info(credentials):
+    """请求用户信息接口，返回(是否有效, 用户信息)"""
+    headers, cookies = parse_credentials(credentials)
+    if not headers or not cookies:
+        logger.error("Invalid credentials: missing headers or cookies")
+        return False, None
+
+    limiter.acquire('user_info')
+    response = http_client.get({'headers': headers, 'cookies': cookies}, WXREAD_USER_INFO_URL, timeout=10)
+    logger.info(f"User info response status: {response.status_code}")
+    logger.log(TRACE, "User info response: %s", response.text)
+    if response.status_code != 200:
+        return False, None
+    try:
+        profile = response.json()
+    except ValueError:
+        profile = None
+    # 接口在登录失效时也可能返回200，此时带有errcode
+    if isinstance(profile, dict) and profile.get('errcode'):
+        return False, None
+    return True, profile
+
+
+class ValidationCache:
+    """按规范化凭证的哈希缓存验证结果"""
+
+    def __init__(self, ttl=None, failure_ttl=None, max_size=None):
+        self.ttl = ttl or VALIDATION_CONFIG['CACHE_TTL']
+        self.failure_ttl = failure_ttl or VALIDATION_CONFIG['FAILURE_CACHE_TTL']
+        self.max_size = max_size or VALIDATION_CONFIG['CACHE_MAX_SIZE']
+        self._results = OrderedDict()  # key -> (result, expires_at)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._results.get(key)
+            if entry and entry[1] > time.monotonic():
+                self._results.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[0]
+            self._results.pop(key, None)
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, key, result):
+        ttl = self.ttl if result['valid'] else self.failure_ttl
+        with self._lock:
+            self._results[key] = (result, time.monotonic() + ttl)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+
+validation_cache = ValidationCache()
+
+
+def validate_credentials(credentials, read_check=False):
+    """验证凭证，返回{'valid': bool, 'user_info': dict或None}
+
+    read_check为True时还会执行一次真实的阅读请求（不等待阅读间隔）。
+    相同凭证在缓存有效期内直接返回上次的结果。
+    """
+    key = f"{credentials_key(credentials)}:{int(read_check)}"
+    cached = validation_cache.get(key)
+    if cached is not None:
+        logger.info("Using cached credentials validation result")
+        return cached
+
+    try:
+        valid, user_info = fetch_user_info(credentials)
+        if valid and read_check:
+            valid = reading_engine.submit(credentials, read_count=1).result()
+    except Exception as e:
+        logger.error(f"Error validating credentials: {str(e)}", exc_info=True)
+        # 网络异常不缓存，下次重新验证
+        return {'valid': False, 'user_info': None}
+
+    result = {'valid': valid, 'user_info': user_info}
+    validation_cache.put(key, result)
+    return result
+
+
+class BackgroundJobs:
+    """在线程池中执行的后台任务，按任务ID查询状态"""
+
+    def __init__(self, workers=None, job_ttl=None):
+        self.job_ttl = job_ttl or VALIDATION_CONFIG['JOB_TTL']
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or VALIDATION_CONFIG['WORKERS'],
+            thread_name_prefix='validation'
+        )
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """提交任务并返回任务ID；fn的返回值作为结果，抛出的异常信息作为错误"""
+        self._purge_expired()
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._jobs[job_id] = {'status': 'pending', 'result': None, 'error': None, 'updated_at': time.time()}
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._update(job_id, status='running')
+        try:
+            self._update(job_id, status='succeeded', result=fn(*args, **kwargs))
+        except Exception as e:
+            logger.error(f"Background job {job_id} failed: {str(e)}")
+            self._update(job_id, status='failed', error=str(e))
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields, updated_at=time.time())
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _purge_expired(self):
+        deadline = time.time() - self.job_ttl
+        with self._lock:
+            for job_id in [j for j, job in self._jobs.items()
+                           if job['status'] in ('succeeded', 'failed') and job['updated_at'] < deadline]:
+                del self._jobs[job_id]
+
+
+setup_jobs = BackgroundJobs()
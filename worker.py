@@ -0,0 +1,74 @@
+# worker.py 阅读任务worker节点：从run_queue表按租约领取任务并执行
+#
+# 配合SCHEDULER_MODE=distributed使用：app.py只负责调度与入队，
+# 可以在多台主机上启动任意数量的worker.py共同消费同一个MySQL中的任务。
+import argparse
+import logging
+import os
+import signal
+import threading
+
+from prometheus_client import start_http_server
+
+from config import RUN_QUEUE_CONFIG
+from db_pool import pool as db_pool
+from log_setup import configure_logging
+from metrics import register_snapshot
+from push import dispatcher as push_dispatcher
+from rate_limit import limiter as rate_limiter
+from reader_engine import engine as reading_engine
+from run_queue import RunQueueWorker
+from runs import task_wrapper
+
+configure_logging(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'worker.log'))
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Claim and execute reading runs from the run queue")
+    parser.add_argument('--node-id', help="worker identity stored as the lease owner (default: hostname:pid)")
+    parser.add_argument('--capacity', type=int, default=RUN_QUEUE_CONFIG['CAPACITY'],
+                        help="maximum number of runs this node holds at once")
+    parser.add_argument('--metrics-port', type=int, default=RUN_QUEUE_CONFIG['METRICS_PORT'],
+                        help="port for the Prometheus metrics endpoint, 0 to disable")
+    args = parser.parse_args()
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    reading_engine.start()
+    rate_limiter.start_coordination()
+    push_dispatcher.start()
+    worker = RunQueueWorker(task_wrapper, node_id=args.node_id, capacity=args.capacity)
+    worker.start()
+
+    if args.metrics_port:
+        register_snapshot('wxread_db_pool', db_pool.snapshot,
+                          gauges=('in_use', 'idle', 'max_size'),
+                          counters=('created', 'borrowed', 'waited', 'timeouts', 'health_check_failures'))
+        register_snapshot('wxread_reading_engine', reading_engine.snapshot, gauges=('active_runs',))
+        register_snapshot('wxread_rate_limit', rate_limiter.snapshot,
+                          gauges=('nodes', 'read_rate', 'renewal_rate', 'user_info_rate'))
+        register_snapshot('wxread_skey_renewal', reading_engine.renewals.snapshot,
+                          gauges=('cached_accounts', 'inflight'),
+                          counters=('renewals', 'failures', 'coalesced', 'reused', 'proactive'))
+        register_snapshot('wxread_push', push_dispatcher.snapshot,
+                          gauges=('pending',),
+                          counters=('enqueued', 'dropped', 'digests', 'sent', 'retried', 'failed'))
+        register_snapshot('wxread_run_queue_worker', worker.snapshot,
+                          gauges=('held', 'capacity'),
+                          counters=('claimed', 'takeovers', 'done', 'failed', 'lost'))
+        start_http_server(args.metrics_port)
+        logger.info(f"Serving metrics on port {args.metrics_port}")
+
+    while not stopping.wait(60):
+        logger.info(f"Run queue worker status: {worker.snapshot()}")
+
+    # 先取消本地任务并释放租约，其他节点从检查点接管
+    worker.stop()
+    reading_engine.stop()
+
+
+if __name__ == '__main__':
+    main()